@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""BindAI: protein-ligand binding prediction.
+
+Public functions are re-exported here but their submodules are imported on
+first access. `import bindai` therefore stays cheap, and TensorFlow, RDKit
+and Bio.PDB are only loaded by the code that uses them.
+"""
+
+import importlib
+
+__version__ = '0.1.0'
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    'augment_atoms': 'augmentation',
+    'RotationBank': 'augmentation',
+    'compare_results': 'benchmarks',
+    'run_suite': 'benchmarks',
+    'fingerprint_library': 'fingerprint_pipeline',
+    'read_shards': 'fingerprint_pipeline',
+    'fetch_chembl_smiles': 'compound_sources',
+    'fetch_smiles_from_pubchem': 'compound_sources',
+    'DatasetManifest': 'dataset_manifest',
+    'encode_fasta': 'fasta',
+    'iter_fasta': 'fasta',
+    'FingerprintStore': 'fingerprint_store',
+    'generate_fingerprint': 'fingerprint_store',
+    'packed_fingerprint': 'fingerprint_store',
+    'unpack_fingerprints': 'fingerprint_store',
+    'build_cnn_with_drug_input': 'models',
+    'build_sequence_model': 'models',
+    'read_atoms': 'pdb_reader',
+    'ResponseCache': 'http_cache',
+    'NCBIFetcher': 'ncbi',
+    'fetch_gene_sequences': 'ncbi',
+    'fetch_sequences': 'ncbi',
+    'PocketScanner': 'pocket_scan',
+    'QuantizedScreen': 'quantize',
+    'export_tflite': 'quantize',
+    'TwoTowerScreen': 'screening',
+    'predict_interaction': 'screening',
+    'split_model': 'screening',
+    'bucket_batches': 'sequences',
+    'encode_sequences': 'sequences',
+    'iter_encoded_batches': 'sequences',
+    'preprocess_smiles': 'sequences',
+    'sequence_to_voxel_grid': 'sequences',
+    'serve': 'serving',
+    'SparseVoxelStore': 'sparse_voxels',
+    'SimilarityIndex': 'similarity',
+    'TopKHits': 'streaming_screen',
+    'screen_library': 'streaming_screen',
+    'write_hits': 'streaming_screen',
+    'StructureCache': 'structure_cache',
+    'fetch_protein_atoms': 'structure_cache',
+    'fetch_protein_data': 'structure_cache',
+    'span': 'tracing',
+    'traced': 'tracing',
+    'make_dataset': 'training_records',
+    'write_records': 'training_records',
+    'CropVoxelizer': 'voxelizer',
+    'voxelize_atoms': 'voxelizer',
+    'voxelize_batch': 'voxelizer',
+    'voxelize_protein': 'voxelizer',
+    'ProteinVoxelDataset': 'voxel_dataset',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    # Cache on the package so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
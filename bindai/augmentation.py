@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""On-the-fly rotation/translation augmentation for Conv3D training.
+
+Random SO(3) rotations and translations are applied to atom coordinates
+between the PDB reader and the voxelizer, so one stored orientation per
+protein is enough. Rotations for a whole batch come from a bank of
+precomputed matrices, so augmentation adds little to voxelization cost.
+"""
+
+import time
+
+import numpy as np
+
+from .voxelizer import synthetic_atoms, voxelize_batch
+
+
+# Function to draw uniformly distributed rotation matrices from random unit quaternions
+def random_rotations(n, rng=None):
+    rng = np.random.default_rng(rng)
+    # Shoemake's method: uniform quaternions from three uniform variates
+    u1, u2, u3 = rng.random((3, n))
+    q = np.stack([
+        np.sqrt(1 - u1) * np.sin(2 * np.pi * u2),
+        np.sqrt(1 - u1) * np.cos(2 * np.pi * u2),
+        np.sqrt(u1) * np.sin(2 * np.pi * u3),
+        np.sqrt(u1) * np.cos(2 * np.pi * u3),
+    ], axis=1)
+    x, y, z, w = q.T
+    rotations = np.empty((n, 3, 3), dtype=np.float32)
+    rotations[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    rotations[:, 0, 1] = 2 * (x * y - z * w)
+    rotations[:, 0, 2] = 2 * (x * z + y * w)
+    rotations[:, 1, 0] = 2 * (x * y + z * w)
+    rotations[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    rotations[:, 1, 2] = 2 * (y * z - x * w)
+    rotations[:, 2, 0] = 2 * (x * z - y * w)
+    rotations[:, 2, 1] = 2 * (y * z + x * w)
+    rotations[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return rotations
+
+
+class RotationBank:
+    # Precomputed pool of random rotations; sampling from it costs only an index draw
+    def __init__(self, size=10_000, seed=None):
+        self.rotations = random_rotations(size, seed)
+
+    def sample(self, n, rng=None):
+        rng = np.random.default_rng(rng)
+        return self.rotations[rng.integers(0, len(self.rotations), size=n)]
+
+
+# Function to rotate and translate a batch of atom tables.
+# Each structure is rotated about its centre (centroid by default) and shifted by a
+# uniform random translation of up to max_translation Angstrom per axis. All random
+# draws for the batch happen at once; each structure is then one (atoms x 3) @ (3 x 3)
+# BLAS call, which measured faster than gathering a rotation per atom.
+def augment_atoms(atom_tables, rng=None, centers=None, max_translation=2.0, bank=None):
+    rng = np.random.default_rng(rng)
+    n = len(atom_tables)
+    if n == 0:
+        return []
+
+    rotations = bank.sample(n, rng) if bank is not None else random_rotations(n, rng)
+    translations = rng.uniform(-max_translation, max_translation, size=(n, 3)).astype(np.float32)
+
+    augmented = []
+    for i, atoms in enumerate(atom_tables):
+        coords = np.asarray(atoms['coords'], dtype=np.float32).reshape(-1, 3)
+        center = coords.mean(axis=0) if centers is None else np.asarray(centers[i], dtype=np.float32)
+        # x' = R (x - c) + c + t
+        moved = (coords - center) @ rotations[i].T
+        moved += center + translations[i]
+        table = dict(atoms)
+        table['coords'] = moved
+        augmented.append(table)
+    return augmented
+
+
+# Function to voxelize a randomly rotated copy of every structure into one batch.
+# voxelize_batch re-centres each structure, so translations only matter when the
+# augmented atoms are cropped with a fixed-resolution CropVoxelizer instead.
+def augmented_batch(atom_tables, rng=None, out=None, grid_size=32, typed=True, bank=None, dtype=np.float32):
+    augmented = augment_atoms(atom_tables, rng=rng, max_translation=0.0, bank=bank)
+    return voxelize_batch(augmented, grid_size=grid_size, typed=typed, out=out, dtype=dtype)
+
+
+# Benchmark augmented against plain voxelization of the same batch
+def benchmark_augmentation(batch_size=32, n_atoms=5_000, repeats=5, seed=0):
+    atom_tables = [synthetic_atoms(n_atoms, seed=seed + i) for i in range(batch_size)]
+    bank = RotationBank(seed=seed)
+    out = np.zeros((batch_size, 32, 32, 32, 6), dtype=np.float32)
+    timings = {}
+    for name, fn in (('plain', lambda: voxelize_batch(atom_tables, out=out)),
+                     ('augmented', lambda: augmented_batch(atom_tables, rng=seed, out=out, bank=bank))):
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+        print(f"{name:<10} {best * 1e3:9.2f} ms per batch of {batch_size} x {n_atoms} atoms")
+    print(f"Augmentation overhead: {timings['augmented'] / timings['plain'] - 1:.0%}")
+    return timings
+
+
+if __name__ == '__main__':
+    benchmark_augmentation()
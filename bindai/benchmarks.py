@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""Offline benchmark suite with baseline regression checks.
+
+Every hot path runs at three sizes on fixtures shipped in bindai/data
+(synthetic protein-like PDB files and a set of drug SMILES) or generated
+from a fixed seed, so no run touches the network. Each stage/size records
+its best wall time over several repeats, throughput, and the peak of
+allocations traced by tracemalloc (Python objects and NumPy buffers;
+TensorFlow's own allocator is not traced). Results are written as JSON and
+can be compared against a stored baseline: a stage regresses when its
+throughput falls or its peak memory grows by more than a set fraction.
+bindai/data/benchmark_baseline.json holds a stored full run (1 CPU, Linux,
+no PyTorch) for reference.
+
+Typical use:
+
+    bindai benchmark-suite --output bench.json --baseline baseline.json
+"""
+
+import atexit
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from .pdb_reader import read_atoms, write_pdb
+from .voxelizer import synthetic_atoms
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+SMILES_FIXTURE = os.path.join(DATA_DIR, 'drugs.smi')
+PDB_FIXTURES = {
+    'small': os.path.join(DATA_DIR, 'protein_1k.pdb.gz'),
+    'medium': os.path.join(DATA_DIR, 'protein_4k.pdb.gz'),
+    'large': os.path.join(DATA_DIR, 'protein_16k.pdb.gz'),
+}
+SIZES = ('small', 'medium', 'large')
+ATOMS_PER_RESIDUE = 8
+# Stored results of a full run, for --baseline
+BASELINE = os.path.join(DATA_DIR, 'benchmark_baseline.json')
+
+# Stage -> size label -> workload parameter passed to the stage's setup function
+STAGE_SIZES = {
+    'voxelize_protein': PDB_FIXTURES,
+    'generate_fingerprint': {'small': 100, 'medium': 300, 'large': 900},
+    'sequence_to_voxel_grid': {'small': 512, 'medium': 4096, 'large': 32768},
+    'encode_sequences': {'small': 64, 'medium': 512, 'large': 2048},
+    'preprocess_smiles': {'small': 1_000, 'medium': 10_000, 'large': 100_000},
+    'predict': {'small': 1, 'medium': 32, 'large': 128},
+    'voxel_loader': {'small': 32, 'medium': 256, 'large': 1024},
+}
+
+DEFAULT_REPEATS = 5
+DEFAULT_MAX_SLOWDOWN = 0.15
+DEFAULT_MAX_MEMORY_GROWTH = 0.25
+# Peaks below this many bytes are too small to compare meaningfully
+MEMORY_NOISE_BYTES = 256 * 1024
+
+# Amino acid background frequencies (UniProt) for the synthetic sequence fixture
+AMINO_ACID_FREQUENCIES = {
+    'A': 8.25, 'R': 5.53, 'N': 4.06, 'D': 5.45, 'C': 1.37, 'Q': 3.93, 'E': 6.75,
+    'G': 7.07, 'H': 2.27, 'I': 5.96, 'L': 9.66, 'K': 5.84, 'M': 2.42, 'F': 3.86,
+    'P': 4.70, 'S': 6.56, 'T': 5.34, 'W': 1.08, 'Y': 2.92, 'V': 6.87,
+}
+
+
+# Function to regenerate the bundled PDB fixtures (deterministic, byte-identical output).
+# Atom names are unique within each residue and a residue is all ATOM or all HETATM,
+# so parsers that key atoms by (residue, name), like Bio.PDB, keep every atom.
+def write_fixtures(data_dir=DATA_DIR):
+    for path, n_atoms in zip(PDB_FIXTURES.values(), (1_000, 4_000, 16_000)):
+        atoms = synthetic_atoms(n_atoms, seed=n_atoms)
+        position = np.arange(n_atoms) % ATOMS_PER_RESIDUE
+        atoms['resid'] = np.arange(n_atoms) // ATOMS_PER_RESIDUE + 1
+        atoms['hetero'] = atoms['hetero'][np.arange(n_atoms) - position]
+        atoms['name'] = np.char.add(atoms['element'], position.astype('U1'))
+        write_pdb(atoms, os.path.join(data_dir, os.path.basename(path)))
+
+
+# Function to return n fixture SMILES: non-canonical rootings of the bundled drugs, cycled if needed
+def fixture_smiles(n):
+    from rdkit import Chem
+
+    with open(SMILES_FIXTURE) as handle:
+        mols = [Chem.MolFromSmiles(line.split()[0]) for line in handle if line.strip()]
+    # Round-robin over molecules so small sizes still cover the whole set
+    variants, seen = [], set()
+    for atom in range(max(mol.GetNumAtoms() for mol in mols)):
+        for mol in mols:
+            if atom < mol.GetNumAtoms():
+                smiles = Chem.MolToSmiles(mol, rootedAtAtom=atom, canonical=False)
+                if smiles not in seen:
+                    seen.add(smiles)
+                    variants.append(smiles)
+    return [variants[i % len(variants)] for i in range(n)]
+
+
+# Function to return n synthetic protein sequences of one length drawn from background frequencies
+def fixture_sequences(n, length, seed=0):
+    rng = np.random.default_rng(seed)
+    letters = np.array(list(AMINO_ACID_FREQUENCIES), dtype='U1')
+    p = np.array(list(AMINO_ACID_FREQUENCIES.values()))
+    return [''.join(rng.choice(letters, size=length, p=p / p.sum())) for _ in range(n)]
+
+
+# Each setup function returns (items processed per run, unit, callable to time)
+def _setup_voxelize_protein(path):
+    from .voxelizer import voxelize_protein
+
+    atoms = read_atoms(path)
+    return len(atoms['coords']), 'atoms', lambda: voxelize_protein(atoms)
+
+
+def _setup_generate_fingerprint(n):
+    from .fingerprint_store import _cached_packed_fingerprint, generate_fingerprint
+
+    smiles = fixture_smiles(n)
+
+    # The memo would turn every repeat after the first into cache hits
+    def run():
+        _cached_packed_fingerprint.cache_clear()
+        return [generate_fingerprint(s) for s in smiles]
+    return n, 'molecules', run
+
+
+def _setup_sequence_to_voxel_grid(length, n_sequences=16):
+    from .sequences import sequence_to_voxel_grid
+
+    sequences = fixture_sequences(n_sequences, length)
+    return n_sequences * length, 'residues', lambda: [sequence_to_voxel_grid(s) for s in sequences]
+
+
+def _setup_encode_sequences(n):
+    from .sequences import encode_sequences, synthetic_proteome
+
+    sequences = synthetic_proteome(n)
+    out = np.empty((n, 32, 32, 32), dtype=np.float32)
+    return n, 'sequences', lambda: encode_sequences(sequences, out=out)
+
+
+def _setup_preprocess_smiles(n):
+    from .sequences import preprocess_smiles
+
+    smiles = fixture_smiles(n)
+    return n, 'molecules', lambda: preprocess_smiles(smiles)
+
+
+def _setup_predict(n):
+    import tensorflow as tf
+
+    from .fingerprint_store import generate_fingerprint
+    from .models import build_cnn_with_drug_input
+    from .voxelizer import voxelize_protein
+
+    tf.keras.utils.set_random_seed(0)
+    model = build_cnn_with_drug_input((32, 32, 32, 1), 2048)
+    voxel = voxelize_protein(read_atoms(PDB_FIXTURES['medium']))
+    voxels = np.repeat(voxel[None], n, axis=0)
+    fingerprints = np.stack([generate_fingerprint(s) for s in fixture_smiles(n)])
+    # Trace the predict function outside the timed runs
+    model.predict([voxels, fingerprints], batch_size=32, verbose=0)
+    return n, 'pairs', lambda: model.predict([voxels, fingerprints], batch_size=32, verbose=0)
+
+
+def _setup_voxel_loader(n_files, batch_size=32):
+    from torch.utils.data import DataLoader
+
+    from .voxel_dataset import ProteinVoxelDataset, collate_sparse_voxels, save_voxel_data
+
+    data_dir = tempfile.mkdtemp(prefix='bindai-bench-')
+    atexit.register(shutil.rmtree, data_dir, True)
+    for i, sequence in enumerate(fixture_sequences(n_files, 1024)):
+        save_voxel_data(f'seq{i:05d}', sequence, data_dir)
+    loader = DataLoader(ProteinVoxelDataset(data_dir), batch_size=batch_size, collate_fn=collate_sparse_voxels)
+    return n_files, 'proteins', lambda: [batch for batch in loader]
+
+
+STAGE_SETUPS = {
+    'voxelize_protein': _setup_voxelize_protein,
+    'generate_fingerprint': _setup_generate_fingerprint,
+    'sequence_to_voxel_grid': _setup_sequence_to_voxel_grid,
+    'encode_sequences': _setup_encode_sequences,
+    'preprocess_smiles': _setup_preprocess_smiles,
+    'predict': _setup_predict,
+    'voxel_loader': _setup_voxel_loader,
+}
+
+
+# Function to return the process's peak resident set size in KiB, or None where `resource` is missing (Windows)
+def _peak_rss_kib():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# Function to time predict and train steps over prepared (inputs, labels) batches; each batch shape is traced first
+def _time_batches(model, batches):
+    seen = set()
+    for inputs, labels in batches:
+        if inputs.shape not in seen:
+            seen.add(inputs.shape)
+            model.predict_on_batch(inputs)
+            model.train_on_batch(inputs, labels)
+    timings = {}
+    for step in ('predict', 'train'):
+        start = time.perf_counter()
+        for inputs, labels in batches:
+            if step == 'predict':
+                model.predict_on_batch(inputs)
+            else:
+                model.train_on_batch(inputs, labels)
+        timings[step] = time.perf_counter() - start
+    return timings, len(seen)
+
+
+# Benchmark the voxel-folded CNN from bindai2.py against the sequence model on bucketed batches.
+# The sequence model runs first, so the growth in peak RSS of each phase is its own footprint
+# (peak RSS needs the Unix-only resource module and is reported as None elsewhere).
+def benchmark_sequence_model(n_sequences=512, batch_size=32, lstm_units=0, seed=0):
+    from .models import build_sequence_model, build_voxel_sequence_cnn
+    from .sequences import bucket_batches, encode_sequences, synthetic_proteome
+
+    proteome = synthetic_proteome(n_sequences, seed=seed)
+    labels = np.random.default_rng(seed).integers(0, 2, n_sequences).astype(np.float32)
+    n_residues = sum(len(sequence) for sequence in proteome)
+    results = {}
+
+    for name in ('sequence', 'voxel'):
+        rss_before = _peak_rss_kib()
+        if name == 'sequence':
+            model = build_sequence_model(lstm_units=lstm_units)
+            batches = [(tokens, batch_labels) for _, tokens, batch_labels in
+                       bucket_batches(proteome, labels, batch_size=batch_size, shuffle=True, seed=seed)]
+        else:
+            model = build_voxel_sequence_cnn()
+            grids = encode_sequences(proteome)[..., None]
+            batches = [(grids[start:start + batch_size], labels[start:start + batch_size])
+                       for start in range(0, n_sequences, batch_size)]
+        input_bytes = sum(inputs.nbytes for inputs, _ in batches)
+        padded = sum(inputs.size for inputs, _ in batches)
+        timings, n_shapes = _time_batches(model, batches)
+        rss_growth = None if rss_before is None else _peak_rss_kib() - rss_before
+        results[name] = {'parameters': model.count_params(), 'input_bytes': input_bytes,
+                         'padding_fraction': 1 - n_residues / padded, 'batch_shapes': n_shapes,
+                         'predict_per_sec': n_sequences / timings['predict'],
+                         'train_per_sec': n_sequences / timings['train'], 'peak_rss_growth_kib': rss_growth}
+
+    print(f"{n_sequences} proteins, {n_residues} residues, batch size {batch_size}")
+    print(f"{'model':<10} {'params':>9} {'input MiB':>10} {'padding':>8} {'shapes':>7} {'predict/s':>10} "
+          f"{'train/s':>9} {'peak RSS +MiB':>14}")
+    for name, row in results.items():
+        rss = 'n/a' if row['peak_rss_growth_kib'] is None else f"{row['peak_rss_growth_kib'] / 1024:.1f}"
+        print(f"{name:<10} {row['parameters']:>9} {row['input_bytes'] / 2**20:>10.1f} {row['padding_fraction']:>8.1%} "
+              f"{row['batch_shapes']:>7} {row['predict_per_sec']:>10.1f} {row['train_per_sec']:>9.1f} {rss:>14}")
+    return results
+
+
+# Function to time one stage at one size: best of `repeats` untraced runs, then one traced run for peak memory
+def run_stage(stage, size, repeats=DEFAULT_REPEATS):
+    items, unit, fn = STAGE_SETUPS[stage](STAGE_SIZES[stage][size])
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'stage': stage, 'size': size, 'items': items, 'unit': unit, 'seconds': best,
+            'throughput': items / best, 'peak_bytes': peak}
+
+
+def _environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'cpus': os.cpu_count(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+# Function to run the selected stages at the selected sizes; a stage whose dependency is missing is skipped
+def run_suite(stages=None, sizes=SIZES, repeats=DEFAULT_REPEATS):
+    results = {}
+    for stage in stages or STAGE_SETUPS:
+        for size in sizes:
+            key = f'{stage}/{size}'
+            try:
+                results[key] = run_stage(stage, size, repeats=repeats)
+            except ImportError as error:
+                results[key] = {'stage': stage, 'size': size, 'skipped': str(error)}
+                print(f"{key:<32} skipped ({error})")
+                break
+            result = results[key]
+            print(f"{key:<32} {result['seconds'] * 1e3:10.2f} ms  {result['throughput']:12.0f} {result['unit']}/s  "
+                  f"peak {result['peak_bytes'] / 2 ** 20:8.2f} MiB")
+    return {'environment': _environment(), 'results': results}
+
+
+# Function to compare results with a baseline, returning a list of regression messages.
+# `thresholds` maps a stage name to its own allowed slowdown fraction.
+def compare_results(current, baseline, max_slowdown=DEFAULT_MAX_SLOWDOWN,
+                    max_memory_growth=DEFAULT_MAX_MEMORY_GROWTH, thresholds=None):
+    thresholds = thresholds or {}
+    regressions = []
+    for key, result in current['results'].items():
+        reference = baseline['results'].get(key)
+        if reference is None or 'skipped' in result or 'skipped' in reference:
+            continue
+        allowed = thresholds.get(result['stage'], max_slowdown)
+        ratio = result['throughput'] / reference['throughput']
+        if ratio < 1 - allowed:
+            regressions.append(f"{key}: throughput {ratio - 1:+.1%} "
+                               f"({reference['throughput']:.0f} -> {result['throughput']:.0f} {result['unit']}/s, "
+                               f"allowed -{allowed:.0%})")
+        peak, reference_peak = result['peak_bytes'], reference['peak_bytes']
+        if peak > MEMORY_NOISE_BYTES and peak > reference_peak * (1 + max_memory_growth):
+            regressions.append(f"{key}: peak memory {reference_peak / 2 ** 20:.2f} -> {peak / 2 ** 20:.2f} MiB "
+                               f"(allowed +{max_memory_growth:.0%})")
+    return regressions
+
+
+# Function to parse STAGE=FRACTION overrides from the command line
+def _parse_thresholds(values):
+    thresholds = {}
+    for value in values or ():
+        stage, _, fraction = value.partition('=')
+        if stage not in STAGE_SETUPS or not fraction:
+            raise SystemExit(f"Invalid threshold {value!r}; expected STAGE=FRACTION with STAGE one of "
+                             f"{', '.join(STAGE_SETUPS)}")
+        thresholds[stage] = float(fraction)
+    return thresholds
+
+
+# Command-line entry point, also used by `bindai benchmark-suite`; returns 1 on a regression
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=prog, description="Run the offline benchmark suite")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGE_SETUPS), help="Stages to run (default: all)")
+    parser.add_argument('--sizes', nargs='+', choices=SIZES, default=list(SIZES))
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help=f"Baseline JSON to compare against (stored run: {BASELINE})")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Write the results to --baseline instead of comparing")
+    parser.add_argument('--max-slowdown', type=float, default=DEFAULT_MAX_SLOWDOWN,
+                        help="Allowed throughput loss as a fraction of the baseline")
+    parser.add_argument('--max-memory-growth', type=float, default=DEFAULT_MAX_MEMORY_GROWTH,
+                        help="Allowed peak memory growth as a fraction of the baseline")
+    parser.add_argument('--threshold', action='append', metavar='STAGE=FRACTION',
+                        help="Per-stage allowed slowdown, e.g. predict=0.3 (repeatable)")
+    args = parser.parse_args(argv)
+    thresholds = _parse_thresholds(args.threshold)
+    if args.update_baseline and not args.baseline:
+        parser.error("--update-baseline needs --baseline")
+
+    current = run_suite(args.stages, args.sizes, repeats=args.repeats)
+    for path in filter(None, (args.output, args.baseline if args.update_baseline else None)):
+        with open(path, 'w') as handle:
+            json.dump(current, handle, indent=2)
+        print(f"Wrote {path}")
+    if not args.baseline or args.update_baseline:
+        return 0
+
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    regressions = compare_results(current, baseline, args.max_slowdown, args.max_memory_growth, thresholds)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    print(f"{len(regressions)} regression(s) against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
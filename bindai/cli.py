@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Command-line interface: `bindai <command> ...` or `python -m bindai <command> ...`.
+
+Only argparse is imported up front. Each command imports the submodules it
+needs when it runs, so `bindai --help` does not load NumPy, TensorFlow,
+RDKit or Bio.PDB, and fingerprint commands never load TensorFlow.
+`bindai import-time` checks these start-up costs against IMPORT_BUDGETS.
+"""
+
+import argparse
+import importlib
+import json
+import subprocess
+import sys
+import time
+
+# Commands whose arguments are parsed by the submodule's own main(argv, prog)
+FORWARDED_COMMANDS = {
+    'fingerprint-library': ('fingerprint_pipeline', [], "Fingerprint a SMILES library into packed-bit shards"),
+    'screen': ('streaming_screen', [], "Stream a ligand library and keep the top-k hits per target"),
+    'quantize': ('quantize', [], "Export a quantized TFLite model for CPU screening"),
+    'serve': ('serving', ['serve'], "Run the micro-batching scoring server"),
+    'load-test': ('serving', ['load-test'], "Load-test a running scoring server"),
+    'ncbi-fetch': ('ncbi', [], "Fetch protein sequences for search terms from NCBI"),
+    'build-dataset': ('dataset_manifest', [], "Build or update a protein dataset, fetching only new entries"),
+    'benchmark-suite': ('benchmarks', [], "Run the offline benchmark suite and compare it with a baseline"),
+}
+
+# Benchmark name -> (submodule, function, whether it takes one path/model argument)
+BENCHMARKS = {
+    'voxelizer': ('voxelizer', 'benchmark_voxelizers', False),
+    'reader': ('pdb_reader', 'benchmark_reader', True),
+    'screening': ('screening', 'benchmark_screening', None),
+    'augmentation': ('augmentation', 'benchmark_augmentation', False),
+    'similarity': ('similarity', 'benchmark_similarity', False),
+    'ncbi': ('ncbi', 'benchmark_fetcher', False),
+    'storage': ('sparse_voxels', 'benchmark_storage', False),
+    'tracing': ('tracing', 'benchmark_overhead', False),
+    'sequence-encoder': ('sequences', 'benchmark_sequence_encoder', False),
+    'sequence-model': ('benchmarks', 'benchmark_sequence_model', False),
+    'fasta': ('fasta', 'benchmark_fasta_reader', None),
+    'dataset': ('dataset_manifest', 'benchmark_incremental_build', False),
+    'input-pipeline': ('training_records', 'benchmark_input_pipeline', True),
+}
+
+# Start-up budgets in milliseconds of wall time, including interpreter start-up,
+# and the heavy modules each command line must not import
+IMPORT_BUDGETS = {
+    ('--help',): (250, ('numpy', 'tensorflow', 'rdkit', 'Bio')),
+    ('fingerprint', 'CCO'): (600, ('tensorflow', 'Bio')),
+}
+
+
+def _load(module_name):
+    return importlib.import_module(f'bindai.{module_name}')
+
+
+def _fingerprint(args):
+    import numpy as np
+
+    fingerprint_store = _load('fingerprint_store')
+    status = 0
+    for smiles in args.smiles:
+        packed = fingerprint_store.packed_fingerprint(smiles, n_bits=args.n_bits, radius=args.radius)
+        if packed is None:
+            print(f"Invalid SMILES string: {smiles}", file=sys.stderr)
+            status = 1
+            continue
+        if args.format == 'hex':
+            value = packed.tobytes().hex()
+        else:
+            value = ','.join(str(bit) for bit in np.flatnonzero(np.unpackbits(packed, count=args.n_bits)))
+        print(f"{smiles}\t{value}")
+    return status
+
+
+# Function to load a protein from a structure file path or a PDB ID as an atom table
+def _protein_atoms(pdb):
+    import os
+
+    if os.path.exists(pdb):
+        return _load('pdb_reader').read_atoms(pdb)
+    return _load('structure_cache').fetch_protein_atoms(pdb)
+
+
+def _predict(args):
+    import numpy as np
+
+    fingerprint_store = _load('fingerprint_store')
+    screening = _load('screening')
+    voxelizer = _load('voxelizer')
+
+    screen = screening.TwoTowerScreen(args.model)
+    voxel_shape = screen.protein_encoder.input.shape[1:]
+    protein_voxel = voxelizer.voxelize_protein(_protein_atoms(args.pdb), grid_size=voxel_shape[0],
+                                               typed=voxel_shape[-1] == voxelizer.NUM_CHANNELS)
+    valid, fingerprints = [], []
+    for smiles in args.smiles:
+        packed = fingerprint_store.packed_fingerprint(smiles)
+        if packed is None:
+            print(f"Invalid SMILES string: {smiles}", file=sys.stderr)
+            continue
+        valid.append(smiles)
+        fingerprints.append(packed)
+    if not valid:
+        return 1
+    scores = screen.screen(protein_voxel, fingerprint_store.unpack_fingerprints(np.stack(fingerprints)))
+    for smiles, score in zip(valid, scores):
+        print(f"{smiles}\t{score:.6f}")
+    return 0 if len(valid) == len(args.smiles) else 1
+
+
+def _scan(args):
+    fingerprint_store = _load('fingerprint_store')
+    pocket_scan = _load('pocket_scan')
+
+    scanner = pocket_scan.PocketScanner(args.model)
+    _, _, sites = scanner.scan(_protein_atoms(args.pdb), fingerprint_store.generate_fingerprint(args.smiles),
+                               top_k=args.top_k)
+    for site in sites:
+        x, y, z = site['center']
+        print(f"{x:8.2f} {y:8.2f} {z:8.2f}\t{site['score']:.6f}")
+    return 0
+
+
+def _prewarm(args):
+    with open(args.ids_file) as id_file:
+        ids = [line.strip() for line in id_file if line.strip()]
+    failed = _load('structure_cache').default_cache().prewarm(ids)
+    print(f"Cached {len(ids) - len(failed)} of {len(ids)} structures")
+    return 1 if failed else 0
+
+
+def _http_cache(args):
+    http_cache = _load('http_cache')
+    cache = http_cache.ResponseCache(args.path) if args.path else http_cache.default_cache()
+    if args.action == 'purge':
+        print(f"Removed {cache.purge()} expired responses")
+    elif args.action == 'clear':
+        print(f"Removed {cache.purge(expired_only=False)} responses")
+    print(f"{'host':<36} {'entries':>8} {'MiB':>9} {'expired':>8}")
+    for host, entries, size, expired in cache.contents():
+        print(f"{host:<36} {entries:>8} {size / 2 ** 20:>9.2f} {expired:>8}")
+    return 0
+
+
+def _benchmark(args):
+    module_name, function_name, takes_argument = BENCHMARKS[args.name]
+    if takes_argument and args.argument is None:
+        raise SystemExit(f"bindai benchmark {args.name} needs a path argument")
+    function = getattr(_load(module_name), function_name)
+    if takes_argument is not False and args.argument is not None:
+        function(args.argument)
+    else:
+        function()
+    return 0
+
+
+# Function to time a fresh interpreter running the given arguments, best of several runs
+def _startup_time(python_args, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *python_args], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Function to list which of the given top-level modules a command line imports
+def _imported_modules(argv, modules):
+    code = (
+        "import contextlib, io, json, sys\n"
+        "from bindai.cli import main\n"
+        "with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):\n"
+        "    try:\n"
+        f"        main({list(argv)!r})\n"
+        "    except SystemExit:\n"
+        "        pass\n"
+        f"print(json.dumps([name for name in {list(modules)!r} if name in sys.modules]))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Function to measure CLI start-up against IMPORT_BUDGETS; returns 1 if any budget is exceeded
+def check_import_budget(repeats=5, scale=1.0):
+    status = 0
+    interpreter_ms = _startup_time(['-c', 'pass'], repeats) * 1e3
+    print(f"{'python -c pass':<28} {interpreter_ms:8.0f} ms")
+    for argv, (budget_ms, forbidden) in IMPORT_BUDGETS.items():
+        elapsed_ms = _startup_time(['-m', 'bindai', *argv], repeats) * 1e3
+        loaded = _imported_modules(argv, forbidden)
+        over = elapsed_ms > budget_ms * scale
+        status |= over or bool(loaded)
+        verdict = 'FAIL' if over or loaded else 'ok'
+        print(f"{'bindai ' + ' '.join(argv):<28} {elapsed_ms:8.0f} ms  budget {budget_ms * scale:6.0f} ms  "
+              f"{verdict}{'  imports ' + ', '.join(loaded) if loaded else ''}")
+    return int(status)
+
+
+def _import_time(args):
+    return check_import_budget(repeats=args.repeats, scale=args.scale)
+
+
+# Function to build the top-level parser; forwarded commands only appear here for --help
+def build_parser():
+    parser = argparse.ArgumentParser(prog='bindai', description="BindAI protein-ligand binding tools")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    fingerprint = commands.add_parser('fingerprint', help="Print Morgan fingerprints for SMILES")
+    fingerprint.add_argument('smiles', nargs='+')
+    fingerprint.add_argument('--n-bits', type=int, default=2048)
+    fingerprint.add_argument('--radius', type=int, default=2)
+    fingerprint.add_argument('--format', choices=('bits', 'hex'), default='bits',
+                             help="'bits' lists on-bit indices, 'hex' prints the packed fingerprint")
+    fingerprint.set_defaults(handler=_fingerprint)
+
+    predict = commands.add_parser('predict', help="Score SMILES against one protein")
+    predict.add_argument('--model', default='deepdrug1st.keras')
+    predict.add_argument('--pdb', required=True, help="Structure file path or PDB ID")
+    predict.add_argument('--smiles', nargs='+', required=True)
+    predict.set_defaults(handler=_predict)
+
+    scan = commands.add_parser('scan', help="Scan a whole protein for binding sites of one ligand")
+    scan.add_argument('--model', default='deepdrug1st.keras')
+    scan.add_argument('--pdb', required=True, help="Structure file path or PDB ID")
+    scan.add_argument('--smiles', required=True)
+    scan.add_argument('--top-k', type=int, default=5)
+    scan.set_defaults(handler=_scan)
+
+    prewarm = commands.add_parser('prewarm', help="Download structures into the local cache")
+    prewarm.add_argument('ids_file', help="File with one PDB ID per line")
+    prewarm.set_defaults(handler=_prewarm)
+
+    http_cache = commands.add_parser('http-cache', help="Inspect or prune the NCBI/PubChem/ChEMBL response cache")
+    http_cache.add_argument('action', nargs='?', choices=('stats', 'purge', 'clear'), default='stats',
+                            help="'purge' drops expired responses, 'clear' drops everything")
+    http_cache.add_argument('--path', help="Cache database (default: $BINDAI_HTTP_CACHE or ./http_cache.sqlite)")
+    http_cache.set_defaults(handler=_http_cache)
+
+    benchmark = commands.add_parser('benchmark', help="Run one of the built-in benchmarks")
+    benchmark.add_argument('name', choices=sorted(BENCHMARKS))
+    benchmark.add_argument('argument', nargs='?', help="Structure path, model path or TFRecord pattern")
+    benchmark.set_defaults(handler=_benchmark)
+
+    import_time = commands.add_parser('import-time', help="Check CLI start-up time against its budget")
+    import_time.add_argument('--repeats', type=int, default=5)
+    import_time.add_argument('--scale', type=float, default=1.0, help="Multiply every budget, e.g. on slow CI")
+    import_time.set_defaults(handler=_import_time)
+
+    for name, (_, _, description) in FORWARDED_COMMANDS.items():
+        commands.add_parser(name, help=description, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in FORWARDED_COMMANDS:
+        module_name, prefix, _ = FORWARDED_COMMANDS[argv[0]]
+        prog = 'bindai' if prefix else f'bindai {argv[0]}'
+        return _load(module_name).main(prefix + argv[1:], prog=prog) or 0
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'scan' and args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
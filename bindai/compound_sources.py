@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""SMILES sources: PubChem PUG REST and the ChEMBL web services.
+
+Both clients fetch through the shared HTTP response cache (http_cache), so
+rebuilding a compound set for the same IDs is served from disk and works
+offline with BINDAI_OFFLINE=1. PubChem CIDs are requested in comma-joined
+batches, not one request per CID. ChEMBL molecules are paged with
+limit/offset over the REST API, without needing chembl_webresource_client.
+"""
+
+import json
+import urllib.error
+
+from .http_cache import USE_DEFAULT_TTL, default_cache
+
+PUBCHEM_URL = 'https://pubchem.ncbi.nlm.nih.gov/rest/pug'
+CHEMBL_URL = 'https://www.ebi.ac.uk/chembl/api/data'
+PUBCHEM_BATCH_SIZE = 100
+# PubChem asks clients to stay under 5 requests per second
+PUBCHEM_MIN_INTERVAL = 0.2
+CHEMBL_PAGE_SIZE = 1000
+
+
+# Function to fetch one comma-joined batch of CIDs into `smiles`. A batch PubChem rejects (400 for a
+# malformed CID, 404 when none is found) is split in half and retried, so one bad CID only loses itself.
+def _fetch_pubchem_batch(batch, params, cache, ttl, smiles):
+    url = f"{PUBCHEM_URL}/compound/cid/{','.join(batch)}/property/CanonicalSMILES/JSON"
+    try:
+        body = cache.fetch(url, params, ttl=ttl, min_interval=PUBCHEM_MIN_INTERVAL)
+    except urllib.error.HTTPError as e:
+        if e.code in (400, 404) and len(batch) > 1:
+            middle = len(batch) // 2
+            _fetch_pubchem_batch(batch[:middle], params, cache, ttl, smiles)
+            _fetch_pubchem_batch(batch[middle:], params, cache, ttl, smiles)
+        else:
+            print(f"Error fetching CIDs {batch[0]}..{batch[-1]}: {e.code}")
+        return
+    except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+        print(f"Error fetching CIDs {batch[0]}..{batch[-1]}: {getattr(e, 'reason', e)}")
+        return
+    for entry in json.loads(body)['PropertyTable']['Properties']:
+        # PubChem has started returning the same value under newer property names
+        value = entry.get('CanonicalSMILES') or entry.get('SMILES') or entry.get('ConnectivitySMILES')
+        if value:
+            smiles[str(entry['CID'])] = value
+
+
+# Function to fetch canonical SMILES for PubChem CIDs, returning {cid: smiles} for the CIDs found
+def fetch_smiles_from_pubchem(cid_list, api_key=None, cache=None, batch_size=PUBCHEM_BATCH_SIZE,
+                              ttl=USE_DEFAULT_TTL):
+    cache = cache or default_cache()
+    cids = list(dict.fromkeys(str(cid).strip() for cid in cid_list))
+    params = {'api_key': api_key} if api_key else {}
+    smiles = {}
+    for start in range(0, len(cids), batch_size):
+        _fetch_pubchem_batch(cids[start:start + batch_size], params, cache, ttl, smiles)
+    return smiles
+
+
+# Function to fetch (molecule_chembl_id, canonical_smiles) pairs for the first `limit` ChEMBL molecules
+def fetch_chembl_smiles(limit=2500, page_size=CHEMBL_PAGE_SIZE, cache=None, ttl=USE_DEFAULT_TTL):
+    cache = cache or default_cache()
+    molecules = []
+    for offset in range(0, limit, page_size):
+        params = {'molecule_properties__full_molformula__isnull': 'false',
+                  'only': 'molecule_chembl_id,molecule_structures',
+                  'limit': min(page_size, limit - offset), 'offset': offset}
+        page = json.loads(cache.fetch(f'{CHEMBL_URL}/molecule.json', params, ttl=ttl))
+        for molecule in page['molecules']:
+            structures = molecule.get('molecule_structures') or {}
+            if structures.get('canonical_smiles'):
+                molecules.append((molecule['molecule_chembl_id'], structures['canonical_smiles']))
+        if not page['page_meta'].get('next'):
+            break
+    return molecules
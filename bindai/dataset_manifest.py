@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""Incremental protein dataset builder.
+
+A dataset is a list of (query, label) rows, such as bindai2.py's gene
+table. Rows are deduplicated case- and whitespace-insensitively. A query
+listed with different labels is a conflict: it is reported, then skipped
+or resolved by policy, instead of the last label silently winning.
+
+Each query's first NCBI record is stored by the SHA-256 of its sequence.
+The sequence goes in objects/<sha>.seq and its uint8 voxel grid in
+objects/<sha>.npy. manifest.json maps every query to its label, accession
+and sequence hash. A rebuild fetches only queries that are new or whose
+objects are missing, and encodes only sequences that have no grid yet.
+With refresh=True every query is fetched again, but only sequences whose
+hash changed are re-encoded. A change to the fetch or encoding settings
+invalidates the affected entries.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from .sequences import GRID_SIZE, encode_sequences
+
+MANIFEST_VERSION = 1
+CONFLICT_POLICIES = ('skip', 'first', 'last', 'error')
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+BINDAI2_LABELS = os.path.join(DATA_DIR, 'bindai2_binding_labels.tsv')
+ENCODE_BATCH_SIZE = 256
+
+
+# Function to normalize a query for deduplication: collapse whitespace, ignore case
+def query_key(query):
+    return ' '.join(query.split()).upper()
+
+
+# Function to read (query, label) rows from a TSV/CSV file; the label column is optional, '#' starts a comment
+def read_queries(path):
+    rows = []
+    with open(path) as handle:
+        for line in handle:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            fields = [field.strip() for field in line.replace(',', '\t').split('\t')]
+            label = float(fields[1]) if len(fields) > 1 and fields[1] else None
+            rows.append((fields[0], label))
+    return rows
+
+
+# Function to deduplicate (query, label) rows, returning ({key: (query, labels in order)}, {query: distinct labels})
+def dedupe_queries(rows):
+    grouped = {}
+    for query, label in rows:
+        query = ' '.join(query.split())
+        entry = grouped.setdefault(query_key(query), (query, []))
+        if label is not None:
+            entry[1].append(label)
+    conflicts = {query: sorted(set(labels)) for query, labels in grouped.values() if len(set(labels)) > 1}
+    return grouped, conflicts
+
+
+# Function to fetch the first NCBI protein record for each query, as {query: [(accession, description, sequence)]}
+def _fetch_from_ncbi(queries, **options):
+    from .ncbi import fetch_gene_sequences
+
+    return fetch_gene_sequences(queries, max_per_term=1, **options)
+
+
+class DatasetManifest:
+    def __init__(self, root, grid_size=GRID_SIZE, db='protein'):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        # Settings that entries depend on; a change invalidates the entries built with the old ones
+        self.fetch_settings = {'db': db, 'max_per_term': 1}
+        self.encoding = {'encoder': 'encode_sequences', 'grid_size': list(grid_size), 'dtype': 'uint8'}
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.manifest = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return {'version': MANIFEST_VERSION, 'entries': {}}
+        with open(self.manifest_path) as handle:
+            return json.load(handle)
+
+    def _save(self):
+        # Write to a temp file first so a killed build never leaves a torn manifest
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as handle:
+            json.dump(self.manifest, handle, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _sequence_path(self, digest):
+        return os.path.join(self.objects_dir, f'{digest}.seq')
+
+    def _grid_path(self, digest):
+        return os.path.join(self.objects_dir, f'{digest}.npy')
+
+    @property
+    def entries(self):
+        return self.manifest['entries']
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Function to resolve labels under a conflict policy, returning {key: (query, label)}, the conflicts
+    # and the number of unique queries
+    def _resolve(self, rows, on_conflict):
+        if on_conflict not in CONFLICT_POLICIES:
+            raise ValueError(f"on_conflict must be one of {', '.join(CONFLICT_POLICIES)}")
+        grouped, conflicts = dedupe_queries(rows)
+        if conflicts and on_conflict == 'error':
+            raise ValueError("Conflicting labels: " + ', '.join(f"{query} {labels}"
+                                                                for query, labels in conflicts.items()))
+        resolved = {}
+        for key, (query, labels) in grouped.items():
+            if query in conflicts and on_conflict == 'skip':
+                continue
+            resolved[key] = (query, labels[-1] if on_conflict == 'last' and labels else
+                             (labels[0] if labels else None))
+        return resolved, conflicts, len(grouped)
+
+    # Function to sort the resolved queries into new, stale (to fetch again) and current entries
+    def plan(self, rows, on_conflict='skip', refresh=False):
+        resolved, conflicts, n_unique = self._resolve(rows, on_conflict)
+        settings_changed = self.manifest.get('fetch') != self.fetch_settings
+        plan = {'unique': n_unique, 'new': [], 'stale': [], 'current': [], 'removed': [],
+                'conflicts': conflicts}
+        for key, (query, _) in resolved.items():
+            entry = self.entries.get(key)
+            if entry is None:
+                plan['new'].append(query)
+            elif refresh or settings_changed or not os.path.exists(self._sequence_path(entry['sha256'])):
+                plan['stale'].append(query)
+            else:
+                plan['current'].append(query)
+        plan['removed'] = [entry['query'] for key, entry in self.entries.items() if key not in resolved]
+        return plan, resolved
+
+    # Function to bring the dataset up to date with the given rows, fetching and encoding only what changed.
+    # fetch(queries) returns {query: [(accession, description, sequence), ...]}; the default queries NCBI.
+    def build(self, rows, fetch=None, on_conflict='skip', refresh=False, **fetch_options):
+        start = time.perf_counter()
+        plan, resolved = self.plan(rows, on_conflict=on_conflict, refresh=refresh)
+        to_fetch = plan['new'] + plan['stale']
+        fetched = {}
+        if to_fetch and fetch is None:
+            fetched = _fetch_from_ncbi(to_fetch, db=self.fetch_settings['db'], **fetch_options)
+        elif to_fetch:
+            fetched = fetch(to_fetch, **fetch_options)
+
+        entries, missing, changed = {}, [], []
+        pending = set(to_fetch)
+        for key, (query, label) in resolved.items():
+            old = self.entries.get(key)
+            if query not in pending:
+                entries[key] = dict(old, label=label)
+                continue
+            records = fetched.get(query) or []
+            if not records:
+                # Keep what an earlier build fetched rather than dropping the entry
+                missing.append(query)
+                if old is not None and os.path.exists(self._sequence_path(old['sha256'])):
+                    entries[key] = dict(old, label=label)
+                continue
+            accession, _, sequence = records[0]
+            data = sequence.encode('ascii', errors='replace')
+            digest = hashlib.sha256(data).hexdigest()
+            if not os.path.exists(self._sequence_path(digest)):
+                with open(self._sequence_path(digest) + '.tmp', 'wb') as handle:
+                    handle.write(data)
+                os.replace(self._sequence_path(digest) + '.tmp', self._sequence_path(digest))
+            if old is not None and old['sha256'] != digest:
+                changed.append(query)
+            entries[key] = {'query': query, 'label': label, 'accession': accession, 'sha256': digest,
+                            'length': len(data), 'fetched_at': time.time()}
+
+        if self.manifest.get('encoding') != self.encoding:
+            for digest in {entry['sha256'] for entry in self.entries.values()}:
+                if os.path.exists(self._grid_path(digest)):
+                    os.remove(self._grid_path(digest))
+        encoded = self._encode_missing({entry['sha256'] for entry in entries.values()})
+
+        self.manifest = {'version': MANIFEST_VERSION, 'fetch': self.fetch_settings, 'encoding': self.encoding,
+                         'entries': entries, 'conflicts': plan['conflicts'], 'missing': missing,
+                         'built_at': time.time()}
+        self._save()
+        removed_objects = self.collect_garbage()
+        return {'rows': len(rows), 'unique': plan['unique'], 'conflicts': len(plan['conflicts']),
+                'new': len(plan['new']), 'stale': len(plan['stale']), 'current': len(plan['current']),
+                'removed': len(plan['removed']), 'fetched': len(to_fetch), 'changed': len(changed),
+                'missing': len(missing), 'encoded': encoded,
+                'removed_objects': removed_objects, 'seconds': time.perf_counter() - start}
+
+    # Function to encode the stored sequences that have no grid yet, returning how many were encoded
+    def _encode_missing(self, digests):
+        pending = sorted(digest for digest in digests if not os.path.exists(self._grid_path(digest)))
+        grid_size = tuple(self.encoding['grid_size'])
+        out = np.empty((ENCODE_BATCH_SIZE,) + grid_size, dtype=np.uint8)
+        for start in range(0, len(pending), ENCODE_BATCH_SIZE):
+            batch = pending[start:start + ENCODE_BATCH_SIZE]
+            sequences = []
+            for digest in batch:
+                with open(self._sequence_path(digest), 'rb') as handle:
+                    sequences.append(handle.read())
+            grids = encode_sequences(sequences, grid_size, out=out)
+            for digest, grid in zip(batch, grids):
+                with open(self._grid_path(digest) + '.tmp', 'wb') as handle:
+                    np.save(handle, grid)
+                os.replace(self._grid_path(digest) + '.tmp', self._grid_path(digest))
+        return len(pending)
+
+    # Function to delete objects no manifest entry refers to, returning the number of files removed
+    def collect_garbage(self):
+        referenced = {entry['sha256'] for entry in self.entries.values()}
+        removed = 0
+        for name in os.listdir(self.objects_dir):
+            digest, _, extension = name.partition('.')
+            if extension in ('seq', 'npy') and digest not in referenced:
+                os.remove(os.path.join(self.objects_dir, name))
+                removed += 1
+        return removed
+
+    # Function to load the labelled entries as (queries, X, y), X shaped (N, x, y, z, 1)
+    def arrays(self, dtype=np.float32):
+        labelled = [entry for entry in self.entries.values() if entry['label'] is not None]
+        grid_size = tuple(self.encoding['grid_size'])
+        X = np.empty((len(labelled),) + grid_size + (1,), dtype=dtype)
+        for i, entry in enumerate(labelled):
+            X[i, ..., 0] = np.load(self._grid_path(entry['sha256']))
+        y = np.array([entry['label'] for entry in labelled], dtype=np.float32)
+        return [entry['query'] for entry in labelled], X, y
+
+
+def _print_summary(summary, conflicts):
+    print(f"{summary['rows']} rows, {summary['unique']} unique queries, {summary['conflicts']} with conflicting "
+          f"labels")
+    for query, labels in conflicts.items():
+        print(f"  conflict: {query} labels {labels}")
+    print(f"new {summary['new']}, stale {summary['stale']}, current {summary['current']}, "
+          f"removed {summary['removed']}")
+    print(f"fetched {summary['fetched']} queries ({summary['changed']} changed, {summary['missing']} without "
+          f"records), encoded {summary['encoded']} sequences in {summary['seconds']:.2f} s")
+
+
+# Benchmark a full build of bindai2.py's gene table against an incremental rebuild with ten more genes
+def benchmark_incremental_build(latency=0.05):
+    from .ncbi import StubEutilsServer
+
+    rows = read_queries(BINDAI2_LABELS)
+    extra = [(f'EXTRA{i}[Gene]', float(i % 2)) for i in range(10)]
+    server = StubEutilsServer(latency=latency, records_per_term=1).start()
+    options = {'base_url': server.url, 'rate': 1e9, 'cache': False}
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            dataset = DatasetManifest(root)
+            for label, build_rows in (('full build', rows), ('unchanged rebuild', rows),
+                                      ('ten new genes', rows + extra)):
+                requests_before = server.requests
+                summary = dataset.build(build_rows, **options)
+                summary['requests'] = server.requests - requests_before
+                results[label] = summary
+                print(f"{label:<18} fetched {summary['fetched']:>4} queries  {summary['requests']:>4} requests  "
+                      f"encoded {summary['encoded']:>4}  {summary['seconds']:6.2f} s")
+    finally:
+        server.shutdown()
+        server.server_close()
+    print(f"{results['full build']['rows']} rows -> {results['full build']['unique']} unique queries, "
+          f"{results['full build']['conflicts']} skipped for conflicting labels")
+    return results
+
+
+# Command-line entry point, also used by `bindai build-dataset`
+def main(argv=None, prog=None):
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(prog=prog, description="Build or update a protein dataset incrementally")
+    parser.add_argument('queries', nargs='*', help="TSV/CSV files of query[,label] rows "
+                                                   "(default: bindai2.py's gene labels)")
+    parser.add_argument('--output', required=True, help="Dataset directory")
+    parser.add_argument('--on-conflict', choices=CONFLICT_POLICIES, default='skip',
+                        help="What to do with a query listed with different labels")
+    parser.add_argument('--refresh', action='store_true', help="Fetch every query again; re-encode changed ones")
+    parser.add_argument('--dry-run', action='store_true', help="Only print what a build would fetch")
+    parser.add_argument('--api-key', help="NCBI API key (default: $NCBI_API_KEY)")
+    parser.add_argument('--offline', action='store_true', help="Serve NCBI responses from the HTTP cache only")
+    args = parser.parse_args(argv)
+
+    rows = [row for path in args.queries or [BINDAI2_LABELS] for row in read_queries(path)]
+    dataset = DatasetManifest(args.output)
+    if args.dry_run:
+        plan, _ = dataset.plan(rows, on_conflict=args.on_conflict, refresh=args.refresh)
+        for query, labels in plan['conflicts'].items():
+            print(f"conflict: {query} labels {labels}")
+        print(f"new {len(plan['new'])}, stale {len(plan['stale'])}, current {len(plan['current'])}, "
+              f"removed {len(plan['removed'])}")
+        return 0
+    from .ncbi import NCBIError
+
+    options = {'api_key': args.api_key}
+    if args.offline:
+        from .http_cache import default_cache
+
+        options['cache'] = default_cache()
+        options['cache'].cache_only = True
+    try:
+        summary = dataset.build(rows, on_conflict=args.on_conflict, refresh=args.refresh, **options)
+    except (NCBIError, ValueError, LookupError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    _print_summary(summary, dataset.manifest['conflicts'])
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
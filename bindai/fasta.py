@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Streaming multi-record FASTA reader.
+
+Files are read in fixed-size chunks. A plain file is sliced from a memory
+map. A gzip file is memory-mapped too and inflated with zlib one chunk at
+a time, including multi-member (bgzip) files. Only complete records, up to
+the last '>' header seen, are split out. The tail stays buffered until the
+next chunk, so memory is bounded by the chunk size plus the longest record
+rather than the file size.
+
+Records are yielded as (id, sequence) with the sequence as bytes, which
+sequences.encode_sequences reads without a copy. encode_fasta streams a
+file straight into reused voxel-grid batches.
+"""
+
+import gzip
+import mmap
+import os
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+from .sequences import DEFAULT_ENCODE_BATCH_SIZE, iter_encoded_batches, synthetic_proteome
+
+DEFAULT_CHUNK_SIZE = 4 * 2**20
+LINE_WIDTH = 60
+# Bytes dropped from sequence lines
+_WHITESPACE = b' \t\r\n'
+
+
+# Function to yield the raw bytes of a (possibly gzipped) file in chunks, reading through a memory map
+def _iter_file_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as handle:
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if not str(path).endswith('.gz'):
+                for offset in range(0, len(mapped), chunk_size):
+                    yield mapped[offset:offset + chunk_size]
+                return
+            # 16 + MAX_WBITS expects a gzip header; each member of a multi-member file gets a fresh decompressor
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            for offset in range(0, len(mapped), chunk_size):
+                data = mapped[offset:offset + chunk_size]
+                while data:
+                    yield decompressor.decompress(data)
+                    data = decompressor.unused_data
+                    if data:
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            yield decompressor.flush()
+
+
+# Function to split a block of complete records ('>header\nSEQ...' repeated) into (id, sequence) pairs
+def _parse_block(block):
+    for record in block.split(b'\n>'):
+        header, _, body = record.lstrip(b'>').partition(b'\n')
+        fields = header.split(None, 1)
+        if fields:
+            yield fields[0].decode('ascii', errors='replace'), body.translate(None, _WHITESPACE)
+
+
+# Function to stream (id, sequence bytes) records from a plain or gzipped FASTA file
+def iter_fasta(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    buffer, started = b'', False
+    for chunk in _iter_file_chunks(path, chunk_size):
+        buffer += chunk
+        if not started:
+            # Text before the first header is not part of any record
+            first = 0 if buffer.startswith(b'>') else buffer.find(b'\n>') + 1
+            if not first and not buffer.startswith(b'>'):
+                buffer = buffer[-1:]
+                continue
+            buffer, started = buffer[first:], True
+        # Everything before the last header is made of complete records
+        end = buffer.rfind(b'\n>')
+        if end > 0:
+            yield from _parse_block(buffer[:end])
+            buffer = buffer[end + 1:]
+    if started:
+        yield from _parse_block(buffer)
+
+
+# Function to encode a FASTA file in batches, yielding (ids, grids); grids is a view of one reused buffer
+def encode_fasta(path, batch_size=DEFAULT_ENCODE_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE, **options):
+    ids = []
+
+    def sequences():
+        for record_id, sequence in iter_fasta(path, chunk_size):
+            ids.append(record_id)
+            yield sequence
+
+    # iter_encoded_batches yields as soon as a batch fills, so `ids` holds exactly that batch's ids
+    for _, grids in iter_encoded_batches(sequences(), batch_size, **options):
+        yield ids[:len(grids)], grids
+        del ids[:len(grids)]
+
+
+# Function to write (id, sequence) records as FASTA with wrapped sequence lines (gzipped for .gz paths)
+def write_fasta(records, path, line_width=LINE_WIDTH, compresslevel=6):
+    handle = gzip.open(path, 'wb', compresslevel=compresslevel) if str(path).endswith('.gz') else open(path, 'wb')
+    with handle:
+        for record_id, sequence in records:
+            if isinstance(sequence, str):
+                sequence = sequence.encode('ascii')
+            lines = [sequence[i:i + line_width] for i in range(0, len(sequence), line_width)]
+            handle.write(b'>' + record_id.encode('ascii') + b'\n' + b'\n'.join(lines) + b'\n')
+    return path
+
+
+# Function to time one untraced pass, then measure peak traced memory on a second pass
+def _measure(fn):
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+# Function to count the records and residues of a FASTA file with iter_fasta
+def _count_records(path):
+    n_records = n_residues = 0
+    for _, sequence in iter_fasta(path):
+        n_records += 1
+        n_residues += len(sequence)
+    return n_records, n_residues
+
+
+# Benchmark iter_fasta on a synthetic proteome FASTA against raw chunked reads and Bio.SeqIO
+def benchmark_fasta_reader(path=None, n_sequences=100_000, seed=0):
+    with tempfile.TemporaryDirectory() as tmp:
+        if path is None:
+            proteome = synthetic_proteome(n_sequences, seed=seed)
+            path = write_fasta(((f'SYN{i:06d}', sequence) for i, sequence in enumerate(proteome)),
+                               os.path.join(tmp, 'proteome.fasta'))
+            del proteome
+            gz_path = write_fasta(iter_fasta(path), os.path.join(tmp, 'proteome.fasta.gz'), compresslevel=1)
+            paths = (path, gz_path)
+        else:
+            paths = (path,)
+
+        results = {}
+        for fasta_path in paths:
+            size_mb = os.path.getsize(fasta_path) / 1e6
+            label = os.path.basename(fasta_path)
+            raw_seconds, _, _ = _measure(lambda: sum(len(chunk) for chunk in _iter_file_chunks(fasta_path)))
+            seconds, peak, (n_records, n_residues) = _measure(lambda: _count_records(fasta_path))
+            results[label] = {'megabytes': size_mb, 'records': n_records, 'residues': n_residues,
+                              'raw_seconds': raw_seconds, 'iter_fasta_seconds': seconds, 'peak_bytes': peak}
+            print(f"{label:<22} {size_mb:8.1f} MB  raw read {size_mb / raw_seconds:8.1f} MB/s  "
+                  f"iter_fasta {size_mb / seconds:8.1f} MB/s  ({n_records} records, peak {peak / 2**20:.1f} MiB)")
+
+        try:
+            from Bio import SeqIO
+        except ImportError:
+            return results
+        plain = paths[0]
+        size_mb = os.path.getsize(plain) / 1e6
+        seconds, peak, _ = _measure(lambda: sum(1 for _ in SeqIO.parse(plain, 'fasta')))
+        results['SeqIO'] = {'megabytes': size_mb, 'seconds': seconds, 'peak_bytes': peak}
+        print(f"{'Bio.SeqIO.parse':<22} {size_mb:8.1f} MB  {'':>26}  "
+              f"SeqIO      {size_mb / seconds:8.1f} MB/s  (peak {peak / 2**20:.1f} MiB)")
+        return results
+
+
+if __name__ == '__main__':
+    import sys
+
+    benchmark_fasta_reader(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Parallel streaming fingerprint generation for large SMILES libraries.
+
+Reads .smi or .csv files row by row, fingerprints chunks of molecules on a
+process pool and writes packed bits into fixed-size shards:
+
+    shard-00000.fp    packed uint8 rows (n_bits / 8 bytes each)
+    shard-00000.ids   one "id<TAB>smiles" line per row
+    rejects.smi       rows RDKit could not parse
+    manifest.json     n_bits, radius and the row count of every shard
+"""
+
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .fingerprint_store import N_BITS, RADIUS, packed_fingerprint_from_mol
+
+
+# Function to stream (id, smiles) pairs from a .smi or .csv file
+def iter_smiles(path, smiles_column='smiles', id_column=None):
+    with open(path, newline='') as handle:
+        if path.endswith('.csv'):
+            for row_number, row in enumerate(csv.DictReader(handle)):
+                mol_id = row[id_column] if id_column else str(row_number)
+                yield mol_id, row[smiles_column]
+        else:
+            # .smi: SMILES first, then an optional ID; any further columns are ignored
+            for row_number, line in enumerate(handle):
+                parts = line.split(None, 2)
+                if not parts:
+                    continue
+                mol_id = parts[1] if len(parts) > 1 else str(row_number)
+                yield mol_id, parts[0]
+
+
+# Function to group an iterator into lists of at most chunk_size items
+def iter_chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Worker: fingerprint one chunk, returning kept ids/smiles, packed rows and rejects
+def _fingerprint_chunk(chunk, n_bits, radius):
+    from rdkit import Chem, RDLogger
+
+    RDLogger.DisableLog('rdApp.*')
+    kept, rows, rejects = [], [], []
+    for mol_id, smiles in chunk:
+        try:
+            mol = Chem.MolFromSmiles(smiles)
+        except Exception as e:
+            mol, reason = None, str(e)
+        else:
+            reason = 'unparseable SMILES'
+        if mol is None:
+            rejects.append((mol_id, smiles, reason))
+            continue
+        kept.append((mol_id, smiles))
+        rows.append(packed_fingerprint_from_mol(mol, n_bits=n_bits, radius=radius))
+    packed = np.stack(rows) if rows else np.zeros((0, n_bits // 8), dtype=np.uint8)
+    return kept, packed, rejects
+
+
+# IDs are written as the first tab-separated field of a line, so tabs and newlines in them become spaces
+_ID_ESCAPES = str.maketrans({'\t': ' ', '\n': ' ', '\r': ' '})
+
+
+class ShardWriter:
+    def __init__(self, output_dir, n_bits=N_BITS, radius=RADIUS, shard_size=1_000_000):
+        self.output_dir = output_dir
+        self.n_bits = n_bits
+        self.radius = radius
+        self.shard_size = shard_size
+        self.shards = []
+        self._bits_file = None
+        self._ids_file = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _open_shard(self):
+        name = f'shard-{len(self.shards):05d}'
+        self._bits_file = open(os.path.join(self.output_dir, name + '.fp'), 'wb')
+        self._ids_file = open(os.path.join(self.output_dir, name + '.ids'), 'w')
+        self.shards.append({'name': name, 'rows': 0})
+
+    def _close_shard(self):
+        if self._bits_file is not None:
+            self._bits_file.close()
+            self._ids_file.close()
+            self._bits_file = self._ids_file = None
+
+    def write(self, kept, packed):
+        start = 0
+        while start < len(kept):
+            if self._bits_file is None or self.shards[-1]['rows'] >= self.shard_size:
+                self._close_shard()
+                self._open_shard()
+            take = min(len(kept) - start, self.shard_size - self.shards[-1]['rows'])
+            self._bits_file.write(packed[start:start + take].tobytes())
+            self._ids_file.write(''.join(f'{str(mol_id).translate(_ID_ESCAPES)}\t{smiles}\n'
+                                         for mol_id, smiles in kept[start:start + take]))
+            self.shards[-1]['rows'] += take
+            start += take
+
+    def close(self):
+        self._close_shard()
+        manifest = {'n_bits': self.n_bits, 'radius': self.radius, 'shards': self.shards}
+        with open(os.path.join(self.output_dir, 'manifest.json'), 'w') as handle:
+            json.dump(manifest, handle, indent=1)
+        return manifest
+
+
+# Function to iterate (ids, smiles, packed rows) per shard of a fingerprint directory
+def read_shards(output_dir):
+    with open(os.path.join(output_dir, 'manifest.json')) as handle:
+        manifest = json.load(handle)
+    row_bytes = manifest['n_bits'] // 8
+    for shard in manifest['shards']:
+        base = os.path.join(output_dir, shard['name'])
+        with open(base + '.ids') as ids_file:
+            pairs = [line.rstrip('\n').split('\t', 1) for line in ids_file]
+        ids = [pair[0] for pair in pairs]
+        smiles = [pair[1] for pair in pairs]
+        if shard['rows'] == 0:
+            packed = np.zeros((0, row_bytes), dtype=np.uint8)
+        else:
+            packed = np.memmap(base + '.fp', dtype=np.uint8, mode='r', shape=(shard['rows'], row_bytes))
+        yield ids, smiles, packed
+
+
+# Function to fingerprint a whole SMILES library into packed-bit shards on all cores
+def fingerprint_library(input_path, output_dir, smiles_column='smiles', id_column=None,
+                        n_bits=N_BITS, radius=RADIUS, chunk_size=10_000, workers=None,
+                        shard_size=1_000_000, report_every=10):
+    workers = workers or os.cpu_count()
+    writer = ShardWriter(output_dir, n_bits=n_bits, radius=radius, shard_size=shard_size)
+    chunks = iter_chunks(iter_smiles(input_path, smiles_column, id_column), chunk_size)
+    counts = {'molecules': 0, 'rejected': 0, 'chunks': 0}
+    start = time.perf_counter()
+
+    with open(os.path.join(output_dir, 'rejects.smi'), 'w') as rejects_file, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+
+        def consume(future):
+            kept, packed, rejects = future.result()
+            writer.write(kept, packed)
+            rejects_file.writelines(f'{smiles}\t{mol_id}\t{reason}\n' for mol_id, smiles, reason in rejects)
+            counts['molecules'] += len(kept) + len(rejects)
+            counts['rejected'] += len(rejects)
+            counts['chunks'] += 1
+            if report_every and counts['chunks'] % report_every == 0:
+                rate = counts['molecules'] / (time.perf_counter() - start)
+                print(f"Fingerprinted {counts['molecules']} molecules ({rate:.0f} molecules/s)")
+
+        # Keep a bounded number of chunks in flight so memory does not grow with the library
+        in_flight = []
+        for chunk in chunks:
+            in_flight.append(pool.submit(_fingerprint_chunk, chunk, n_bits, radius))
+            if len(in_flight) >= 2 * workers:
+                consume(in_flight.pop(0))
+        for future in in_flight:
+            consume(future)
+
+    manifest = writer.close()
+    seconds = time.perf_counter() - start
+    n_done = counts['molecules']
+    stats = {
+        'molecules': n_done,
+        'rejected': counts['rejected'],
+        'shards': len(manifest['shards']),
+        'seconds': seconds,
+        'molecules_per_sec': n_done / seconds if seconds > 0 else 0.0,
+    }
+    print(f"Fingerprinted {n_done} molecules ({stats['rejected']} rejected) in {seconds:.1f}s "
+          f"({stats['molecules_per_sec']:.0f} molecules/s)")
+    return stats
+
+
+# Command-line entry point, also used by `bindai fingerprint-library`
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=prog, description="Fingerprint a SMILES library into packed-bit shards")
+    parser.add_argument('input_path')
+    parser.add_argument('output_dir')
+    parser.add_argument('--smiles-column', default='smiles')
+    parser.add_argument('--id-column')
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--shard-size', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+    fingerprint_library(args.input_path, args.output_dir, smiles_column=args.smiles_column,
+                        id_column=args.id_column, chunk_size=args.chunk_size,
+                        workers=args.workers, shard_size=args.shard_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""Packed-bit Morgan fingerprint store.
+
+Fingerprints are kept as packed uint8 bits (256 bytes for 2048 bits) in an
+append-only, memory-mapped file keyed by canonical SMILES, with an
+in-process LRU in front so repeated lookups skip RDKit entirely.
+
+A store is three files: <path>.fp (packed rows), <path>.keys (one canonical
+SMILES per line, line i is row i) and <path>.json (n_bits and radius),
+which is checked on open. Rows are appended to .fp before .keys. After a
+crash between the two writes, both files are truncated to the rows they
+have in common when the store is reopened.
+"""
+
+import json
+import os
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from .tracing import traced
+
+N_BITS = 2048
+RADIUS = 2
+
+
+# Function to return a Morgan fingerprint generator (cached per radius/size)
+@lru_cache(maxsize=None)
+def _morgan_generator(radius, n_bits):
+    from rdkit.Chem import rdFingerprintGenerator
+
+    return rdFingerprintGenerator.GetMorganGenerator(radius=radius, fpSize=n_bits)
+
+
+# Function to canonicalize a SMILES string, returning None when RDKit cannot parse it
+def canonical_smiles(smiles):
+    from rdkit import Chem
+
+    mol = Chem.MolFromSmiles(smiles)
+    return Chem.MolToSmiles(mol) if mol is not None else None
+
+
+# Function to compute a packed Morgan fingerprint from an RDKit molecule
+def packed_fingerprint_from_mol(mol, n_bits=N_BITS, radius=RADIUS):
+    bits = _morgan_generator(radius, n_bits).GetFingerprintAsNumPy(mol)
+    return np.packbits(bits)
+
+
+# Function to compute a packed Morgan fingerprint from SMILES (None for invalid SMILES)
+@traced('fingerprint')
+def packed_fingerprint(smiles, n_bits=N_BITS, radius=RADIUS):
+    from rdkit import Chem
+
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None
+    return packed_fingerprint_from_mol(mol, n_bits=n_bits, radius=radius)
+
+
+# Function to unpack (N, n_bits/8) packed rows into a float32 (N, n_bits) batch
+def unpack_fingerprints(packed, n_bits=N_BITS, out=None):
+    packed = np.asarray(packed, dtype=np.uint8).reshape(-1, n_bits // 8)
+    if out is None:
+        out = np.empty((len(packed), n_bits), dtype=np.float32)
+    out[:len(packed)] = np.unpackbits(packed, axis=1, count=n_bits)
+    return out
+
+
+@lru_cache(maxsize=100_000)
+def _cached_packed_fingerprint(smiles, n_bits, radius):
+    packed = packed_fingerprint(smiles, n_bits=n_bits, radius=radius)
+    return None if packed is None else packed.tobytes()
+
+
+# Function to generate molecular fingerprints from SMILES, memoized per SMILES string
+def generate_fingerprint(smiles, n_bits=N_BITS, radius=RADIUS):
+    packed = _cached_packed_fingerprint(smiles, n_bits, radius)
+    if packed is None:
+        print(f"Invalid SMILES string: {smiles}")
+        return np.zeros((n_bits,), dtype=np.float32)
+    return unpack_fingerprints(np.frombuffer(packed, dtype=np.uint8), n_bits)[0]
+
+
+class FingerprintStore:
+    def __init__(self, path, n_bits=N_BITS, radius=RADIUS, lru_size=100_000):
+        if n_bits % 8:
+            raise ValueError("n_bits must be a multiple of 8")
+        self.n_bits = n_bits
+        self.radius = radius
+        self.row_bytes = n_bits // 8
+        self.bits_path = path + '.fp'
+        self.keys_path = path + '.keys'
+        self.params_path = path + '.json'
+        directory = os.path.dirname(self.bits_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._check_params()
+
+        # Row number of each canonical SMILES; line i of the keys file is row i
+        self.rows = {}
+        self._recover()
+        self._bits = None
+        self._remap()
+
+        # Raw input SMILES -> row (-1 for invalid), so hits never reach RDKit
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Function to check the stored fingerprint parameters against the requested ones (recording them if new)
+    def _check_params(self):
+        params = {'n_bits': self.n_bits, 'radius': self.radius}
+        if os.path.exists(self.params_path):
+            with open(self.params_path) as handle:
+                stored = json.load(handle)
+            if stored != params:
+                raise ValueError(f"Fingerprint store {self.params_path} holds n_bits={stored['n_bits']}, "
+                                 f"radius={stored['radius']}; requested n_bits={self.n_bits}, radius={self.radius}")
+            return
+        with open(self.params_path + '.tmp', 'w') as handle:
+            json.dump(params, handle)
+        os.replace(self.params_path + '.tmp', self.params_path)
+
+    # Function to load the keys, truncating .fp and .keys to the complete rows they have in common
+    def _recover(self):
+        lines = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path) as handle:
+                lines = handle.readlines()
+        # A last line without its newline is a torn write
+        keys = [line[:-1] for line in lines if line.endswith('\n')]
+        bits_rows = os.path.getsize(self.bits_path) // self.row_bytes if os.path.exists(self.bits_path) else 0
+        n_rows = min(len(keys), bits_rows)
+        if os.path.exists(self.bits_path) and os.path.getsize(self.bits_path) != n_rows * self.row_bytes:
+            os.truncate(self.bits_path, n_rows * self.row_bytes)
+        if n_rows < len(lines):
+            with open(self.keys_path + '.tmp', 'w') as handle:
+                handle.write(''.join(key + '\n' for key in keys[:n_rows]))
+            os.replace(self.keys_path + '.tmp', self.keys_path)
+        self.rows = {key: row for row, key in enumerate(keys[:n_rows])}
+
+    def __contains__(self, smiles):
+        return self.lookup(smiles, compute=False) >= 0
+
+    def _remap(self):
+        n_rows = len(self.rows)
+        if n_rows == 0:
+            self._bits = np.zeros((0, self.row_bytes), dtype=np.uint8)
+            return
+        self._bits = np.memmap(self.bits_path, dtype=np.uint8, mode='r', shape=(n_rows, self.row_bytes))
+
+    def _remember(self, smiles, row):
+        self._lru[smiles] = row
+        self._lru.move_to_end(smiles)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    # Function to append new canonical SMILES and their packed fingerprints to disk
+    def _append(self, keys, packed_rows):
+        with open(self.bits_path, 'ab') as bits_file:
+            bits_file.write(np.ascontiguousarray(packed_rows, dtype=np.uint8).tobytes())
+        with open(self.keys_path, 'a') as keys_file:
+            keys_file.write(''.join(key + '\n' for key in keys))
+        for key in keys:
+            self.rows[key] = len(self.rows)
+        self._remap()
+
+    # Function to resolve many SMILES to rows, fingerprinting and storing any misses
+    def lookup_many(self, smiles_list, compute=True):
+        from rdkit import Chem
+
+        rows = np.full(len(smiles_list), -1, dtype=np.int64)
+        new_keys, new_rows, pending = [], [], {}
+        for i, smiles in enumerate(smiles_list):
+            row = self._lru.get(smiles)
+            if row is not None:
+                self._lru.move_to_end(smiles)
+                rows[i] = row
+                continue
+
+            mol = Chem.MolFromSmiles(smiles)
+            if mol is None:
+                self._remember(smiles, -1)
+                continue
+            key = Chem.MolToSmiles(mol)
+            if key in self.rows:
+                rows[i] = self.rows[key]
+                self._remember(smiles, rows[i])
+            elif compute:
+                if key not in pending:
+                    pending[key] = len(self.rows) + len(new_keys)
+                    new_keys.append(key)
+                    new_rows.append(packed_fingerprint_from_mol(mol, self.n_bits, self.radius))
+                rows[i] = pending[key]
+                self._remember(smiles, rows[i])
+
+        if new_keys:
+            self._append(new_keys, np.stack(new_rows))
+        return rows
+
+    def lookup(self, smiles, compute=True):
+        return int(self.lookup_many([smiles], compute=compute)[0])
+
+    # Function to return packed fingerprint rows for many SMILES (zeros for invalid SMILES)
+    def get_packed(self, smiles_list):
+        rows = self.lookup_many(smiles_list)
+        packed = np.zeros((len(rows), self.row_bytes), dtype=np.uint8)
+        valid = rows >= 0
+        packed[valid] = self._bits[rows[valid]]
+        return packed
+
+    # Function to return a ready-to-feed float32 (N, n_bits) batch for many SMILES
+    def get_batch(self, smiles_list, out=None):
+        return unpack_fingerprints(self.get_packed(smiles_list), self.n_bits, out=out)
+
+    def get(self, smiles):
+        return self.get_batch([smiles])[0]
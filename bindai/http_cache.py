@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""Persistent SQLite cache for HTTP responses from NCBI, PubChem and ChEMBL.
+
+Responses are keyed by method plus a normalized URL. The scheme and host
+are lower-cased, query and form parameters are merged and sorted, and
+credentials and contact parameters (api_key, email, tool) are dropped, so
+the same request made with a different key still hits. Only successful
+responses are stored, each with an expiry time (ttl=None never expires).
+
+In cache-only mode (BINDAI_OFFLINE=1, as for the structure cache) nothing
+touches the network: an entry is served even when expired, and a miss
+raises CacheMissError. Hit, stale-hit, miss and store counts are kept per
+host for the life of the process.
+
+Network fetches that fail with HTTP 429/5xx or a connection error are
+retried with exponential backoff and jitter, honouring a Retry-After header.
+
+The default database is ./http_cache.sqlite, or $BINDAI_HTTP_CACHE.
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+DEFAULT_CACHE_PATH = os.environ.get('BINDAI_HTTP_CACHE', './http_cache.sqlite')
+DEFAULT_TTL = 30 * 24 * 3600
+# Passed as ttl to use the cache's default_ttl
+USE_DEFAULT_TTL = object()
+# Parameters that identify the caller rather than the resource
+EXCLUDED_PARAMS = frozenset({'api_key', 'email', 'tool'})
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+
+
+class CacheMissError(LookupError):
+    pass
+
+
+# Function to build the cache key for a request: METHOD scheme://host/path?sorted&params
+def cache_key(method, url, params=None):
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    query += [(key, str(value)) for key, value in (params or {}).items()]
+    query = sorted((key, value) for key, value in query if key not in EXCLUDED_PARAMS)
+    path = parts.path or '/'
+    return (f"{method.upper()} {parts.scheme.lower()}://{parts.netloc.lower()}{path}"
+            f"?{urllib.parse.urlencode(query)}")
+
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, default_ttl=DEFAULT_TTL, cache_only=None):
+        self.path = path
+        self.default_ttl = default_ttl
+        # Cache-only mode defaults to the BINDAI_OFFLINE env var, like StructureCache
+        self.cache_only = os.environ.get('BINDAI_OFFLINE') == '1' if cache_only is None else cache_only
+        self.stats = defaultdict(lambda: {'hits': 0, 'stale_hits': 0, 'misses': 0, 'stores': 0})
+        self._lock = threading.Lock()
+        self._last_request = {}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY, host TEXT, body BLOB, content_type TEXT,'
+                ' fetched_at REAL, expires_at REAL)')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _count(self, key, outcome):
+        self.stats[urllib.parse.urlsplit(key.split(' ', 1)[1]).netloc][outcome] += 1
+
+    # Function to return a cached body (or None), counting hits and misses; expired entries only serve offline
+    def lookup(self, method, url, params=None):
+        key = cache_key(method, url, params)
+        with self._lock:
+            row = self._db.execute('SELECT body, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            body, expires_at = row
+            if expires_at is None or expires_at > time.time():
+                self._count(key, 'hits')
+                return body
+            if self.cache_only:
+                self._count(key, 'stale_hits')
+                return body
+        self._count(key, 'misses')
+        if self.cache_only:
+            raise CacheMissError(f"{key} is not in the HTTP cache and cache-only mode is on")
+        return None
+
+    # Function to store a successful response body
+    def store(self, method, url, params, body, ttl=USE_DEFAULT_TTL, content_type=None):
+        key = cache_key(method, url, params)
+        ttl = self.default_ttl if ttl is USE_DEFAULT_TTL else ttl
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, urllib.parse.urlsplit(url).netloc.lower(), sqlite3.Binary(body), content_type,
+                              now, None if ttl is None else now + ttl))
+        self._count(key, 'stores')
+
+    # Function to GET or POST through the cache, returning the response body.
+    # min_interval spaces network requests to one host; cache hits are never delayed.
+    # Transient failures are retried up to max_retries times; other HTTP errors are raised at once.
+    def fetch(self, url, params=None, method='GET', ttl=USE_DEFAULT_TTL, timeout=30.0, headers=None,
+              min_interval=0.0, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF):
+        body = self.lookup(method, url, params)
+        if body is not None:
+            return body
+        data = urllib.parse.urlencode(params or {}).encode()
+        if method.upper() == 'POST':
+            request = urllib.request.Request(url, data=data, headers=headers or {})
+        else:
+            separator = '&' if urllib.parse.urlsplit(url).query else '?'
+            request = urllib.request.Request(f"{url}{separator}{data.decode()}" if params else url,
+                                             headers=headers or {})
+        for attempt in range(max_retries + 1):
+            self._wait_turn(url, min_interval)
+            retry_after = None
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    body = response.read()
+                    content_type = response.headers.get('Content-Type')
+                break
+            except urllib.error.HTTPError as exc:
+                if exc.code not in RETRY_STATUSES or attempt == max_retries:
+                    raise
+                retry_after = exc.headers.get('Retry-After')
+            except (urllib.error.URLError, TimeoutError, ConnectionError):
+                if attempt == max_retries:
+                    raise
+            delay = backoff * 2 ** attempt + random.uniform(0, backoff)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            time.sleep(delay)
+        self.store(method, url, params, body, ttl=ttl, content_type=content_type)
+        return body
+
+    # Function to sleep until min_interval has passed since the last network request to a host
+    def _wait_turn(self, url, min_interval):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        wait = min_interval - (time.monotonic() - self._last_request.get(host, float('-inf')))
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request[host] = time.monotonic()
+
+    # Function to delete expired entries (or everything), returning the number removed
+    def purge(self, expired_only=True):
+        with self._lock, self._db:
+            if expired_only:
+                cursor = self._db.execute('DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?',
+                                          (time.time(),))
+            else:
+                cursor = self._db.execute('DELETE FROM responses')
+        return cursor.rowcount
+
+    # Function to summarize stored entries per host: (host, entries, bytes, expired)
+    def contents(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT host, COUNT(*), SUM(LENGTH(body)),'
+                ' SUM(CASE WHEN expires_at IS NOT NULL AND expires_at <= ? THEN 1 ELSE 0 END)'
+                ' FROM responses GROUP BY host ORDER BY host', (time.time(),)).fetchall()
+
+    def stats_table(self):
+        lines = [f"{'host':<36} {'hits':>7} {'stale':>7} {'misses':>7} {'stores':>7}"]
+        for host, counts in sorted(self.stats.items()):
+            lines.append(f"{host:<36} {counts['hits']:>7} {counts['stale_hits']:>7} {counts['misses']:>7} "
+                         f"{counts['stores']:>7}")
+        return '\n'.join(lines)
+
+
+_default_cache = None
+
+
+# Function to return the process-wide response cache
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
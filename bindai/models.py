@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Keras model definitions shared by the training and screening code.
+
+build_sequence_model reads residue tokens directly, instead of a sequence
+folded into a 32x32x32 grid. A masked embedding feeds 1D convolutions and
+then an LSTM or masked average pooling. Batched with
+sequences.bucket_batches, a typical protein needs a few hundred padded
+timesteps rather than 32768 voxels. benchmarks.benchmark_sequence_model
+compares the two.
+"""
+
+import tensorflow as tf
+from tensorflow.keras import layers, models
+from tensorflow.keras.layers import Input, concatenate
+
+from .sequences import RESIDUE_VOCAB_SIZE
+
+
+# Build the CNN model with drug input
+def build_cnn_with_drug_input(protein_input_shape, drug_input_shape):
+    # Protein input and CNN layers
+    protein_input = Input(shape=protein_input_shape)
+    x = layers.Conv3D(32, (3, 3, 3), activation='relu')(protein_input)
+    x = layers.MaxPooling3D((2, 2, 2))(x)
+    x = layers.Conv3D(64, (3, 3, 3), activation='relu')(x)
+    x = layers.MaxPooling3D((2, 2, 2))(x)
+    x = layers.Conv3D(128, (3, 3, 3), activation='relu')(x)
+    x = layers.GlobalMaxPooling3D()(x)
+
+    # Drug input and dense layers
+    drug_input = Input(shape=(drug_input_shape,))
+    drug_layer = layers.Dense(256, activation='relu')(drug_input)
+    drug_layer = layers.Dense(128, activation='relu')(drug_layer)
+
+    # Concatenate protein and drug layers
+    combined = concatenate([x, drug_layer])
+
+    # Final layers
+    combined = layers.Dense(256, activation='relu')(combined)
+    combined = layers.Dense(128, activation='relu')(combined)
+    output = layers.Dense(1, activation='sigmoid')(combined)
+
+    # Build model
+    model = models.Model(inputs=[protein_input, drug_input], outputs=output)
+    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    return model
+
+
+# bindai2.py's create_cnn: Conv3D over a sequence folded into the voxel grid
+def build_voxel_sequence_cnn(input_shape=(32, 32, 32, 1)):
+    model = models.Sequential()
+    model.add(Input(shape=input_shape))
+    model.add(layers.Conv3D(32, kernel_size=(3, 3, 3), activation='relu'))
+    model.add(layers.MaxPooling3D(pool_size=(2, 2, 2)))
+    model.add(layers.Conv3D(64, kernel_size=(3, 3, 3), activation='relu'))
+    model.add(layers.MaxPooling3D(pool_size=(2, 2, 2)))
+    model.add(layers.Flatten())
+    model.add(layers.Dense(128, activation='relu'))
+    model.add(layers.Dense(1, activation='sigmoid'))
+    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    return model
+
+
+# Conv1D that zeroes padded timesteps before convolving and passes the padding mask on,
+# so a padded sequence gives the same outputs at its real positions as the unpadded one
+@tf.keras.utils.register_keras_serializable(package='bindai')
+class MaskedConv1D(layers.Conv1D):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.supports_masking = True
+
+    def call(self, inputs, mask=None):
+        if mask is not None:
+            inputs = inputs * tf.cast(mask, inputs.dtype)[..., None]
+        return super().call(inputs)
+
+    def compute_mask(self, inputs, mask=None):
+        return mask
+
+
+# Build the sequence-native model on residue tokens (0 = padding), optionally with the drug fingerprint input
+def build_sequence_model(drug_input_shape=None, vocab_size=RESIDUE_VOCAB_SIZE, embedding_dim=32, filters=64,
+                         kernel_size=9, n_conv=2, lstm_units=0):
+    protein_input = Input(shape=(None,), dtype='int32')
+    x = layers.Embedding(vocab_size, embedding_dim, mask_zero=True)(protein_input)
+    for _ in range(n_conv):
+        x = MaskedConv1D(filters, kernel_size, padding='same', activation='relu')(x)
+    # Both the LSTM and the average pooling skip masked (padded) timesteps
+    x = layers.LSTM(lstm_units)(x) if lstm_units else layers.GlobalAveragePooling1D()(x)
+    inputs = [protein_input]
+
+    if drug_input_shape:
+        drug_input = Input(shape=(drug_input_shape,))
+        drug_layer = layers.Dense(256, activation='relu')(drug_input)
+        drug_layer = layers.Dense(128, activation='relu')(drug_layer)
+        x = concatenate([x, drug_layer])
+        inputs.append(drug_input)
+
+    x = layers.Dense(128, activation='relu')(x)
+    output = layers.Dense(1, activation='sigmoid')(x)
+    model = models.Model(inputs=inputs if drug_input_shape else protein_input, outputs=output)
+    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    return model
@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""Concurrent, rate-limited NCBI E-utilities client.
+
+The notebooks ran one blocking esearch per gene, serially, and never
+fetched the sequences. NCBIFetcher drives esearch -> epost -> efetch through
+the E-utilities history server from asyncio:
+
+    1. every search term is sent to esearch concurrently (idtype=acc)
+    2. the union of accessions is posted to the history server with epost
+       in batches of batch_size IDs
+    3. each posted batch is downloaded as FASTA with one efetch by
+       WebEnv/query_key
+
+A single large query can also be downloaded straight from its esearch
+history (fetch_query), in retstart/retmax pages.
+
+Every request waits on a token bucket (NCBI allows 3 requests/s, or 10/s
+with an API key). At most `concurrency` requests are in flight at once.
+Failures (HTTP 429/5xx, connection errors, NCBI's "API rate limit
+exceeded" body) are retried with exponential backoff and jitter, and a
+Retry-After header is honoured. HTTP runs on urllib in a small thread pool,
+so no extra dependency is needed. base_url can point at StubEutilsServer
+for offline testing.
+
+Searches and per-batch sequence downloads go through the shared HTTP
+response cache (http_cache), so a rebuild of the same dataset makes no
+requests. A batch is cached under the equivalent efetch-by-ID request,
+because WebEnv/query_key values only live for one session. History-paged
+queries (fetch_query) are not cached.
+
+    bindai ncbi-fetch --terms TP53[Gene] EGFR[Gene] --output proteins.fasta
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .http_cache import USE_DEFAULT_TTL, ResponseCache, default_cache
+
+EUTILS_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils'
+# NCBI's published limits, in requests per second
+RATE_WITHOUT_KEY = 3.0
+RATE_WITH_KEY = 10.0
+DEFAULT_CONCURRENCY = 8
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_MAX_PER_TERM = 20
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class NCBIError(RuntimeError):
+    pass
+
+
+class _RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    # Async token bucket; capacity 1 spaces requests evenly instead of allowing bursts
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+        self._lock = None
+
+    async def acquire(self):
+        # Created lazily so the lock belongs to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self.updated is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Function to split FASTA text into (accession, description, sequence) records
+def parse_fasta_records(text):
+    records = []
+    header, lines = None, []
+    for line in text.splitlines():
+        if line.startswith('>'):
+            if header is not None:
+                records.append((*_split_header(header), ''.join(lines)))
+            header, lines = line[1:].strip(), []
+        elif header is not None:
+            lines.append(line.strip())
+    if header is not None:
+        records.append((*_split_header(header), ''.join(lines)))
+    return records
+
+
+def _split_header(header):
+    accession, _, description = header.partition(' ')
+    return accession, description
+
+
+class NCBIFetcher:
+    def __init__(self, api_key=None, email=None, tool='bindai', base_url=EUTILS_URL, rate=None,
+                 concurrency=DEFAULT_CONCURRENCY, batch_size=DEFAULT_BATCH_SIZE, max_retries=5, backoff=0.5,
+                 timeout=30.0, cache=None, ttl=USE_DEFAULT_TTL):
+        self.api_key = api_key if api_key is not None else os.environ.get('NCBI_API_KEY')
+        self.email = email
+        self.tool = tool
+        self.base_url = base_url.rstrip('/')
+        self.rate = rate or (RATE_WITH_KEY if self.api_key else RATE_WITHOUT_KEY)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.stats = {'requests': 0, 'retries': 0}
+        # cache=None uses the shared response cache, cache=False disables caching
+        self.cache = default_cache() if cache is None else (cache or None)
+        self.ttl = ttl
+        # Set per event loop by run()
+        self._bucket = self._slots = self._executor = None
+
+    # Function to send one blocking E-utilities request (runs on a worker thread)
+    def _http(self, endpoint, params, post):
+        params = dict(params, tool=self.tool)
+        if self.email:
+            params['email'] = self.email
+        if self.api_key:
+            params['api_key'] = self.api_key
+        url = f'{self.base_url}/{endpoint}.fcgi'
+        data = urllib.parse.urlencode(params).encode()
+        request = urllib.request.Request(url, data=data) if post else urllib.request.Request(f'{url}?{data.decode()}')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+        except urllib.error.HTTPError as exc:
+            if exc.code in RETRY_STATUSES:
+                raise _RetryableError(f"HTTP {exc.code} from {endpoint}", exc.headers.get('Retry-After'))
+            raise NCBIError(f"HTTP {exc.code} from {endpoint}: {exc.read()[:200]!r}")
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as exc:
+            raise _RetryableError(f"{endpoint} request failed: {exc}")
+        # NCBI sometimes reports throttling in a 200 response
+        if b'API rate limit exceeded' in body[:200]:
+            raise _RetryableError(f"Rate limit exceeded on {endpoint}")
+        return body
+
+    # Function to return a cached response body, or None (raises CacheMissError in cache-only mode)
+    def _cached(self, endpoint, params):
+        if self.cache is None:
+            return None
+        return self.cache.lookup('GET', f'{self.base_url}/{endpoint}.fcgi', params)
+
+    def _store(self, endpoint, params, body):
+        if self.cache is not None:
+            self.cache.store('GET', f'{self.base_url}/{endpoint}.fcgi', params, body, ttl=self.ttl)
+
+    # Function to run one rate-limited request with retries and exponential backoff.
+    # Requests without session state (no history server) are served from and stored in the cache.
+    async def _request(self, endpoint, params, post=False):
+        cacheable = 'usehistory' not in params and 'WebEnv' not in params and endpoint != 'epost'
+        if cacheable:
+            body = self._cached(endpoint, params)
+            if body is not None:
+                return body
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            async with self._slots:
+                self.stats['requests'] += 1
+                try:
+                    body = await loop.run_in_executor(self._executor, self._http, endpoint, params, post)
+                except _RetryableError as exc:
+                    error = exc
+                else:
+                    if cacheable:
+                        self._store(endpoint, params, body)
+                    return body
+            if attempt == self.max_retries:
+                break
+            self.stats['retries'] += 1
+            delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+            if error.retry_after and error.retry_after.isdigit():
+                delay = max(delay, float(error.retry_after))
+            await asyncio.sleep(delay)
+        raise NCBIError(f"{error} (gave up after {self.max_retries + 1} attempts)")
+
+    # Function to run a coroutine with this fetcher's rate limiter, concurrency slots and thread pool
+    def run(self, coroutine_fn, *args, **kwargs):
+        async def runner():
+            self._bucket = TokenBucket(self.rate)
+            self._slots = asyncio.Semaphore(self.concurrency)
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='ncbi') as executor:
+                self._executor = executor
+                return await coroutine_fn(*args, **kwargs)
+        return asyncio.run(runner())
+
+    # Function to run esearch, returning {'count', 'ids', 'webenv', 'query_key'}
+    async def esearch(self, term, db='protein', retmax=DEFAULT_MAX_PER_TERM, use_history=False):
+        params = {'db': db, 'term': term, 'retmax': retmax, 'retmode': 'json', 'idtype': 'acc'}
+        if use_history:
+            params['usehistory'] = 'y'
+        result = json.loads(await self._request('esearch', params))['esearchresult']
+        if 'ERROR' in result:
+            raise NCBIError(f"esearch failed for {term!r}: {result['ERROR']}")
+        return {'count': int(result.get('count', 0)), 'ids': result.get('idlist', []),
+                'webenv': result.get('webenv'), 'query_key': result.get('querykey')}
+
+    # Function to post IDs to the history server, returning (webenv, query_key)
+    async def epost(self, ids, db='protein'):
+        root = ET.fromstring(await self._request('epost', {'db': db, 'id': ','.join(ids)}, post=True))
+        error = root.findtext('ERROR')
+        if error:
+            raise NCBIError(f"epost failed: {error}")
+        return root.findtext('WebEnv'), root.findtext('QueryKey')
+
+    # Function to download records from the history server
+    async def efetch(self, webenv, query_key, db='protein', retstart=0, retmax=DEFAULT_BATCH_SIZE, rettype='fasta'):
+        params = {'db': db, 'WebEnv': webenv, 'query_key': query_key, 'retstart': retstart, 'retmax': retmax,
+                  'rettype': rettype, 'retmode': 'text'}
+        return (await self._request('efetch', params, post=True)).decode()
+
+    # Function to fetch FASTA records for a list of accessions: epost + efetch per batch, batches concurrent
+    async def fetch_ids(self, ids, db='protein'):
+        async def fetch_batch(batch):
+            # Cached under the equivalent efetch-by-ID request; the WebEnv is only valid for this session
+            key_params = {'db': db, 'id': ','.join(batch), 'rettype': 'fasta', 'retmode': 'text'}
+            cached = self._cached('efetch', key_params)
+            if cached is not None:
+                return parse_fasta_records(cached.decode())
+            webenv, query_key = await self.epost(batch, db=db)
+            text = await self.efetch(webenv, query_key, db=db, retmax=len(batch))
+            self._store('efetch', key_params, text.encode())
+            return parse_fasta_records(text)
+
+        batches = [ids[i:i + self.batch_size] for i in range(0, len(ids), self.batch_size)]
+        records = {}
+        for batch_records in await asyncio.gather(*(fetch_batch(batch) for batch in batches)):
+            for accession, description, sequence in batch_records:
+                records[accession] = (accession, description, sequence)
+        return records
+
+    # Function to fetch every record matching one query, paging through its esearch history
+    async def fetch_query(self, term, db='protein', max_records=None):
+        search = await self.esearch(term, db=db, retmax=0, use_history=True)
+        total = search['count'] if max_records is None else min(search['count'], max_records)
+        pages = await asyncio.gather(*(
+            self.efetch(search['webenv'], search['query_key'], db=db, retstart=start,
+                        retmax=min(self.batch_size, total - start))
+            for start in range(0, total, self.batch_size)))
+        return [record for page in pages for record in parse_fasta_records(page)]
+
+    # Function to fetch up to max_per_term records for each search term, returning {term: [records]}
+    async def fetch_terms(self, terms, db='protein', max_per_term=DEFAULT_MAX_PER_TERM):
+        terms = list(dict.fromkeys(terms))
+        searches = await asyncio.gather(*(self.esearch(term, db=db, retmax=max_per_term) for term in terms))
+        ids = list(dict.fromkeys(accession for search in searches for accession in search['ids']))
+        records = await self.fetch_ids(ids, db=db)
+        # Accessions from esearch may lack the version suffix that FASTA headers carry
+        by_base = {accession.split('.')[0]: record for accession, record in records.items()}
+
+        def lookup(accession):
+            return records.get(accession) or by_base.get(accession.split('.')[0])
+        return {term: [record for record in map(lookup, search['ids']) if record is not None]
+                for term, search in zip(terms, searches)}
+
+
+# Function to fetch protein records for gene/search terms without managing an event loop
+def fetch_gene_sequences(terms, api_key=None, max_per_term=DEFAULT_MAX_PER_TERM, db='protein', **options):
+    fetcher = NCBIFetcher(api_key=api_key, **options)
+    return fetcher.run(fetcher.fetch_terms, terms, db=db, max_per_term=max_per_term)
+
+
+# Function to fetch protein records by accession (the batched form of cnn.py's fetch_protein_sequences)
+def fetch_sequences(ids, api_key=None, db='protein', **options):
+    fetcher = NCBIFetcher(api_key=api_key, **options)
+    return fetcher.run(fetcher.fetch_ids, list(ids), db=db)
+
+
+class StubEutilsServer(ThreadingHTTPServer):
+    # Local stand-in for esearch/epost/efetch with deterministic records, latency and injected failures
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.05, records_per_term=1000, fail_every=0,
+                 sequence_length=400):
+        super().__init__(address, StubEutilsHandler)
+        self.latency = latency
+        self.records_per_term = records_per_term
+        self.fail_every = fail_every
+        self.sequence_length = sequence_length
+        self.history = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='stub-eutils', daemon=True).start()
+        return self
+
+    # Function to return the deterministic accession list for a search term
+    def search_ids(self, term):
+        prefix = zlib.crc32(term.encode()) % 1_000_000
+        return [f'XP_{prefix:06d}{i:04d}.1' for i in range(self.records_per_term)]
+
+    def store(self, ids):
+        with self.lock:
+            query_key = str(len(self.history) + 1)
+            self.history[query_key] = ids
+        return query_key
+
+
+class StubEutilsHandler(BaseHTTPRequestHandler):
+    AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+    def _params(self):
+        query = urllib.parse.urlsplit(self.path).query
+        if self.command == 'POST':
+            query = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        return {key: values[-1] for key, values in urllib.parse.parse_qs(query).items()}
+
+    def _send(self, status, body, content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fasta(self, accession):
+        rng = random.Random(zlib.crc32(accession.encode()))
+        sequence = ''.join(rng.choice(self.AMINO_ACIDS) for _ in range(self.server.sequence_length))
+        lines = [sequence[i:i + 70] for i in range(0, len(sequence), 70)]
+        return f">{accession} stub protein {accession}\n" + '\n'.join(lines) + '\n'
+
+    def _handle(self):
+        server = self.server
+        params = self._params()
+        endpoint = urllib.parse.urlsplit(self.path).path.rsplit('/', 1)[-1]
+        with server.lock:
+            server.requests += 1
+            failing = server.fail_every and server.requests % server.fail_every == 0
+        time.sleep(server.latency)
+        if failing:
+            self._send(503, b'Service unavailable')
+        elif endpoint == 'esearch.fcgi':
+            ids = server.search_ids(params.get('term', ''))
+            result = {'count': str(len(ids)), 'idlist': ids[:int(params.get('retmax', 20))]}
+            if params.get('usehistory') == 'y':
+                result.update(webenv='STUB', querykey=server.store(ids))
+            self._send(200, json.dumps({'esearchresult': result}).encode(), 'application/json')
+        elif endpoint == 'epost.fcgi':
+            query_key = server.store(params.get('id', '').split(','))
+            body = f'<ePostResult><QueryKey>{query_key}</QueryKey><WebEnv>STUB</WebEnv></ePostResult>'
+            self._send(200, body.encode(), 'text/xml')
+        elif endpoint == 'efetch.fcgi':
+            ids = server.history.get(params.get('query_key'), [])
+            start = int(params.get('retstart', 0))
+            ids = ids[start:start + int(params.get('retmax', 20))]
+            self._send(200, ''.join(self._fasta(accession) for accession in ids).encode())
+        else:
+            self._send(404, b'Unknown endpoint')
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Benchmark the notebook's serial one-esearch-per-gene loop against the async fetcher on a stub server
+def benchmark_fetcher(n_terms=180, latency=0.2, rate=RATE_WITH_KEY, concurrency=DEFAULT_CONCURRENCY,
+                      fail_every=25):
+    server = StubEutilsServer(latency=latency, fail_every=fail_every).start()
+    terms = [f'GENE{i}[Gene]' for i in range(n_terms)]
+    try:
+        # The notebook loop: blocking esearch per gene, IDs only, no sequences
+        serial = NCBIFetcher(base_url=server.url, rate=1e9, concurrency=1, backoff=0.05, cache=False)
+        start = time.perf_counter()
+        serial.run(lambda: _serial_searches(serial, terms))
+        serial_seconds = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResponseCache(os.path.join(cache_dir, 'http_cache.sqlite'))
+            fetcher = NCBIFetcher(base_url=server.url, rate=rate, concurrency=concurrency, backoff=0.05, cache=cache)
+            start = time.perf_counter()
+            results = fetcher.run(fetcher.fetch_terms, terms)
+            async_seconds = time.perf_counter() - start
+
+            # A rebuild of the same dataset is served entirely from the response cache
+            rerun = NCBIFetcher(base_url=server.url, rate=rate, concurrency=concurrency, cache=cache)
+            start = time.perf_counter()
+            rerun.run(rerun.fetch_terms, terms)
+            cached_seconds = time.perf_counter() - start
+            cache.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    n_records = sum(len(records) for records in results.values())
+    print(f"serial esearch loop : {serial_seconds:7.2f} s  ({n_terms} terms, IDs only)")
+    print(f"async fetcher       : {async_seconds:7.2f} s  ({n_records} sequences, {fetcher.stats['requests']} "
+          f"requests, {fetcher.stats['retries']} retries, {rate:g} req/s limit)")
+    print(f"cached rerun        : {cached_seconds:7.2f} s  ({rerun.stats['requests']} requests)")
+    return {'serial_seconds': serial_seconds, 'async_seconds': async_seconds, 'cached_seconds': cached_seconds,
+            'records': n_records,
+            'requests': fetcher.stats['requests'], 'retries': fetcher.stats['retries']}
+
+
+async def _serial_searches(fetcher, terms):
+    return [await fetcher.esearch(term) for term in terms]
+
+
+# Command-line entry point, also used by `bindai ncbi-fetch`
+def main(argv=None, prog=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=prog, description="Fetch protein sequences from NCBI E-utilities")
+    parser.add_argument('--terms', nargs='+', default=[], help="Search terms, e.g. TP53[Gene]")
+    parser.add_argument('--terms-file', help="File with one search term per line")
+    parser.add_argument('--output', required=True, help="Output FASTA path")
+    parser.add_argument('--db', default='protein')
+    parser.add_argument('--max-per-term', type=int, default=DEFAULT_MAX_PER_TERM)
+    parser.add_argument('--api-key', help="NCBI API key (default: $NCBI_API_KEY)")
+    parser.add_argument('--email')
+    parser.add_argument('--base-url', default=EUTILS_URL)
+    parser.add_argument('--rate', type=float, help="Requests per second (default: NCBI's limit for the key)")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--cache', help="HTTP response cache path (default: $BINDAI_HTTP_CACHE or ./http_cache.sqlite)")
+    parser.add_argument('--no-cache', action='store_true', help="Always query NCBI")
+    parser.add_argument('--offline', action='store_true', help="Serve from the cache only; fail on a miss")
+    args = parser.parse_args(argv)
+    terms = list(args.terms)
+    if args.terms_file:
+        with open(args.terms_file) as handle:
+            terms += [line.strip() for line in handle if line.strip()]
+    if not terms:
+        parser.error("no search terms given")
+
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(args.cache) if args.cache else default_cache()
+        if args.offline:
+            cache.cache_only = True
+    start = time.perf_counter()
+    try:
+        results = fetch_gene_sequences(terms, api_key=args.api_key, max_per_term=args.max_per_term, db=args.db,
+                                       email=args.email, base_url=args.base_url, rate=args.rate,
+                                       concurrency=args.concurrency, batch_size=args.batch_size,
+                                       cache=cache if cache is not None else False)
+    except (NCBIError, LookupError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    written = set()
+    with open(args.output, 'w') as handle:
+        for term, records in results.items():
+            for accession, description, sequence in records:
+                if accession not in written:
+                    written.add(accession)
+                    handle.write(f">{accession} {description}\n{sequence}\n")
+    empty = [term for term, records in results.items() if not records]
+    print(f"Wrote {len(written)} sequences for {len(terms) - len(empty)} of {len(terms)} terms to {args.output} "
+          f"in {time.perf_counter() - start:.1f}s")
+    if cache is not None:
+        print(cache.stats_table())
+    return 1 if empty else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Fully-convolutional binding-site scan over whole proteins.
+
+The Conv3D tower of a build_cnn_with_drug_input model is run over large
+tiles of a fixed-resolution protein grid instead of over separate 32^3
+crops. A sliding max-pool replaces GlobalMaxPooling3D, so every crop whose
+origin lies on the tower's stride gets exactly the embedding it would get
+on its own, while overlapping crops share all convolution work. The head
+then scores each crop position against the drug embedding.
+
+Tiles are voxelized and convolved one at a time, so memory is bounded by
+the tile size rather than by the size of the assembly.
+"""
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+from .screening import split_model
+from .voxelizer import NUM_CHANNELS, AtomCellList, voxelize_box
+
+
+# Function to rebuild the protein tower without its global pooling for arbitrary grid sizes
+def build_trunk(protein_encoder):
+    tower = protein_encoder.layers[1:]
+    if not tower or not isinstance(tower[-1], layers.GlobalMaxPooling3D):
+        raise ValueError("Protein tower must end in GlobalMaxPooling3D")
+
+    crop_shape = protein_encoder.input.shape[1:]
+    trunk_input = layers.Input(shape=(None, None, None, crop_shape[-1]))
+    x = trunk_input
+    stride = 1
+    for layer in tower[:-1]:
+        if not isinstance(layer, (layers.Conv3D, layers.MaxPooling3D)):
+            raise ValueError(f"Unsupported layer in protein tower: {layer.name}")
+        if isinstance(layer, layers.Conv3D) and layer.padding != 'valid':
+            raise ValueError("Pocket scan needs 'valid' padding in the protein tower")
+        x = layer(x)
+        stride *= layer.strides[0]
+    trunk = models.Model(trunk_input, x, name='protein_trunk')
+
+    # Size of the feature map a single crop produces; this is the sliding window size
+    window = trunk.compute_output_shape((1,) + tuple(crop_shape))[1]
+    return trunk, stride, int(crop_shape[0]), int(window)
+
+
+class PocketScanner:
+    def __init__(self, model, spacing=1.0, tile_windows=8, cell_size=8.0):
+        if isinstance(model, str):
+            model = tf.keras.models.load_model(model)
+        self.protein_encoder, self.drug_encoder, self.head = split_model(model)
+        self.trunk, self.stride, self.crop_size, self.window = build_trunk(self.protein_encoder)
+        self.n_channels = self.protein_encoder.input.shape[-1]
+        if self.n_channels not in (1, NUM_CHANNELS):
+            raise ValueError(f"Unsupported number of input channels: {self.n_channels}")
+        self.spacing = spacing
+        self.tile_windows = tile_windows
+        self.cell_size = cell_size
+        self.window_pool = layers.MaxPooling3D(pool_size=self.window, strides=1)
+
+    # Function to compute crop embeddings for every stride-aligned crop inside one tile
+    def _tile_embeddings(self, atoms, cell_list, origin, tile_windows):
+        tile_shape = tuple(self.stride * (n - 1) + self.crop_size for n in tile_windows)
+        grid = voxelize_box(atoms, origin, tile_shape, spacing=self.spacing,
+                            typed=self.n_channels == NUM_CHANNELS, cell_list=cell_list)
+        features = self.trunk(grid[None], training=False)
+        return self.window_pool(features)[0]
+
+    # Function to scan a protein for one ligand, returning the score map, its origin and top-k sites
+    def scan(self, atoms, fingerprint, top_k=5, min_distance=8.0, padding=4.0):
+        coords = np.asarray(atoms['coords'], dtype=np.float32)
+        origin = coords.min(axis=0) - padding
+        extent = coords.max(axis=0) + padding - origin
+        crop_extent = self.crop_size * self.spacing
+        n_windows = np.maximum(np.floor((extent - crop_extent) / (self.stride * self.spacing)).astype(int) + 1, 1)
+
+        drug_embedding = self.drug_encoder(np.asarray(fingerprint, dtype=np.float32).reshape(1, -1), training=False)
+        cell_list = AtomCellList(coords, self.cell_size)
+        score_map = np.zeros(tuple(n_windows), dtype=np.float32)
+
+        for ix in range(0, n_windows[0], self.tile_windows):
+            for iy in range(0, n_windows[1], self.tile_windows):
+                for iz in range(0, n_windows[2], self.tile_windows):
+                    start = np.array([ix, iy, iz])
+                    counts = np.minimum(self.tile_windows, n_windows - start)
+                    tile_origin = origin + start * self.stride * self.spacing
+                    embeddings = self._tile_embeddings(atoms, cell_list, tile_origin, counts)
+                    flat = tf.reshape(embeddings, (-1, embeddings.shape[-1]))
+                    scores = self.head([flat, tf.repeat(drug_embedding, flat.shape[0], axis=0)], training=False)
+                    score_map[ix:ix + counts[0], iy:iy + counts[1], iz:iz + counts[2]] = \
+                        scores.numpy().reshape(tuple(counts))
+
+        return score_map, origin, self.top_sites(score_map, origin, top_k, min_distance)
+
+    # Function to return the centre (in Angstrom) of the crop at a score-map index
+    def window_center(self, index, origin):
+        return origin + (np.asarray(index) * self.stride + self.crop_size / 2) * self.spacing
+
+    # Function to pick the k best crop centres, suppressing neighbours closer than min_distance
+    def top_sites(self, score_map, origin, top_k=5, min_distance=8.0):
+        if top_k < 1:
+            raise ValueError(f"top_k must be at least 1, got {top_k}")
+        order = np.argsort(score_map, axis=None)[::-1]
+        sites = []
+        for flat_index in order:
+            center = self.window_center(np.unravel_index(flat_index, score_map.shape), origin)
+            if all(np.linalg.norm(center - site['center']) >= min_distance for site in sites):
+                sites.append({'center': center, 'score': float(score_map.flat[flat_index])})
+                if len(sites) == top_k:
+                    break
+        return sites
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""Quantized TFLite export of build_cnn_with_drug_input models for CPU nodes.
+
+Two parts of a saved model can be exported:
+
+    fused   the whole (voxels, fingerprint) -> score model
+    ligand  drug tower + head, taking a cached protein embedding and a
+            fingerprint; this is the part TwoTowerScreen runs per ligand
+
+Quantization is either dynamic-range (int8 weights, no calibration) or
+int8 with a calibration set of real voxel and fingerprint batches read from
+training TFRecords. Ops without an int8 kernel fall back to float.
+
+TFLite's builtin op set has no MaxPool3D, so the protein tower is exported
+with each MaxPooling3D rewritten as a 2-D pool over (height, width) followed
+by a max over depth pairs, which gives identical results.
+
+TFLite has no optimized CONV_3D kernel, so on CPU the fused export runs
+slower than Keras and is mainly useful where TensorFlow is unavailable.
+The speed-up comes from the ligand export, which QuantizedScreen uses.
+"""
+
+import argparse
+import glob
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+from .screening import split_model
+from .tracing import traced
+
+QUANTIZATION_MODES = ('float', 'dynamic', 'int8')
+BENCHMARK_BATCH_SIZES = (1, 64, 1024)
+
+
+class BuiltinMaxPooling3D(layers.Layer):
+    # MaxPooling3D with cubic pool and 'valid' padding written with TFLite builtin ops only
+    def __init__(self, pool_size, **kwargs):
+        super().__init__(**kwargs)
+        self.pool_size = pool_size
+
+    def call(self, x):
+        p = self.pool_size
+        shape = tf.shape(x)
+        batch, depth, height, width = shape[0], shape[1], shape[2], shape[3]
+        channels = x.shape[-1]
+        # Pool every depth slice in 2-D, then take the max over groups of p slices
+        y = tf.nn.max_pool2d(tf.reshape(x, (-1, height, width, channels)), p, p, 'VALID')
+        out_height, out_width = tf.shape(y)[1], tf.shape(y)[2]
+        y = tf.reshape(y, (batch, depth, out_height * out_width * channels))[:, :(depth // p) * p]
+        y = tf.reduce_max(tf.reshape(y, (batch, depth // p, p, out_height * out_width * channels)), axis=2)
+        return tf.reshape(y, (batch, depth // p, out_height, out_width, channels))
+
+    def compute_output_shape(self, input_shape):
+        spatial = tuple(None if n is None else n // self.pool_size for n in input_shape[1:4])
+        return (input_shape[0],) + spatial + (input_shape[4],)
+
+    def get_config(self):
+        config = super().get_config()
+        config['pool_size'] = self.pool_size
+        return config
+
+
+# Function to rebuild the protein tower with builtin-op pooling, sharing the original weights
+def _builtin_protein_tower(protein_encoder, protein_input):
+    x = protein_input
+    for layer in protein_encoder.layers[1:]:
+        if isinstance(layer, layers.MaxPooling3D):
+            pool = layer.pool_size
+            if len(set(pool)) != 1 or tuple(layer.strides) != tuple(pool) or layer.padding != 'valid':
+                raise ValueError(f"Only cubic, non-overlapping 'valid' pooling can be exported: {layer.name}")
+            x = BuiltinMaxPooling3D(pool[0], name=layer.name)(x)
+        else:
+            x = layer(x)
+    return x
+
+
+# Function to build the Keras model for one exportable part of a fused model
+def export_model(model, part='ligand'):
+    protein_encoder, drug_encoder, head = split_model(model)
+    fingerprint = layers.Input(shape=drug_encoder.input.shape[1:], name='fingerprint')
+    if part == 'fused':
+        protein_input = layers.Input(shape=protein_encoder.input.shape[1:], name='voxels')
+        protein_embedding = _builtin_protein_tower(protein_encoder, protein_input)
+    elif part == 'ligand':
+        protein_input = layers.Input(shape=head.inputs[0].shape[1:], name='protein_embedding')
+        protein_embedding = protein_input
+    else:
+        raise ValueError(f"Unknown part {part!r}; expected 'fused' or 'ligand'")
+    score = head([protein_embedding, drug_encoder(fingerprint)])
+    return models.Model([protein_input, fingerprint], score, name=f'{part}_export')
+
+
+# Function to draw calibration batches of real (voxels, fingerprints) from training TFRecords.
+# The records are read once without repeating, so no record appears in two batches.
+def calibration_batches(file_pattern, n_batches=32, batch_size=32, seed=0):
+    from .training_records import make_dataset
+
+    dataset = make_dataset(file_pattern, batch_size=batch_size, seed=seed, repeat=False)
+    batches = []
+    for (voxels, fingerprints), _ in dataset.take(n_batches):
+        batches.append((voxels.numpy(), fingerprints.numpy()))
+    return batches
+
+
+# Function to draw disjoint calibration and drift batches: from separate shards when the pattern
+# matches several files, otherwise from the two halves of a single unrepeated pass
+def split_calibration_batches(file_pattern, n_batches=32, batch_size=32, seed=0):
+    paths = sorted(glob.glob(file_pattern))
+    if not paths:
+        raise FileNotFoundError(f"No TFRecord files match {file_pattern}")
+    if len(paths) > 1:
+        half = len(paths) // 2
+        return (calibration_batches(paths[:half], n_batches, batch_size, seed),
+                calibration_batches(paths[half:], n_batches, batch_size, seed))
+    batches = calibration_batches(paths, 2 * n_batches, batch_size, seed)
+    half = min(n_batches, (len(batches) + 1) // 2)
+    return batches[:half], batches[half:]
+
+
+# Function to convert one part of a model to TFLite, returning the serialized flatbuffer
+def convert(model, part='ligand', mode='dynamic', calibration=None):
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {QUANTIZATION_MODES}")
+    if isinstance(model, str):
+        model = tf.keras.models.load_model(model)
+    part_model = export_model(model, part)
+    converter = tf.lite.TFLiteConverter.from_keras_model(part_model)
+
+    if mode != 'float':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'int8':
+        if not calibration:
+            raise ValueError("int8 quantization needs calibration batches")
+        protein_encoder = split_model(model)[0] if part == 'ligand' else None
+
+        def representative_dataset():
+            for voxels, fingerprints in calibration:
+                for i in range(len(voxels)):
+                    protein = voxels[i:i + 1]
+                    if protein_encoder is not None:
+                        protein = protein_encoder(protein, training=False).numpy()
+                    yield [protein.astype(np.float32), fingerprints[i:i + 1].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+    return converter.convert()
+
+
+# Function to export a saved model to a .tflite file
+def export_tflite(model, output_path, part='ligand', mode='dynamic', calibration=None):
+    flatbuffer = convert(model, part=part, mode=mode, calibration=calibration)
+    with open(output_path, 'wb') as handle:
+        handle.write(flatbuffer)
+    return output_path
+
+
+class TFLiteScorer:
+    # Runs an exported part on the CPU, resizing its inputs whenever the batch size changes
+    def __init__(self, model, num_threads=None):
+        if isinstance(model, (bytes, bytearray)):
+            self.interpreter = tf.lite.Interpreter(model_content=bytes(model), num_threads=num_threads)
+        else:
+            self.interpreter = tf.lite.Interpreter(model_path=model, num_threads=num_threads)
+        # Input order in the flatbuffer is not guaranteed; export_model names the fingerprint input
+        self.inputs = self.interpreter.get_input_details()
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch_size = None
+
+    def _resize(self, batch_size):
+        if batch_size == self.batch_size:
+            return
+        for detail in self.inputs:
+            self.interpreter.resize_tensor_input(detail['index'], [batch_size] + list(detail['shape'][1:]))
+        self.interpreter.allocate_tensors()
+        self.batch_size = batch_size
+
+    # Function to score one batch; protein is (N, 32, 32, 32, C) voxels or (N, D) embeddings
+    def __call__(self, protein, fingerprints):
+        protein = np.ascontiguousarray(protein, dtype=np.float32)
+        fingerprints = np.ascontiguousarray(fingerprints, dtype=np.float32)
+        self._resize(len(fingerprints))
+        for detail in self.inputs:
+            is_fingerprint = 'fingerprint' in detail['name']
+            self.interpreter.set_tensor(detail['index'], fingerprints if is_fingerprint else protein)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)[:, 0].copy()
+
+
+class QuantizedScreen:
+    # TwoTowerScreen with the per-ligand drug tower and head running from a TFLite export
+    def __init__(self, model, tflite_model, batch_size=1024, num_threads=None):
+        if isinstance(model, str):
+            model = tf.keras.models.load_model(model)
+        self.protein_encoder = split_model(model)[0]
+        self.scorer = TFLiteScorer(tflite_model, num_threads=num_threads)
+        self.batch_size = batch_size
+
+    @traced('embed_proteins')
+    def embed_proteins(self, voxels):
+        voxels = np.asarray(voxels, dtype=np.float32)
+        if voxels.ndim == 4:
+            voxels = voxels[None]
+        return self.protein_encoder(voxels, training=False).numpy()
+
+    @traced('predict')
+    def score(self, protein_embedding, fingerprints):
+        protein_embedding = np.asarray(protein_embedding, dtype=np.float32).reshape(1, -1)
+        scores = np.empty(len(fingerprints), dtype=np.float32)
+        for start in range(0, len(fingerprints), self.batch_size):
+            batch = fingerprints[start:start + self.batch_size]
+            scores[start:start + len(batch)] = self.scorer(np.repeat(protein_embedding, len(batch), axis=0), batch)
+        return scores
+
+    def screen(self, protein_voxel, fingerprints):
+        return self.score(self.embed_proteins(protein_voxel)[0], fingerprints)
+
+
+# Function to build (protein, fingerprint) inputs for one part from voxel/fingerprint batches
+def _part_inputs(model, part, batches):
+    voxels = np.concatenate([voxels for voxels, _ in batches]).astype(np.float32)
+    fingerprints = np.concatenate([fingerprints for _, fingerprints in batches]).astype(np.float32)
+    if part == 'ligand':
+        voxels = split_model(model)[0].predict(voxels, batch_size=64, verbose=0)
+    return voxels, fingerprints
+
+
+# Function to compare a quantized export against the float Keras model on held-out batches
+def drift_report(model, tflite_model, batches, part='ligand', threshold=0.5, batch_size=64):
+    if isinstance(model, str):
+        model = tf.keras.models.load_model(model)
+    protein, fingerprints = _part_inputs(model, part, batches)
+    reference = export_model(model, part).predict([protein, fingerprints], batch_size=batch_size, verbose=0)[:, 0]
+    scorer = TFLiteScorer(tflite_model)
+    quantized = np.concatenate([
+        scorer(protein[start:start + batch_size], fingerprints[start:start + batch_size])
+        for start in range(0, len(fingerprints), batch_size)
+    ])
+
+    error = np.abs(quantized - reference)
+    # Spearman correlation as the Pearson correlation of ranks; screening only cares about ordering
+    ranks = [np.argsort(np.argsort(scores)).astype(np.float64) for scores in (reference, quantized)]
+    report = {
+        'samples': len(reference),
+        'max_abs_error': float(error.max()),
+        'mean_abs_error': float(error.mean()),
+        'decision_agreement': float(np.mean((reference >= threshold) == (quantized >= threshold))),
+        'rank_correlation': float(np.corrcoef(*ranks)[0, 1]) if len(reference) > 1 else 1.0,
+    }
+    print(f"Drift on {report['samples']} samples: max |err| {report['max_abs_error']:.2e}  "
+          f"mean |err| {report['mean_abs_error']:.2e}  agreement@{threshold} {report['decision_agreement']:.2%}  "
+          f"rank corr {report['rank_correlation']:.4f}")
+    return report
+
+
+# Function to time the best of several calls
+def _best_time(fn, repeats):
+    fn()
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Benchmark latency and throughput of the float model against TFLite exports at several batch sizes
+def benchmark_quantized(model, tflite_models, part='ligand', batch_sizes=BENCHMARK_BATCH_SIZES, repeats=5,
+                        num_threads=None, seed=0):
+    if isinstance(model, str):
+        model = tf.keras.models.load_model(model)
+    part_model = export_model(model, part)
+    keras_fn = tf.function(lambda protein, fingerprints: part_model([protein, fingerprints], training=False))
+    rng = np.random.default_rng(seed)
+    protein_shape = tuple(part_model.inputs[0].shape[1:])
+    n_bits = part_model.inputs[1].shape[-1]
+
+    results = []
+    for batch_size in batch_sizes:
+        if part == 'fused':
+            protein = (rng.random((batch_size,) + protein_shape) < 0.05).astype(np.float32)
+        else:
+            protein = rng.random((batch_size,) + protein_shape).astype(np.float32)
+        fingerprints = (rng.random((batch_size, n_bits)) < 0.03).astype(np.float32)
+        timings = {'keras float32': _best_time(lambda: keras_fn(protein, fingerprints), repeats)}
+        for name, tflite_model in tflite_models.items():
+            scorer = TFLiteScorer(tflite_model, num_threads=num_threads)
+            timings[f'tflite {name}'] = _best_time(lambda: scorer(protein, fingerprints), repeats)
+        for name, seconds in timings.items():
+            results.append({'batch_size': batch_size, 'variant': name, 'latency_ms': seconds * 1e3,
+                            'samples_per_sec': batch_size / seconds})
+            print(f"batch {batch_size:>5}  {name:<16} {seconds * 1e3:10.3f} ms  {batch_size / seconds:12.0f} samples/s  "
+                  f"({timings['keras float32'] / seconds:.1f}x)")
+    return results
+
+
+# Command-line entry point, also used by `bindai quantize`
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Export a quantized TFLite model for CPU screening")
+    parser.add_argument('model', help="Saved Keras model, e.g. deepdrug1st.keras")
+    parser.add_argument('output', help="Output .tflite path")
+    parser.add_argument('--part', choices=('ligand', 'fused'), default='ligand')
+    parser.add_argument('--mode', choices=QUANTIZATION_MODES, default='dynamic')
+    parser.add_argument('--records', help="TFRecord file pattern for calibration and drift batches")
+    parser.add_argument('--calibration-batches', type=int, default=32)
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(BENCHMARK_BATCH_SIZES))
+    args = parser.parse_args(argv)
+
+    keras_model = tf.keras.models.load_model(args.model)
+    calibration = drift = None
+    if args.records:
+        calibration, drift = split_calibration_batches(args.records, args.calibration_batches)
+    elif args.mode == 'int8':
+        parser.error("--mode int8 needs --records for calibration")
+    export_tflite(keras_model, args.output, part=args.part, mode=args.mode, calibration=calibration)
+    print(f"Wrote {args.output}")
+    if drift:
+        drift_report(keras_model, args.output, drift, part=args.part)
+    if args.benchmark:
+        benchmark_quantized(keras_model, {args.mode: args.output}, part=args.part, batch_sizes=args.batch_sizes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Two-tower screening with a cached protein embedding.
+
+The fused protein+drug model from build_cnn_with_drug_input is split at its
+Concatenate layer into a protein encoder (Conv3D tower up to
+GlobalMaxPooling3D), a drug encoder (dense fingerprint tower) and a head.
+The protein embedding is computed once per target and only the drug tower
+and head run over ligand batches.
+"""
+
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+from .tracing import traced
+
+DEFAULT_BATCH_SIZE = 4096
+# Sparse protein grids densified per encoder call
+PROTEIN_BATCH_SIZE = 64
+
+
+# Function to split a fused protein+drug model into protein encoder, drug encoder and head
+def split_model(model):
+    concat = next((layer for layer in model.layers if isinstance(layer, layers.Concatenate)), None)
+    if concat is None:
+        raise ValueError("Model has no Concatenate layer to split at")
+
+    # The protein input is the 5-D voxel grid, the drug input the flat fingerprint
+    protein_input, drug_input = sorted(model.inputs, key=lambda tensor: len(tensor.shape), reverse=True)
+    protein_embedding, drug_embedding = concat.input
+    if len(protein_embedding.shape) != 2 or len(drug_embedding.shape) != 2:
+        raise ValueError("Expected flat embeddings on both sides of the Concatenate layer")
+    protein_encoder = models.Model(protein_input, protein_embedding, name='protein_encoder')
+    drug_encoder = models.Model(drug_input, drug_embedding, name='drug_encoder')
+
+    # Re-apply the layers after the concatenation (a plain chain in this model) to new inputs
+    protein_in = layers.Input(shape=protein_embedding.shape[1:], name='protein_embedding')
+    drug_in = layers.Input(shape=drug_embedding.shape[1:], name='drug_embedding')
+    x = concat([protein_in, drug_in])
+    for layer in model.layers[model.layers.index(concat) + 1:]:
+        x = layer(x)
+    head = models.Model([protein_in, drug_in], x, name='head')
+    return protein_encoder, drug_encoder, head
+
+
+class TwoTowerScreen:
+    def __init__(self, model, batch_size=DEFAULT_BATCH_SIZE):
+        if isinstance(model, str):
+            model = tf.keras.models.load_model(model)
+        self.model = model
+        self.batch_size = batch_size
+        self.protein_encoder, self.drug_encoder, self.head = split_model(model)
+        self._drug_encoder_fn = tf.function(lambda x: self.drug_encoder(x, training=False))
+        self._head_fn = tf.function(lambda p, d: self.head([p, d], training=False))
+
+    # Function to compute protein embeddings for a (N, 32, 32, 32, C) voxel batch. Sparse grids (dicts
+    # from sparse_voxels.to_sparse, or a SparseVoxelStore) are densified PROTEIN_BATCH_SIZE at a time.
+    @traced('embed_proteins')
+    def embed_proteins(self, voxels):
+        from .sparse_voxels import SparseVoxelStore, densify_batch
+
+        if isinstance(voxels, dict):
+            voxels = [voxels]
+        if isinstance(voxels, SparseVoxelStore) or (isinstance(voxels, list) and voxels
+                                                    and isinstance(voxels[0], dict)):
+            embeddings, buffer = [], None
+            for start in range(0, len(voxels), PROTEIN_BATCH_SIZE):
+                grids = [voxels[i] for i in range(start, min(start + PROTEIN_BATCH_SIZE, len(voxels)))]
+                if buffer is None:
+                    buffer = densify_batch(grids)
+                    batch = buffer
+                else:
+                    batch = densify_batch(grids, out=buffer)[:len(grids)]
+                embeddings.append(self.protein_encoder(batch, training=False).numpy())
+            return np.concatenate(embeddings)
+        voxels = np.asarray(voxels, dtype=np.float32)
+        if voxels.ndim == 4:
+            voxels = voxels[None]
+        return self.protein_encoder(voxels, training=False).numpy()
+
+    # Function to score a fingerprint batch against one cached protein embedding
+    @traced('predict')
+    def score(self, protein_embedding, fingerprints):
+        protein_embedding = np.asarray(protein_embedding, dtype=np.float32).reshape(1, -1)
+        fingerprints = np.asarray(fingerprints, dtype=np.float32)
+        scores = np.empty(len(fingerprints), dtype=np.float32)
+        for start in range(0, len(fingerprints), self.batch_size):
+            batch = fingerprints[start:start + self.batch_size]
+            drug_embedding = self._drug_encoder_fn(tf.constant(batch))
+            protein_batch = tf.repeat(tf.constant(protein_embedding), len(batch), axis=0)
+            scores[start:start + len(batch)] = self._head_fn(protein_batch, drug_embedding).numpy()[:, 0]
+        return scores
+
+    # Function to score a fingerprint batch against several cached protein embeddings, returning (targets, N)
+    @traced('predict')
+    def score_targets(self, protein_embeddings, fingerprints):
+        protein_embeddings = np.asarray(protein_embeddings, dtype=np.float32)
+        fingerprints = np.asarray(fingerprints, dtype=np.float32)
+        scores = np.empty((len(protein_embeddings), len(fingerprints)), dtype=np.float32)
+        for start in range(0, len(fingerprints), self.batch_size):
+            batch = fingerprints[start:start + self.batch_size]
+            # The drug tower runs once per batch and is shared by every target
+            drug_embedding = self._drug_encoder_fn(tf.constant(batch))
+            for t, protein_embedding in enumerate(protein_embeddings):
+                protein_batch = tf.repeat(tf.constant(protein_embedding[None]), len(batch), axis=0)
+                scores[t, start:start + len(batch)] = self._head_fn(protein_batch, drug_embedding).numpy()[:, 0]
+        return scores
+
+    # Function to screen many ligands against one protein voxel grid
+    def screen(self, protein_voxel, fingerprints):
+        return self.score(self.embed_proteins(protein_voxel)[0], fingerprints)
+
+
+# Function to predict the interaction score of one protein voxel grid and one drug fingerprint
+@traced('predict')
+def predict_interaction(protein_voxel, drug_features, model):
+    if isinstance(model, str):
+        model = tf.keras.models.load_model(model)
+    protein_input = np.asarray(protein_voxel, dtype=np.float32)
+    if protein_input.ndim == 3:
+        protein_input = protein_input[..., None]
+    drug_input = np.asarray(drug_features, dtype=np.float32).reshape(1, -1)
+    return float(model([protein_input[None], drug_input], training=False)[0, 0])
+
+
+# Function to check that the split model reproduces the fused model's scores
+def check_parity(model, protein_voxel, fingerprints, atol=1e-5):
+    screen = TwoTowerScreen(model)
+    split_scores = screen.screen(protein_voxel, fingerprints)
+    voxels = np.repeat(np.asarray(protein_voxel, dtype=np.float32)[None], len(fingerprints), axis=0)
+    fused_scores = model.predict([voxels, np.asarray(fingerprints, dtype=np.float32)], verbose=0)[:, 0]
+    max_error = float(np.max(np.abs(split_scores - fused_scores)))
+    if max_error > atol:
+        raise AssertionError(f"Split model differs from fused model by {max_error:.2e} (atol={atol})")
+    return max_error
+
+
+# Benchmark ligands/sec of the fused model against the two-tower screen for one target
+def benchmark_screening(model=None, n_ligands=(1_000, 100_000), fused_limit=2_000, seed=0):
+    if model is None:
+        from .models import build_cnn_with_drug_input
+
+        model = build_cnn_with_drug_input((32, 32, 32, 1), 2048)
+    elif isinstance(model, str):
+        model = tf.keras.models.load_model(model)
+    rng = np.random.default_rng(seed)
+    protein_voxel = (rng.random((32, 32, 32, 1)) < 0.05).astype(np.float32)
+    screen = TwoTowerScreen(model)
+    parity_fingerprints = (rng.random((256, 2048)) < 0.03).astype(np.float32)
+    print(f"Max |split - fused| on 256 ligands: {check_parity(model, protein_voxel, parity_fingerprints):.2e}")
+
+    results = []
+    for n in n_ligands:
+        fingerprints = (rng.random((n, 2048)) < 0.03).astype(np.float32)
+
+        start = time.perf_counter()
+        screen.screen(protein_voxel, fingerprints)
+        split_rate = n / (time.perf_counter() - start)
+
+        # The fused model repeats the Conv3D tower per ligand, so time it on a capped subset
+        n_fused = min(n, fused_limit)
+        voxels = np.repeat(protein_voxel[None], n_fused, axis=0)
+        start = time.perf_counter()
+        model.predict([voxels, fingerprints[:n_fused]], batch_size=256, verbose=0)
+        fused_rate = n_fused / (time.perf_counter() - start)
+
+        results.append({'ligands': n, 'fused_ligands_per_sec': fused_rate, 'split_ligands_per_sec': split_rate})
+        print(f"{n:>8} ligands  fused {fused_rate:10.0f} ligands/s  two-tower {split_rate:12.0f} ligands/s  "
+              f"({split_rate / fused_rate:.0f}x)")
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+
+    benchmark_screening(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Sequence featurizers from the bindAI notebooks.
+
+Protein sequences are laid out on a voxel grid one residue per voxel, x
+fastest, with each residue stored as its 1-20 amino acid code. SMILES are
+encoded as zero-padded character index sequences for the generative models.
+
+The sequence models skip the grid: bucket_batches tokenizes residues (0 is
+padding) and groups sequences by length, padding each batch only up to its
+bucket boundary so a Keras Embedding(mask_zero=True) can mask the rest.
+
+encode_sequences does the grid layout for a whole batch without a Python
+loop over residues. Each sequence's bytes are read with np.frombuffer and
+mapped through a 256-entry lookup table into a row of a (N, 32768) staging
+block in sequence order. One transposed copy of that block, viewed as
+(N, z, y, x), then writes it into the (N, x, y, z) output with x fastest.
+"""
+
+import string
+import time
+
+import numpy as np
+
+AMINO_ACID_MAPPING = {
+    'A': 1, 'C': 2, 'D': 3, 'E': 4, 'F': 5,
+    'G': 6, 'H': 7, 'I': 8, 'K': 9, 'L': 10,
+    'M': 11, 'N': 12, 'P': 13, 'Q': 14, 'R': 15,
+    'S': 16, 'T': 17, 'V': 18, 'W': 19, 'Y': 20
+}
+GRID_SIZE = (32, 32, 32)
+DEFAULT_ENCODE_BATCH_SIZE = 512
+# Residue tokens for the sequence models: 0 pads, 1-20 are amino acids, 21 is any other letter
+UNKNOWN_RESIDUE = 21
+RESIDUE_VOCAB_SIZE = 22
+
+
+# Function to build a 256-entry byte -> value lookup table from a {character: value} mapping
+def build_lut(mapping, dtype=np.uint8):
+    lut = np.zeros(256, dtype=dtype)
+    for char, value in mapping.items():
+        lut[ord(char)] = value
+    return lut
+
+
+AMINO_ACID_LUT = build_lut(AMINO_ACID_MAPPING)
+RESIDUE_LUT = build_lut({**dict.fromkeys(string.ascii_letters, UNKNOWN_RESIDUE), **AMINO_ACID_MAPPING})
+# cnn.py's sequence_to_voxel encoding: every character as ord(c) % 255 / 255
+CHARACTER_LUT = (np.arange(256) % 255 / 255.0).astype(np.float32)
+
+
+# Function to view a sequence (str or bytes) as uint8 character codes, one byte per residue
+def _sequence_bytes(sequence):
+    if isinstance(sequence, (bytes, bytearray, memoryview)):
+        return np.frombuffer(sequence, dtype=np.uint8)
+    return np.frombuffer(sequence.encode('latin-1', errors='replace'), dtype=np.uint8)
+
+
+# Function to encode sequences into a preallocated (N, x, y, z) batch; residue i goes to
+# (i % x, i // x % y, i // (x * y) % z). With wrap=True (bindai2.py) residues past the grid wrap around
+# and overwrite earlier voxels unless they are unknown; with wrap=False (cnn.py) they are dropped.
+def encode_sequences(sequences, grid_size=GRID_SIZE, lut=AMINO_ACID_LUT, wrap=True, out=None, dtype=np.float32):
+    gx, gy, gz = grid_size
+    capacity = gx * gy * gz
+    n = len(sequences)
+    if out is None:
+        out = np.empty((n, gx, gy, gz), dtype=dtype)
+    elif out.shape[0] < n or out.shape[1:] != (gx, gy, gz):
+        raise ValueError(f"Output buffer of shape {out.shape} cannot hold {n} grids of size {grid_size}")
+
+    staging = np.zeros((n, capacity), dtype=lut.dtype)
+    for row, sequence in zip(staging, sequences):
+        codes = lut[_sequence_bytes(sequence)]
+        row[:min(len(codes), capacity)] = codes[:capacity]
+        if wrap:
+            for start in range(capacity, len(codes), capacity):
+                chunk = codes[start:start + capacity]
+                known = np.flatnonzero(chunk)
+                row[known] = chunk[known]
+    # Staging rows are in sequence order, i.e. C-order (z, y, x); the transposed copy puts x fastest
+    out[:n] = staging.reshape(n, gz, gy, gx).transpose(0, 3, 2, 1)
+    return out
+
+
+# Function to encode an iterable of sequences in batches, yielding (start index, batch) views of one reused buffer
+def iter_encoded_batches(sequences, batch_size=DEFAULT_ENCODE_BATCH_SIZE, grid_size=GRID_SIZE, **options):
+    out = np.empty((batch_size,) + tuple(grid_size), dtype=options.pop('dtype', np.float32))
+    batch, start = [], 0
+    for sequence in sequences:
+        batch.append(sequence)
+        if len(batch) == batch_size:
+            yield start, encode_sequences(batch, grid_size, out=out, **options)
+            start += len(batch)
+            batch = []
+    if batch:
+        yield start, encode_sequences(batch, grid_size, out=out, **options)[:len(batch)]
+
+
+# Function to build geometric length-bucket boundaries (multiples of `multiple`) from min_length up to max_length
+def length_buckets(min_length=64, max_length=32768, growth=1.5, multiple=32):
+    boundaries = [min_length]
+    while boundaries[-1] < max_length:
+        boundaries.append(min(max_length, -(-int(boundaries[-1] * growth) // multiple) * multiple))
+    return tuple(boundaries)
+
+
+# 16 boundaries from 64 to 32768, each about 1.5x the last, so a model sees at most 16 batch shapes
+DEFAULT_LENGTH_BUCKETS = length_buckets()
+
+
+# Function to yield (indices, tokens, labels) batches of residue tokens grouped by length bucket.
+# Each batch is padded with 0 up to its bucket boundary; sequences longer than the last boundary are truncated.
+def bucket_batches(sequences, labels=None, batch_size=32, boundaries=DEFAULT_LENGTH_BUCKETS, shuffle=False,
+                   seed=None):
+    tokens = [RESIDUE_LUT[_sequence_bytes(sequence)] for sequence in sequences]
+    lengths = np.array([len(codes) for codes in tokens], dtype=np.int64)
+    bucket_ids = np.searchsorted(boundaries, np.minimum(lengths, boundaries[-1]))
+    labels = None if labels is None else np.asarray(labels)
+    rng = np.random.default_rng(seed)
+
+    batches = []
+    for bucket in np.unique(bucket_ids):
+        members = np.flatnonzero(bucket_ids == bucket)
+        if shuffle:
+            rng.shuffle(members)
+        batches += [(boundaries[bucket], members[start:start + batch_size])
+                    for start in range(0, len(members), batch_size)]
+    if shuffle:
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+
+    for width, members in batches:
+        batch = np.zeros((len(members), width), dtype=np.int32)
+        for row, index in zip(batch, members):
+            codes = tokens[index][:width]
+            row[:len(codes)] = codes
+        yield members, batch, None if labels is None else labels[members]
+
+
+# Function to convert a protein sequence into a voxel grid of amino acid codes (0 = empty or unknown)
+def sequence_to_voxel_grid(sequence, grid_size=GRID_SIZE):
+    return encode_sequences([sequence], grid_size, dtype=np.float64)[0]
+
+
+# The notebook's per-residue loop, kept as the reference for encode_sequences
+def _sequence_to_voxel_grid_loop(sequence, grid_size=GRID_SIZE):
+    voxel_grid = np.zeros(grid_size)
+
+    for i, amino_acid in enumerate(sequence):
+        if amino_acid in AMINO_ACID_MAPPING:
+            voxel_grid[i % grid_size[0], (i // grid_size[0]) % grid_size[1],
+                       (i // (grid_size[0] * grid_size[1])) % grid_size[2]] = AMINO_ACID_MAPPING[amino_acid]
+
+    return voxel_grid
+
+
+# Function to encode SMILES as zero-padded character index sequences, returning (X, char_to_index, max_length)
+def preprocess_smiles(smiles_data):
+    # Create a simple character mapping for SMILES, starting at 1 so 0 is padding
+    chars = sorted(set(''.join(smiles_data)))
+    char_to_index = {c: i + 1 for i, c in enumerate(chars)}
+    max_length = max(len(smiles) for smiles in smiles_data)
+
+    def smiles_to_sequences(smiles, max_length):
+        sequence = [char_to_index[char] for char in smiles]
+        return sequence + [0] * (max_length - len(sequence))
+
+    X_data = np.array([smiles_to_sequences(smiles, max_length) for smiles in smiles_data])
+    return X_data, char_to_index, max_length
+
+
+# Function to generate a synthetic proteome (bytes sequences) with human-like lognormal lengths
+def synthetic_proteome(n_sequences=20_400, median_length=415, sigma=0.75, max_length=35_000, seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(np.log(median_length), sigma, n_sequences), 30, max_length).astype(np.int64)
+    letters = np.frombuffer(''.join(AMINO_ACID_MAPPING).encode(), dtype=np.uint8)
+    residues = rng.choice(letters, size=int(lengths.sum())).tobytes()
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    return [residues[offsets[i]:offsets[i + 1]] for i in range(n_sequences)]
+
+
+# Benchmark the per-residue loop against the batched encoder on a proteome-sized set
+def benchmark_sequence_encoder(n_sequences=20_400, batch_size=DEFAULT_ENCODE_BATCH_SIZE, loop_sample=200, seed=0):
+    proteome = synthetic_proteome(n_sequences, seed=seed)
+    n_residues = sum(len(sequence) for sequence in proteome)
+
+    # Parity, including wrap-around past the grid and unknown residues
+    check = [sequence.decode() for sequence in proteome[:loop_sample]]
+    check.append(check[0] * 40 + 'XBZ' * 100)
+    batch = encode_sequences(check, dtype=np.float64)
+    for sequence, grid in zip(check, batch):
+        if not np.array_equal(grid, _sequence_to_voxel_grid_loop(sequence)):
+            raise AssertionError("encode_sequences differs from the per-residue loop")
+
+    sample = check[:loop_sample]
+    start = time.perf_counter()
+    for sequence in sample:
+        _sequence_to_voxel_grid_loop(sequence)
+    loop_rate = sum(len(sequence) for sequence in sample) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in iter_encoded_batches(proteome, batch_size=batch_size):
+        pass
+    seconds = time.perf_counter() - start
+    print(f"per-residue loop : {loop_rate:12.0f} residues/s  (proteome estimate {n_residues / loop_rate:8.1f} s)")
+    print(f"encode_sequences : {n_residues / seconds:12.0f} residues/s  "
+          f"({n_sequences} sequences, {n_residues} residues in {seconds:.2f} s)")
+    return {'sequences': n_sequences, 'residues': n_residues, 'loop_residues_per_sec': loop_rate,
+            'encoder_residues_per_sec': n_residues / seconds, 'encoder_seconds': seconds}
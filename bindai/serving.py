@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""Long-running local scoring server with dynamic micro-batching.
+
+The model is loaded once and kept warm. Each (PDB, SMILES) request is
+featurized on its HTTP handler thread, then queued for a single batcher
+thread. The batcher coalesces queued requests into one micro-batch. A batch
+closes when it reaches max_batch_size or when the oldest request has waited
+max_delay_ms. Protein embeddings are cached per structure, so a batch runs
+the Conv3D tower only for proteins it has not seen recently.
+
+    bindai serve deepdrug1st.keras --port 8765
+    bindai load-test --requests 2000 --concurrency 32 --pdb 1abc.pdb --smiles CCO
+
+Endpoints:
+
+    POST /score   {"pdb": "<path or PDB ID>", "smiles": "<SMILES>"}
+                  or a JSON list of such objects
+    GET  /health  model and batcher statistics
+    GET  /trace   per-stage latency summary (when tracing is enabled)
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import tensorflow as tf
+
+from .fingerprint_store import RADIUS, _cached_packed_fingerprint, unpack_fingerprints
+from .pdb_reader import read_atoms
+from .screening import split_model
+from .structure_cache import fetch_protein_atoms
+from .tracing import TRACER, span
+from .voxelizer import NUM_CHANNELS, voxelize_atoms
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_DELAY_MS = 5.0
+
+
+class PendingRequest:
+    # One queued (protein, fingerprint) pair and the slot its score is returned in
+    def __init__(self, protein_key, voxels, fingerprint):
+        self.protein_key = protein_key
+        self.voxels = voxels
+        self.fingerprint = fingerprint
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.score = None
+        self.error = None
+        self.timing = {}
+
+
+class MicroBatcher:
+    def __init__(self, model, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_delay_ms=DEFAULT_MAX_DELAY_MS,
+                 embedding_cache_size=1024):
+        if isinstance(model, str):
+            model = tf.keras.models.load_model(model)
+        self.protein_encoder, self.drug_encoder, self.head = split_model(model)
+        self.voxel_shape = tuple(self.protein_encoder.input.shape[1:])
+        self.n_bits = self.drug_encoder.input.shape[-1]
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1e3
+        self.embedding_cache_size = embedding_cache_size
+        self.embeddings = OrderedDict()
+        self.queue = queue.Queue()
+        self.stats = {'requests': 0, 'batches': 0, 'embedding_hits': 0, 'embedding_misses': 0}
+        # Batch sizes vary per micro-batch, so trace once with an unknown batch dimension
+        embedding_size = self.head.inputs[0].shape[-1]
+        self._encode_proteins = tf.function(
+            lambda x: self.protein_encoder(x, training=False),
+            input_signature=[tf.TensorSpec((None,) + self.voxel_shape, tf.float32)])
+        self._score = tf.function(
+            lambda p, d: self.head([p, self.drug_encoder(d, training=False)], training=False),
+            input_signature=[tf.TensorSpec((None, embedding_size), tf.float32),
+                             tf.TensorSpec((None, self.n_bits), tf.float32)])
+        # Trace both functions before the first request arrives
+        embedding = self._encode_proteins(np.zeros((1,) + self.voxel_shape, dtype=np.float32))
+        self._score(embedding, np.zeros((1, self.n_bits), dtype=np.float32))
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    # Function to queue one featurized pair and block until its score is ready
+    def submit(self, protein_key, voxels, fingerprint, timeout=60.0):
+        # Reject malformed inputs here so they fail only their own request, not a whole micro-batch
+        if np.shape(voxels) != self.voxel_shape:
+            raise ValueError(f"Voxel grid shape {np.shape(voxels)} does not match the model's {self.voxel_shape}")
+        if np.shape(fingerprint) != (self.n_bits,):
+            raise ValueError(f"Fingerprint shape {np.shape(fingerprint)} does not match the model's ({self.n_bits},)")
+        request = PendingRequest(protein_key, voxels, fingerprint)
+        self.queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError("Scoring request timed out")
+        if request.error is not None:
+            raise request.error
+        return request
+
+    # Function to collect the next micro-batch: wait for one request, then fill until size or deadline
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = batch[0].enqueued + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # Function to look up cached protein embeddings, encoding the missing ones in one call
+    def _protein_embeddings(self, batch):
+        missing = {}
+        for request in batch:
+            if request.protein_key in self.embeddings:
+                self.embeddings.move_to_end(request.protein_key)
+            elif request.protein_key not in missing:
+                missing[request.protein_key] = request.voxels
+        self.stats['embedding_misses'] += len(missing)
+        self.stats['embedding_hits'] += len(batch) - len(missing)
+        if missing:
+            encoded = self._encode_proteins(np.stack(list(missing.values()))).numpy()
+            for key, embedding in zip(missing, encoded):
+                self.embeddings[key] = embedding
+        embeddings = np.stack([self.embeddings[request.protein_key] for request in batch])
+        while len(self.embeddings) > self.embedding_cache_size:
+            self.embeddings.popitem(last=False)
+        return embeddings
+
+    # Function to score a micro-batch, returning one (score, error) pair per request
+    def _score_batch(self, batch):
+        with span('embed_proteins'):
+            embeddings = self._protein_embeddings(batch)
+        with span('predict', batch_size=len(batch)):
+            fingerprints = np.stack([request.fingerprint for request in batch])
+            scores = self._score(embeddings, fingerprints).numpy()[:, 0]
+        return [(float(score), None) for score in scores]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            try:
+                results = self._score_batch(batch)
+            except Exception:
+                # Rescore one by one so a single bad request only fails itself
+                results = []
+                for request in batch:
+                    try:
+                        results.extend(self._score_batch([request]))
+                    except Exception as exc:
+                        results.append((None, exc))
+            end = time.perf_counter()
+            self.stats['requests'] += len(batch)
+            self.stats['batches'] += 1
+            for request, (score, error) in zip(batch, results):
+                request.score = score
+                request.error = error
+                request.timing = {'queue_ms': (start - request.enqueued) * 1e3,
+                                  'model_ms': (end - start) * 1e3, 'batch_size': len(batch)}
+                request.done.set()
+
+
+class ScoringService:
+    # Featurizes requests and hands them to the micro-batcher
+    def __init__(self, model, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_delay_ms=DEFAULT_MAX_DELAY_MS,
+                 voxel_cache_size=256):
+        self.batcher = MicroBatcher(model, max_batch_size=max_batch_size, max_delay_ms=max_delay_ms)
+        self._voxels = lru_cache(maxsize=voxel_cache_size)(self._load_voxels)
+
+    # Function to voxelize a protein given as a structure file path or a PDB ID
+    def _load_voxels(self, pdb):
+        atoms = read_atoms(pdb) if os.path.exists(pdb) else fetch_protein_atoms(pdb)
+        grid_size, n_channels = self.batcher.voxel_shape[0], self.batcher.voxel_shape[-1]
+        return voxelize_atoms(atoms, grid_size=grid_size, typed=n_channels == NUM_CHANNELS)
+
+    # Function to score one {"pdb": ..., "smiles": ...} request, returning the response dict
+    def score(self, item):
+        start = time.perf_counter()
+        pdb, smiles = item.get('pdb'), item.get('smiles')
+        if not pdb or not smiles:
+            raise ValueError("Each request needs 'pdb' and 'smiles'")
+        packed = _cached_packed_fingerprint(smiles, self.batcher.n_bits, RADIUS)
+        if packed is None:
+            raise ValueError(f"Invalid SMILES string: {smiles}")
+        fingerprint = unpack_fingerprints(np.frombuffer(packed, dtype=np.uint8), self.batcher.n_bits)[0]
+        voxels = self._voxels(pdb)
+        featurized = time.perf_counter()
+
+        request = self.batcher.submit(pdb, voxels, fingerprint)
+        timing = dict(request.timing, featurize_ms=(featurized - start) * 1e3,
+                      total_ms=(time.perf_counter() - start) * 1e3)
+        return {'pdb': pdb, 'smiles': smiles, 'score': request.score, 'timing': timing}
+
+    # Function to score one item of a list request, returning an error entry instead of raising
+    def score_item(self, item):
+        try:
+            return self.score(item)
+        except Exception as exc:
+            pdb, smiles = (item.get('pdb'), item.get('smiles')) if isinstance(item, dict) else (None, None)
+            return {'pdb': pdb, 'smiles': smiles, 'score': None, 'error': str(exc)}
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many clients connect at once under load; the default backlog of 5 drops connections
+    request_queue_size = 1024
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/trace':
+            self._send_json(200, {'enabled': TRACER.enabled, 'stages': TRACER.summary()})
+            return
+        if self.path != '/health':
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        batcher = self.service.batcher
+        self._send_json(200, dict(batcher.stats, queued=batcher.queue.qsize(),
+                                  cached_embeddings=len(batcher.embeddings)))
+
+    def do_POST(self):
+        if self.path != '/score':
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if isinstance(payload, list):
+                # Items of one list request are submitted together so they can share a micro-batch;
+                # a failing item gets an 'error' entry in its slot and the others are still scored
+                with ThreadPoolExecutor(max_workers=min(len(payload), 32) or 1) as executor:
+                    results = list(executor.map(self.service.score_item, payload))
+            else:
+                results = self.service.score(payload)
+        except (ValueError, LookupError, FileNotFoundError, AttributeError) as exc:
+            self._send_json(400, {'error': str(exc)})
+            return
+        except Exception as exc:
+            self._send_json(500, {'error': str(exc)})
+            return
+        self._send_json(200, results)
+
+    def log_message(self, format, *args):
+        # Per-request access logs would dominate output under load
+        pass
+
+
+# Function to run the scoring server until interrupted
+def serve(model, host='127.0.0.1', port=DEFAULT_PORT, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+          max_delay_ms=DEFAULT_MAX_DELAY_MS):
+    handler = type('BoundScoringHandler', (ScoringHandler,), {
+        'service': ScoringService(model, max_batch_size=max_batch_size, max_delay_ms=max_delay_ms),
+    })
+    server = ScoringServer((host, port), handler)
+    print(f"Scoring server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# Function to fire concurrent single-pair requests at a server and report latency percentiles.
+# Failed requests (HTTP errors, refused connections) are counted rather than aborting the run.
+def load_test(pairs, url=f'http://127.0.0.1:{DEFAULT_PORT}', n_requests=1000, concurrency=32):
+    def post(i):
+        pdb, smiles = pairs[i % len(pairs)]
+        body = json.dumps({'pdb': pdb, 'smiles': smiles}).encode()
+        request = urllib.request.Request(url + '/score', data=body, headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                result = json.loads(response.read())
+        except urllib.error.HTTPError as exc:
+            return None, None, f'HTTP {exc.code}'
+        except (urllib.error.URLError, OSError, ValueError) as exc:
+            return None, None, type(exc).__name__
+        return time.perf_counter() - start, result['timing']['batch_size'], None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(post, range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    errors = {}
+    for _, _, error in results:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    succeeded = [(latency, batch_size) for latency, batch_size, error in results if error is None]
+    latencies = np.array([latency for latency, _ in succeeded]) * 1e3
+    batch_sizes = np.array([batch_size for _, batch_size in succeeded])
+    report = {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'errors': sum(errors.values()),
+        'error_counts': errors,
+        'requests_per_sec': len(succeeded) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if succeeded else None,
+        'p99_ms': float(np.percentile(latencies, 99)) if succeeded else None,
+        'max_ms': float(latencies.max()) if succeeded else None,
+        'mean_batch_size': float(batch_sizes.mean()) if succeeded else None,
+    }
+    if succeeded:
+        print(f"{n_requests} requests, concurrency {concurrency}: {report['requests_per_sec']:.0f} req/s  "
+              f"p50 {report['p50_ms']:.1f} ms  p99 {report['p99_ms']:.1f} ms  max {report['max_ms']:.1f} ms  "
+              f"mean batch {report['mean_batch_size']:.1f}")
+    if errors:
+        print(f"{report['errors']} of {n_requests} requests failed: "
+              + ', '.join(f'{error} x{count}' for error, count in sorted(errors.items())))
+    return report
+
+
+# Command-line entry point, also used by `bindai serve` and `bindai load-test`
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="BindAI scoring server")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="Run the scoring server")
+    serve_parser.add_argument('model', nargs='?', default='deepdrug1st.keras')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    serve_parser.add_argument('--max-delay-ms', type=float, default=DEFAULT_MAX_DELAY_MS)
+
+    load_parser = commands.add_parser('load-test', help="Load-test a running server")
+    load_parser.add_argument('--url', default=f'http://127.0.0.1:{DEFAULT_PORT}')
+    load_parser.add_argument('--pdb', nargs='+', required=True, help="Structure paths or PDB IDs")
+    load_parser.add_argument('--smiles', nargs='+', required=True)
+    load_parser.add_argument('--requests', type=int, default=1000)
+    load_parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.model, host=args.host, port=args.port, max_batch_size=args.max_batch_size,
+              max_delay_ms=args.max_delay_ms)
+    else:
+        pairs = [(pdb, smiles) for pdb in args.pdb for smiles in args.smiles]
+        load_test(pairs, url=args.url, n_requests=args.requests, concurrency=args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
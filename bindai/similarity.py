@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""Tanimoto similarity index over packed Morgan fingerprints.
+
+Fingerprints are held as rows of uint64 words sorted by popcount. Tanimoto
+similarity is popcount(a & b) / (|a| + |b| - popcount(a & b)) and is bounded
+above by min(|a|, |b|) / max(|a|, |b|). A query with popcount q can
+therefore only reach a threshold t in the rows with popcount between t*q
+and q/t, which form one contiguous slice of the sorted index. Top-k queries
+visit popcount buckets in order of decreasing bound and stop once no
+remaining bucket can beat the current k-th best.
+
+Each scan is split into fixed-size row blocks that run on a thread pool.
+NumPy releases the GIL inside the bitwise kernels, so the blocks run on all
+cores. Bulk queries run one query per thread instead.
+
+On-disk index layout for a path prefix:
+
+    <path>.words.npy   uint64 words of the popcount-sorted fingerprints
+    <path>.npz         popcounts, original row order and n_bits
+    <path>.ids         optional ligand IDs, one per line, in original row order
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .fingerprint_store import N_BITS
+
+DEFAULT_BLOCK_ROWS = 16384
+
+
+# Function to count set bits per row of a uint64 (or uint8) array
+def popcount_rows(words):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    # NumPy < 2.0 has no popcount ufunc; fall back to a byte lookup table
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return table[np.ascontiguousarray(words).view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+class _ShardRows:
+    # Read-only view of several (n_i, row_bytes) shard arrays as one array, gathered per shard on indexing
+    def __init__(self, arrays, row_bytes):
+        self.arrays = arrays
+        self.offsets = np.cumsum([0] + [len(array) for array in arrays])
+        self.shape = (int(self.offsets[-1]), row_bytes)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        if isinstance(rows, slice):
+            rows = np.arange(*rows.indices(len(self)))
+        rows = np.asarray(rows)
+        out = np.empty((len(rows), self.shape[1]), dtype=np.uint8)
+        shards = np.searchsorted(self.offsets, rows, side='right') - 1
+        for shard in np.unique(shards):
+            mask = shards == shard
+            out[mask] = self.arrays[shard][rows[mask] - self.offsets[shard]]
+        return out
+
+
+class SimilarityIndex:
+    def __init__(self, words, counts, order, n_bits=N_BITS, ids=None, workers=None,
+                 block_rows=DEFAULT_BLOCK_ROWS):
+        self.words = words
+        self.counts = counts
+        self.order = order
+        self.n_bits = n_bits
+        self.ids = ids
+        self.block_rows = block_rows
+        self.workers = workers or os.cpu_count()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        # Start offset of every popcount value in the sorted index, for O(1) bucket lookup
+        self.bucket_starts = np.searchsorted(counts, np.arange(n_bits + 2))
+
+    # Function to build an index from (N, n_bits / 8) packed uint8 fingerprints.
+    # With a path, the sorted words are written to disk in chunks and memory-mapped, so
+    # libraries larger than RAM (e.g. memory-mapped shards) can be indexed.
+    @classmethod
+    def build(cls, packed, ids=None, path=None, chunk_rows=1_000_000, **kwargs):
+        n_bits = packed.shape[1] * 8
+        if n_bits % 64:
+            raise ValueError("n_bits must be a multiple of 64")
+        counts = np.concatenate([
+            popcount_rows(np.ascontiguousarray(packed[start:start + chunk_rows]).view(np.uint64))
+            for start in range(0, len(packed), chunk_rows)
+        ]) if len(packed) else np.zeros(0, dtype=np.int32)
+        order = np.argsort(counts, kind='stable')
+        if path is None:
+            words = np.ascontiguousarray(packed).view(np.uint64)[order]
+            return cls(words, counts[order], order, n_bits=n_bits, ids=ids, **kwargs)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        words = np.lib.format.open_memmap(path + '.tmp.npy', mode='w+', dtype=np.uint64,
+                                          shape=(len(packed), n_bits // 64))
+        for start in range(0, len(packed), chunk_rows):
+            rows = order[start:start + chunk_rows]
+            # Gathering in ascending row order keeps reads from a memory-mapped source sequential
+            source_rows = np.sort(rows)
+            gathered = np.ascontiguousarray(packed[source_rows]).view(np.uint64)
+            words[start:start + len(rows)] = gathered[np.searchsorted(source_rows, rows)]
+        words.flush()
+        del words
+        cls._write_meta(path, counts[order], order, n_bits, ids)
+        os.replace(path + '.tmp.npy', path + '.words.npy')
+        return cls.load(path, **kwargs)
+
+    # Function to build an index from a fingerprint_pipeline shard directory. With a path, the
+    # memory-mapped shards are streamed into the on-disk index chunk by chunk and never concatenated
+    # in memory; without one, the index is held in memory and the shards are concatenated.
+    @classmethod
+    def from_shards(cls, output_dir, path=None, **kwargs):
+        from .fingerprint_pipeline import read_shards
+
+        with open(os.path.join(output_dir, 'manifest.json')) as handle:
+            row_bytes = json.load(handle)['n_bits'] // 8
+        ids, arrays = [], []
+        for shard_ids, _, shard_packed in read_shards(output_dir):
+            ids.extend(shard_ids)
+            arrays.append(shard_packed)
+        if path is None:
+            packed = np.concatenate(arrays) if arrays else np.zeros((0, row_bytes), dtype=np.uint8)
+        else:
+            packed = _ShardRows(arrays, row_bytes)
+        return cls.build(packed, ids=ids, path=path, **kwargs)
+
+    @staticmethod
+    def _write_meta(path, counts, order, n_bits, ids):
+        np.savez(path + '.npz', counts=counts, order=order, n_bits=n_bits)
+        if ids is not None:
+            with open(path + '.ids', 'w') as handle:
+                handle.writelines(f'{mol_id}\n' for mol_id in ids)
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.save(path + '.words.npy', np.asarray(self.words))
+        self._write_meta(path, self.counts, self.order, self.n_bits, self.ids)
+        return path
+
+    # Function to open a saved index; the fingerprint words are memory-mapped
+    @classmethod
+    def load(cls, path, **kwargs):
+        with np.load(path + '.npz') as meta:
+            counts, order, n_bits = meta['counts'], meta['order'], int(meta['n_bits'])
+        words = np.load(path + '.words.npy', mmap_mode='r')
+        ids = None
+        if os.path.exists(path + '.ids'):
+            with open(path + '.ids') as handle:
+                ids = [line.rstrip('\n') for line in handle]
+        return cls(words, counts, order, n_bits=n_bits, ids=ids, **kwargs)
+
+    def __len__(self):
+        return len(self.counts)
+
+    # Function to stop the worker threads; the index cannot be queried in parallel afterwards
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _query_words(self, query):
+        query = np.asarray(query)
+        if query.dtype != np.uint8 or query.size * 8 != self.n_bits:
+            query = np.packbits(query.astype(bool))
+        return np.ascontiguousarray(query).view(np.uint64).reshape(-1)
+
+    # Function to compute Tanimoto similarity of one query against sorted rows [start, end)
+    def _scan(self, query, query_count, start, end):
+        words = self.words[start:end]
+        common = np.bitwise_and(words, query)
+        intersection = popcount_rows(common)
+        union = self.counts[start:end] + query_count - intersection
+        return np.divide(intersection, union, out=np.zeros(len(union), dtype=np.float32), where=union > 0)
+
+    def _blocks(self, start, end):
+        return [(block, min(block + self.block_rows, end)) for block in range(start, end, self.block_rows)]
+
+    # Function to scan a list of row ranges, in parallel blocks unless serial is set
+    def _scan_ranges(self, query, query_count, ranges, serial=False):
+        blocks = [block for start, end in ranges for block in self._blocks(start, end)]
+        if serial or len(blocks) == 1:
+            scores = [self._scan(query, query_count, start, end) for start, end in blocks]
+        else:
+            scores = list(self._pool.map(lambda block: self._scan(query, query_count, *block), blocks))
+        rows = np.concatenate([np.arange(start, end) for start, end in blocks]) if blocks else np.zeros(0, int)
+        return rows, np.concatenate(scores) if scores else np.zeros(0, np.float32)
+
+    def _result(self, rows, scores):
+        original = self.order[rows]
+        labels = [self.ids[i] for i in original] if self.ids is not None else original.tolist()
+        return list(zip(labels, scores.tolist()))
+
+    # Function to return every row with Tanimoto >= threshold, best first, as (id or row, similarity)
+    def threshold_query(self, query, threshold, serial=False):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        query = self._query_words(query)
+        query_count = int(popcount_rows(query[None])[0])
+        # Popcount bound: only rows with t*q <= |b| <= q/t can reach the threshold
+        low = int(np.ceil(threshold * query_count - 1e-9))
+        high = int(np.floor(query_count / threshold + 1e-9)) if query_count else self.n_bits
+        start = self.bucket_starts[min(low, self.n_bits + 1)]
+        end = self.bucket_starts[min(high, self.n_bits) + 1]
+        rows, scores = self._scan_ranges(query, query_count, [(start, end)], serial=serial)
+        keep = scores >= threshold
+        rows, scores = rows[keep], scores[keep]
+        best = np.argsort(-scores, kind='stable')
+        return self._result(rows[best], scores[best])
+
+    # Function to return the k most similar rows, best first, as (id or row, similarity)
+    def top_k(self, query, k=10, serial=False):
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        query = self._query_words(query)
+        query_count = int(popcount_rows(query[None])[0])
+        # Visit popcount buckets in order of their similarity bound min(q, c) / max(q, c)
+        bucket_counts = np.flatnonzero(self.bucket_starts[1:] > self.bucket_starts[:-1])
+        bucket_counts = bucket_counts[bucket_counts <= self.n_bits]
+        if query_count:
+            bounds = np.minimum(bucket_counts, query_count) / np.maximum(bucket_counts, query_count)
+        else:
+            bounds = (bucket_counts == 0).astype(float)
+        visit = np.argsort(-bounds, kind='stable')
+
+        best_rows, best_scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        wave_rows = self.block_rows * (1 if serial else self.workers)
+        i = 0
+        while i < len(visit):
+            kth = best_scores[-1] if len(best_scores) == k else -1.0
+            if bounds[visit[i]] <= kth:
+                break
+            # Gather buckets until there is enough work for every thread, then scan them together
+            ranges, n_rows = [], 0
+            while i < len(visit) and n_rows < wave_rows and bounds[visit[i]] > kth:
+                count = bucket_counts[visit[i]]
+                start, end = self.bucket_starts[count], self.bucket_starts[count + 1]
+                ranges.append((start, end))
+                n_rows += end - start
+                i += 1
+            rows, scores = self._scan_ranges(query, query_count, ranges, serial=serial)
+            rows = np.concatenate([best_rows, rows])
+            scores = np.concatenate([best_scores, scores])
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[top], scores[top]
+            order = np.argsort(-scores, kind='stable')
+            best_rows, best_scores = rows[order], scores[order]
+        return self._result(best_rows, best_scores)
+
+    # Function to run many queries, one query per thread; mode is 'top_k' or 'threshold'
+    def bulk_query(self, queries, k=10, threshold=None):
+        if threshold is None:
+            run = lambda query: self.top_k(query, k=k, serial=True)  # noqa: E731
+        else:
+            run = lambda query: self.threshold_query(query, threshold, serial=True)  # noqa: E731
+        return list(self._pool.map(run, list(queries)))
+
+
+# Function to make n random packed fingerprints with a Morgan-like spread of set-bit counts
+def synthetic_fingerprints(n, n_bits=N_BITS, mean_bits=45, sd_bits=15, seed=0, chunk=1_000_000, out=None):
+    rng = np.random.default_rng(seed)
+    packed = np.empty((n, n_bits // 8), dtype=np.uint8) if out is None else out
+    for start in range(0, n, chunk):
+        rows = min(chunk, n - start)
+        shape = (mean_bits / sd_bits) ** 2
+        n_set = np.clip(rng.gamma(shape, mean_bits / shape, size=rows).astype(int), 1, n_bits)
+        bits = np.zeros((rows, n_bits), dtype=bool)
+        row_index = np.repeat(np.arange(rows), n_set)
+        bits[row_index, rng.integers(0, n_bits, size=len(row_index))] = True
+        packed[start:start + rows] = np.packbits(bits, axis=1)
+    return packed
+
+
+# Function to derive queries that have close neighbours by flipping a few bits of database rows
+def _perturbed_queries(packed, n_queries, n_flips=6, seed=1):
+    rng = np.random.default_rng(seed)
+    n_bits = packed.shape[1] * 8
+    bits = np.unpackbits(packed[rng.integers(0, len(packed), size=n_queries)], axis=1).astype(bool)
+    flips = rng.integers(0, n_bits, size=(n_queries, n_flips))
+    np.logical_xor.at(bits, (np.arange(n_queries)[:, None], flips), True)
+    return np.packbits(bits, axis=1)
+
+
+# Function to score one query against every row serially, without popcount pruning
+def _brute_force(index, query):
+    query = index._query_words(query)
+    return index._scan_ranges(query, int(popcount_rows(query[None])[0]), [(0, len(index))], serial=True)
+
+
+# Benchmark pruned, parallel queries against a serial brute-force scan.
+# Libraries above in_memory_limit bytes are generated and indexed on disk.
+def benchmark_similarity(sizes=(1_000_000, 10_000_000), n_queries=100, k=10, threshold=0.8, workers=None,
+                         in_memory_limit=1 << 30):
+    import tempfile
+
+    results = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            on_disk = n * N_BITS // 8 > in_memory_limit
+            out = None
+            if on_disk:
+                out = np.lib.format.open_memmap(os.path.join(tmp_dir, 'library.npy'), mode='w+',
+                                                dtype=np.uint8, shape=(n, N_BITS // 8))
+            packed = synthetic_fingerprints(n, out=out)
+            start = time.perf_counter()
+            index = SimilarityIndex.build(packed, workers=workers,
+                                          path=os.path.join(tmp_dir, 'index') if on_disk else None)
+            build_seconds = time.perf_counter() - start
+            queries = _perturbed_queries(packed, n_queries)
+            del packed, out
+
+            def timed(fn, count):
+                start = time.perf_counter()
+                fn()
+                return (time.perf_counter() - start) / count
+
+            # A full scan per query is slow, so time brute force on a few queries only
+            n_brute = min(n_queries, 10)
+            brute = timed(lambda: [_brute_force(index, q) for q in queries[:n_brute]], n_brute)
+            top_k = timed(lambda: [index.top_k(q, k=k) for q in queries], n_queries)
+            thresh = timed(lambda: [index.threshold_query(q, threshold) for q in queries], n_queries)
+            bulk = timed(lambda: index.bulk_query(queries, k=k), n_queries)
+            results.append({'compounds': n, 'build_seconds': build_seconds, 'brute_force_ms': brute * 1e3,
+                            'top_k_ms': top_k * 1e3, 'threshold_ms': thresh * 1e3,
+                            'bulk_top_k_queries_per_sec': 1 / bulk})
+            print(f"{n:>10} compounds  build {build_seconds:6.2f}s  brute force {brute * 1e3:8.2f} ms  "
+                  f"top-{k} {top_k * 1e3:8.2f} ms  threshold {threshold} {thresh * 1e3:8.2f} ms  "
+                  f"bulk top-{k} {1 / bulk:8.1f} queries/s  ({index.workers} threads)")
+            index.close()
+            del index
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_similarity()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Sparse (COO) storage for voxel grids.
+
+Atom-presence grids are more than 95% zeros, so grids are stored as flat
+indices of their non-zero voxels plus float16 values (omitted entirely for
+binary occupancy grids). They are only densified into preallocated float32
+batch buffers when a batch is assembled.
+
+On-disk store layout for a path prefix:
+
+    <path>.idx   concatenated flat indices of all grids (uint16 or uint32)
+    <path>.val   concatenated float16 values of the non-binary grids
+    <path>.npz   grid shape and per-grid index/value offsets
+"""
+
+import os
+
+import numpy as np
+
+
+# Function to pick the smallest unsigned integer type that can hold a flat voxel index
+def index_dtype(n_voxels):
+    return np.uint16 if n_voxels <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+# Function to convert a dense grid into a sparse dict (values is None for binary grids)
+def to_sparse(grid):
+    grid = np.asarray(grid)
+    flat = grid.reshape(-1)
+    indices = np.flatnonzero(flat)
+    values = flat[indices]
+    binary = bool(np.all(values == 1))
+    return {
+        'shape': grid.shape,
+        'indices': indices.astype(index_dtype(flat.size)),
+        'values': None if binary else values.astype(np.float16),
+    }
+
+
+# Function to report the storage size of a sparse grid in bytes
+def sparse_nbytes(sparse):
+    return sparse['indices'].nbytes + (0 if sparse['values'] is None else sparse['values'].nbytes)
+
+
+# Function to densify sparse grids into a preallocated (N,) + shape float32 batch in one scatter.
+# `shape` is only needed when there are no grids and no `out` to take it from.
+def densify_batch(sparse_grids, out=None, dtype=np.float32, shape=None):
+    if out is not None:
+        # reshape() of a non-contiguous buffer is a copy, so the scatter below would never reach `out`
+        if not out.flags.c_contiguous:
+            raise ValueError("out must be a C-contiguous array")
+        if len(out) < len(sparse_grids):
+            raise ValueError(f"out holds {len(out)} grids, got {len(sparse_grids)}")
+    if sparse_grids:
+        shape = tuple(sparse_grids[0]['shape'])
+    elif out is not None:
+        shape = out.shape[1:]
+    elif shape is None:
+        raise ValueError("Cannot densify an empty batch without a shape or an out buffer")
+    if out is None:
+        out = np.zeros((len(sparse_grids),) + tuple(shape), dtype=dtype)
+    else:
+        out[:len(sparse_grids)] = 0
+    if not sparse_grids:
+        return out
+    flat_out = out.reshape(len(out), -1)
+
+    counts = [len(sparse['indices']) for sparse in sparse_grids]
+    rows = np.repeat(np.arange(len(sparse_grids)), counts)
+    cols = np.concatenate([sparse['indices'] for sparse in sparse_grids]).astype(np.intp)
+    values = np.concatenate([
+        np.ones(len(sparse['indices']), dtype=np.float16) if sparse['values'] is None else sparse['values']
+        for sparse in sparse_grids
+    ])
+    flat_out[rows, cols] = values
+    return out
+
+
+# Function to write many grids into a sparse store at a path prefix
+def write_sparse_store(path, grids):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    shape = None
+    index_offsets, value_offsets = [0], [0]
+    with open(path + '.idx', 'wb') as idx_file, open(path + '.val', 'wb') as val_file:
+        for grid in grids:
+            sparse = grid if isinstance(grid, dict) else to_sparse(grid)
+            if shape is None:
+                shape = tuple(sparse['shape'])
+                dtype = index_dtype(int(np.prod(shape)))
+            elif tuple(sparse['shape']) != shape:
+                raise ValueError(f"Grid shape {sparse['shape']} does not match store shape {shape}")
+            idx_file.write(sparse['indices'].astype(dtype).tobytes())
+            index_offsets.append(index_offsets[-1] + len(sparse['indices']))
+            if sparse['values'] is not None:
+                val_file.write(sparse['values'].astype(np.float16).tobytes())
+                value_offsets.append(value_offsets[-1] + len(sparse['values']))
+            else:
+                value_offsets.append(value_offsets[-1])
+    if shape is None:
+        raise ValueError("No grids to write")
+    np.savez(path + '.npz', shape=np.array(shape), index_offsets=np.array(index_offsets, dtype=np.int64),
+             value_offsets=np.array(value_offsets, dtype=np.int64))
+    return path
+
+
+class SparseVoxelStore:
+    # Read side of the sparse store: memory-mapped, densified per batch on demand
+    def __init__(self, path):
+        with np.load(path + '.npz') as meta:
+            self.shape = tuple(int(n) for n in meta['shape'])
+            self.index_offsets = meta['index_offsets']
+            self.value_offsets = meta['value_offsets']
+        dtype = index_dtype(int(np.prod(self.shape)))
+        self.indices = self._map(path + '.idx', dtype)
+        self.values = self._map(path + '.val', np.float16)
+
+    @staticmethod
+    def _map(path, dtype):
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def __len__(self):
+        return len(self.index_offsets) - 1
+
+    def __getitem__(self, i):
+        indices = self.indices[self.index_offsets[i]:self.index_offsets[i + 1]]
+        v0, v1 = self.value_offsets[i], self.value_offsets[i + 1]
+        values = None if v0 == v1 else self.values[v0:v1]
+        return {'shape': self.shape, 'indices': indices, 'values': values}
+
+    # Function to densify the grids at the given positions into a preallocated batch buffer
+    def batch(self, positions, out=None, dtype=np.float32):
+        return densify_batch([self[i] for i in positions], out=out, dtype=dtype, shape=self.shape)
+
+
+# Function to measure dense against sparse storage for a list of grids
+def measure_storage(grids, label='grids'):
+    n = len(grids)
+    dense_float64 = sum(np.asarray(grid).size * 8 for grid in grids)
+    dense_float32 = dense_float64 // 2
+    sparse = sum(sparse_nbytes(to_sparse(grid)) for grid in grids)
+    print(f"{label}: {n} grids  dense float64 {dense_float64 / 1e6:8.2f} MB  "
+          f"dense float32 {dense_float32 / 1e6:8.2f} MB  sparse {sparse / 1e6:8.3f} MB  "
+          f"({dense_float32 / max(sparse, 1):.0f}x smaller than float32)")
+    return {'grids': n, 'dense_float64_bytes': dense_float64, 'dense_float32_bytes': dense_float32,
+            'sparse_bytes': sparse}
+
+
+# Benchmark storage size for occupancy grids of synthetic proteins
+def benchmark_storage(n_grids=64, n_atoms=5_000):
+    from .voxelizer import CropVoxelizer, synthetic_atoms, voxelize_atoms
+
+    proteins = [synthetic_atoms(n_atoms, seed=i) for i in range(n_grids)]
+    results = {
+        'rescaled_single_channel': measure_storage(
+            [voxelize_atoms(atoms, typed=False) for atoms in proteins], 'rescaled 32^3 x 1'),
+        'rescaled_typed': measure_storage(
+            [voxelize_atoms(atoms, typed=True) for atoms in proteins], 'rescaled 32^3 x 6'),
+        'crop_typed': measure_storage(
+            [CropVoxelizer(atoms).crop(np.zeros(3)) for atoms in proteins], '1A crop 32^3 x 6'),
+    }
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_storage()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Streaming top-k screening of large ligand libraries against several targets.
+
+Ligands are read in batches from a fingerprint shard directory (written by
+fingerprint_pipeline) or straight from a .smi/.csv file. Each batch is
+scored against every target with the two-tower split, and only a bounded
+top-k heap of (score, ligand ID, SMILES) is kept per target. Memory is
+therefore independent of library size.
+
+The heaps and the number of library rows consumed are checkpointed
+atomically every few batches. A killed run restarted with the same
+checkpoint path skips the rows already screened and continues with the
+saved heaps.
+"""
+
+import csv
+import heapq
+import json
+import os
+import time
+
+import numpy as np
+
+from .fingerprint_pipeline import _fingerprint_chunk, iter_chunks, iter_smiles, read_shards
+from .fingerprint_store import N_BITS, RADIUS, unpack_fingerprints
+from .pdb_reader import read_atoms
+from .structure_cache import fetch_protein_atoms
+from .tracing import span
+from .voxelizer import NUM_CHANNELS, voxelize_protein
+
+DEFAULT_TOP_K = 100
+DEFAULT_BATCH_SIZE = 8192
+
+
+class TopKHits:
+    # One bounded min-heap of (score, ligand_id, smiles) per target; the heap root is the k-th best hit
+    def __init__(self, targets, k=DEFAULT_TOP_K):
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        self.k = k
+        self.heaps = {target: [] for target in targets}
+
+    # Function to offer one batch of scores for one target
+    def push(self, target, scores, ligand_ids, smiles):
+        heap = self.heaps[target]
+        # Only scores that beat the current k-th best can enter, and at most k of them
+        candidates = np.flatnonzero(scores > heap[0][0]) if len(heap) == self.k else np.arange(len(scores))
+        if len(candidates) > self.k:
+            candidates = candidates[np.argpartition(scores[candidates], -self.k)[-self.k:]]
+        for i in candidates:
+            entry = (float(scores[i]), ligand_ids[i], smiles[i])
+            if len(heap) < self.k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    # Function to return each target's hits sorted best first
+    def ranked(self):
+        return {target: sorted(heap, reverse=True) for target, heap in self.heaps.items()}
+
+    def to_dict(self):
+        return {'k': self.k, 'heaps': {target: [list(entry) for entry in heap] for target, heap in self.heaps.items()}}
+
+    @classmethod
+    def from_dict(cls, state):
+        hits = cls(state['heaps'], k=state['k'])
+        for target, entries in state['heaps'].items():
+            hits.heaps[target] = [tuple(entry) for entry in entries]
+            heapq.heapify(hits.heaps[target])
+        return hits
+
+
+# Function to atomically write a checkpoint so a killed run never leaves a torn file
+def save_checkpoint(path, library, position, hits):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as handle:
+        json.dump({'library': os.path.abspath(library), 'position': position, 'hits': hits.to_dict()}, handle)
+    os.replace(tmp_path, path)
+
+
+# Function to load a checkpoint, returning (position, hits) or (0, None) if there is none
+def load_checkpoint(path, library, targets, k):
+    if not path or not os.path.exists(path):
+        return 0, None
+    with open(path) as handle:
+        state = json.load(handle)
+    if state['library'] != os.path.abspath(library):
+        raise ValueError(f"Checkpoint {path} belongs to library {state['library']}")
+    hits = TopKHits.from_dict(state['hits'])
+    if hits.k != k or sorted(hits.heaps) != sorted(targets):
+        raise ValueError(f"Checkpoint {path} was written for different targets or top-k")
+    return state['position'], hits
+
+
+# Function to stream (rows consumed, ids, smiles, float32 fingerprints) batches, skipping `start` rows
+def iter_ligand_batches(library, batch_size=DEFAULT_BATCH_SIZE, start=0, smiles_column='smiles', id_column=None,
+                        n_bits=N_BITS, radius=RADIUS):
+    out = np.empty((batch_size, n_bits), dtype=np.float32)
+    if os.path.isdir(library):
+        position = 0
+        for ids, smiles, packed in read_shards(library):
+            if packed.shape[1] * 8 != out.shape[1]:
+                out = np.empty((batch_size, packed.shape[1] * 8), dtype=np.float32)
+            if position + len(ids) <= start:
+                position += len(ids)
+                continue
+            for offset in range(max(start - position, 0), len(ids), batch_size):
+                end = min(offset + batch_size, len(ids))
+                fingerprints = unpack_fingerprints(packed[offset:end], out.shape[1], out=out)[:end - offset]
+                yield position + end, ids[offset:end], smiles[offset:end], fingerprints
+            position += len(ids)
+        return
+
+    # Unparseable SMILES still count as consumed rows so positions stay stable across restarts
+    rows = iter_smiles(library, smiles_column, id_column)
+    for _ in zip(range(start), rows):
+        pass
+    position = start
+    for chunk in iter_chunks(rows, batch_size):
+        position += len(chunk)
+        with span('fingerprint', molecules=len(chunk)):
+            kept, packed, _ = _fingerprint_chunk(chunk, n_bits, radius)
+        if kept:
+            fingerprints = unpack_fingerprints(packed, n_bits, out=out)[:len(kept)]
+            yield position, [mol_id for mol_id, _ in kept], [smiles for _, smiles in kept], fingerprints
+
+
+# Function to screen a ligand library against several targets, keeping the top-k hits per target.
+# `targets` maps target IDs to (32, 32, 32, C) voxel grids, dense or sparse (see sparse_voxels.to_sparse).
+def screen_library(model, targets, library, top_k=DEFAULT_TOP_K, batch_size=DEFAULT_BATCH_SIZE,
+                   checkpoint_path=None, checkpoint_every=50, report_every=50, **library_options):
+    from .screening import TwoTowerScreen
+
+    screen = model if isinstance(model, TwoTowerScreen) else TwoTowerScreen(model, batch_size=batch_size)
+    target_ids = list(targets)
+    grids = [targets[target] for target in target_ids]
+    protein_embeddings = screen.embed_proteins(grids if isinstance(grids[0], dict) else np.stack(grids))
+
+    position, hits = load_checkpoint(checkpoint_path, library, target_ids, top_k)
+    if hits is None:
+        hits = TopKHits(target_ids, k=top_k)
+    elif position:
+        print(f"Resuming from row {position}")
+
+    start_position, start = position, time.perf_counter()
+    batches = 0
+    for position, ids, smiles, fingerprints in iter_ligand_batches(library, batch_size, start=position,
+                                                                   **library_options):
+        scores = screen.score_targets(protein_embeddings, fingerprints)
+        for target, target_scores in zip(target_ids, scores):
+            hits.push(target, target_scores, ids, smiles)
+        batches += 1
+        if checkpoint_path and batches % checkpoint_every == 0:
+            save_checkpoint(checkpoint_path, library, position, hits)
+        if report_every and batches % report_every == 0:
+            rate = (position - start_position) / (time.perf_counter() - start)
+            print(f"Screened {position} ligands x {len(target_ids)} targets ({rate:.0f} ligands/s)")
+
+    if checkpoint_path:
+        save_checkpoint(checkpoint_path, library, position, hits)
+    seconds = time.perf_counter() - start
+    print(f"Screened {position - start_position} ligands x {len(target_ids)} targets in {seconds:.1f}s")
+    return hits.ranked()
+
+
+# Function to write ranked hits to .csv or .parquet (parquet needs pandas with pyarrow or fastparquet)
+def write_hits(ranked, path):
+    rows = [(target, rank, ligand_id, smiles, score)
+            for target, entries in ranked.items()
+            for rank, (score, ligand_id, smiles) in enumerate(entries, start=1)]
+    columns = ['target', 'rank', 'ligand_id', 'smiles', 'score']
+    if path.endswith('.parquet'):
+        import pandas as pd
+
+        pd.DataFrame(rows, columns=columns).to_parquet(path, index=False)
+    else:
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(columns)
+            writer.writerows(rows)
+    return path
+
+
+# Command-line entry point, also used by `bindai screen`
+def main(argv=None, prog=None):
+    import argparse
+
+    from .screening import TwoTowerScreen
+
+    parser = argparse.ArgumentParser(prog=prog, description="Stream a ligand library and keep top-k hits per target")
+    parser.add_argument('model', help="Saved Keras model, e.g. deepdrug1st.keras")
+    parser.add_argument('library', help="Fingerprint shard directory or .smi/.csv file")
+    parser.add_argument('output', help="Output .csv or .parquet path")
+    parser.add_argument('--pdb', nargs='+', required=True, help="Target structure paths or PDB IDs")
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--checkpoint', help="Checkpoint path; an existing checkpoint is resumed")
+    parser.add_argument('--checkpoint-every', type=int, default=50, help="Batches between checkpoints")
+    parser.add_argument('--smiles-column', default='smiles')
+    parser.add_argument('--id-column')
+    args = parser.parse_args(argv)
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+    if args.output.endswith('.parquet'):
+        # Fail before screening rather than after it
+        import pandas  # noqa: F401
+
+    screen = TwoTowerScreen(args.model, batch_size=args.batch_size)
+    voxel_shape = screen.protein_encoder.input.shape[1:]
+    targets = {}
+    for pdb in args.pdb:
+        atoms = read_atoms(pdb) if os.path.exists(pdb) else fetch_protein_atoms(pdb)
+        targets[pdb] = voxelize_protein(atoms, grid_size=voxel_shape[0], typed=voxel_shape[-1] == NUM_CHANNELS)
+    ranked = screen_library(screen, targets, args.library, top_k=args.top_k, batch_size=args.batch_size,
+                            checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every,
+                            smiles_column=args.smiles_column, id_column=args.id_column)
+    write_hits(ranked, args.output)
+    print(f"Wrote {sum(len(entries) for entries in ranked.values())} hits to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
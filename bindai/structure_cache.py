@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Local content-addressed store for PDB structures.
+
+Raw files and their parsed atom tables (.npz) are stored under the SHA-256
+of the raw file, with a small JSON index mapping PDB IDs to content hashes.
+The store is bounded in size (raw files plus parsed tables) and evicts
+least recently used entries. A cache hit records its use by touching the
+raw file's mtime, so reads never rewrite the index. Bio.PDB structures are
+built from the cached atom table, so each file is parsed only once.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from .pdb_reader import atoms_to_structure, read_atoms
+from .tracing import span, traced
+
+DEFAULT_CACHE_DIR = os.environ.get('BINDAI_STRUCTURE_CACHE', './pdb_files')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+class StructureCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, offline=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Offline mode never touches the network; it defaults to the BINDAI_OFFLINE env var
+        self.offline = os.environ.get('BINDAI_OFFLINE') == '1' if offline is None else offline
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'index.json')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as handle:
+            return json.load(handle)
+
+    def _save_index(self):
+        # Write to a temp file first so a killed run never leaves a torn index
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as handle:
+            json.dump(self.index, handle, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def _raw_path(self, digest):
+        return os.path.join(self.objects_dir, f'{digest}.ent')
+
+    def _atoms_path(self, digest):
+        return os.path.join(self.objects_dir, f'{digest}.npz')
+
+    def __contains__(self, pdb_id):
+        entry = self.index.get(pdb_id.upper())
+        return entry is not None and os.path.exists(self._raw_path(entry['sha256']))
+
+    # Function to add a local structure file to the store under a PDB ID
+    def add_file(self, pdb_id, path):
+        with open(path, 'rb') as handle:
+            digest = hashlib.sha256(handle.read()).hexdigest()
+        raw_path = self._raw_path(digest)
+        if not os.path.exists(raw_path):
+            shutil.copyfile(path, raw_path + '.tmp')
+            os.replace(raw_path + '.tmp', raw_path)
+        self.index[pdb_id.upper()] = {
+            'sha256': digest,
+            'bytes': os.path.getsize(raw_path),
+            'last_used': time.time(),
+        }
+        self.evict(keep=pdb_id.upper())
+        return raw_path
+
+    # Function to download a structure from the PDB into the store
+    def _download(self, pdb_id):
+        if self.offline:
+            raise LookupError(f"{pdb_id} is not in the structure cache and offline mode is on")
+        from Bio.PDB import PDBList
+
+        with tempfile.TemporaryDirectory(dir=self.root) as download_dir:
+            path = PDBList(verbose=False).retrieve_pdb_file(pdb_id, pdir=download_dir, file_format='pdb')
+            if path is None or not os.path.exists(path):
+                raise FileNotFoundError(f"Download of {pdb_id} from the PDB failed")
+            return self.add_file(pdb_id, path)
+
+    # Cache hits record their use in the raw file's mtime rather than rewriting index.json
+    def _touch(self, pdb_id):
+        os.utime(self._raw_path(self.index[pdb_id]['sha256']))
+
+    def _last_used(self, entry):
+        raw_path = self._raw_path(entry['sha256'])
+        mtime = os.path.getmtime(raw_path) if os.path.exists(raw_path) else 0.0
+        return max(entry['last_used'], mtime)
+
+    # Function to return the path of the raw structure file, fetching it on a miss
+    @traced('fetch_protein_data')
+    def path(self, pdb_id):
+        pdb_id = pdb_id.upper()
+        if pdb_id not in self:
+            return self._download(pdb_id)
+        self._touch(pdb_id)
+        return self._raw_path(self.index[pdb_id]['sha256'])
+
+    # Function to return the parsed atom table, parsing the raw file only once per content hash
+    def atoms(self, pdb_id):
+        raw_path = self.path(pdb_id)
+        atoms_path = self._atoms_path(self.index[pdb_id.upper()]['sha256'])
+        if os.path.exists(atoms_path):
+            with np.load(atoms_path) as data:
+                return {key: data[key] for key in data.files}
+
+        atoms = read_atoms(raw_path)
+        # np.savez appends .npz to names without it, so the temp name keeps the suffix
+        tmp_path = atoms_path[:-len('.npz')] + '.tmp.npz'
+        np.savez(tmp_path, **atoms)
+        os.replace(tmp_path, atoms_path)
+        # The parsed table counts towards max_bytes too
+        self.evict(keep=pdb_id.upper())
+        return atoms
+
+    # Function to return a Bio.PDB structure built from the cached atom table, without re-parsing the file
+    def structure(self, pdb_id):
+        atoms = self.atoms(pdb_id)
+        with span('build_structure'):
+            return atoms_to_structure(atoms, pdb_id.upper())
+
+    # Function to fetch and parse a list of PDB IDs ahead of a screening run
+    def prewarm(self, pdb_ids):
+        failures = {}
+        for pdb_id in pdb_ids:
+            try:
+                self.atoms(pdb_id)
+            except Exception as e:
+                print(f"Error pre-warming {pdb_id}: {e}")
+                failures[pdb_id] = str(e)
+        return failures
+
+    # Function to report the bytes used by the raw and parsed files of each content hash
+    def _object_bytes(self, digest):
+        total = 0
+        for path in (self._raw_path(digest), self._atoms_path(digest)):
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    def size_bytes(self):
+        digests = {entry['sha256'] for entry in self.index.values()}
+        return sum(self._object_bytes(digest) for digest in digests)
+
+    # Function to drop least recently used entries until the store fits in max_bytes
+    def evict(self, keep=None):
+        by_age = sorted(self.index.items(), key=lambda item: self._last_used(item[1]))
+        total = self.size_bytes()
+        for pdb_id, entry in by_age:
+            if total <= self.max_bytes:
+                break
+            if pdb_id == keep:
+                continue
+            del self.index[pdb_id]
+            digest = entry['sha256']
+            # Objects are shared between IDs with identical content
+            if any(other['sha256'] == digest for other in self.index.values()):
+                continue
+            total -= self._object_bytes(digest)
+            for path in (self._raw_path(digest), self._atoms_path(digest)):
+                if os.path.exists(path):
+                    os.remove(path)
+        self._save_index()
+
+
+_default_cache = None
+
+
+# Function to return the process-wide structure cache
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = StructureCache()
+    return _default_cache
+
+
+# Function to fetch protein structure data from PDB, served from the local cache
+def fetch_protein_data(pdb_id, cache=None):
+    return (cache or default_cache()).structure(pdb_id)
+
+
+# Function to fetch a protein as a parsed atom table, served from the local cache
+def fetch_protein_atoms(pdb_id, cache=None):
+    return (cache or default_cache()).atoms(pdb_id)
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Pre-warm the cache from a file with one PDB ID per line
+    with open(sys.argv[1]) as id_file:
+        ids = [line.strip() for line in id_file if line.strip()]
+    failed = default_cache().prewarm(ids)
+    print(f"Cached {len(ids) - len(failed)} of {len(ids)} structures")
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Lightweight tracing spans for the prediction pipeline.
+
+The pipeline stages (structure fetch, parsing, voxelization, fingerprinting,
+model prediction) are wrapped in named spans. Tracing is off by default, and
+a disabled span is a single flag check. When tracing is on, a span costs a
+few microseconds. Each span is added to a per-stage histogram with
+power-of-two nanosecond buckets, and to a bounded ring buffer of raw events.
+Memory therefore stays constant however long the process runs. The stages
+take hundreds of microseconds or more, so tracing can be left on in
+production.
+
+Statistics are exported as a summary table (count, total, mean, p50, p90,
+p99, max per stage) or as a Chrome trace-event JSON file. The JSON opens in
+chrome://tracing or https://ui.perfetto.dev.
+
+Setting BINDAI_TRACE turns tracing on for a whole process. The summary is
+printed to stderr at exit and, if the value ends in .json, the trace is
+written to that path:
+
+    BINDAI_TRACE=trace.json bindai predict --pdb 1abc.pdb --smiles CCO
+
+The notebook flows use the same stage names. bindai1.py traces its fetch,
+voxelize, fingerprint and predict steps, and bindai2.py its NCBI fetch and
+voxelize steps.
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+DEFAULT_MAX_EVENTS = 100_000
+# Bucket i counts durations d with d.bit_length() == i, i.e. 2**(i-1) <= d < 2**i nanoseconds
+N_BUCKETS = 64
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class StageStats:
+    __slots__ = ('count', 'total_ns', 'min_ns', 'max_ns', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.buckets = [0] * N_BUCKETS
+
+    def add(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        if self.min_ns is None or duration_ns < self.min_ns:
+            self.min_ns = duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.buckets[min(duration_ns.bit_length(), N_BUCKETS - 1)] += 1
+
+    # Function to estimate a quantile from the histogram (geometric bucket midpoint, clamped to min/max)
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                estimate = 2 ** (i - 0.5) if i else 0
+                return min(max(estimate, self.min_ns), self.max_ns)
+        return self.max_ns
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start_ns')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start_ns, time.perf_counter_ns(), self.args)
+        return None
+
+
+class Tracer:
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS):
+        self.enabled = False
+        self.stats = {}
+        self.events = deque(maxlen=max_events)
+        self.origin_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+            self.events.clear()
+            self.origin_ns = time.perf_counter_ns()
+
+    # Function to record one finished span
+    def record(self, name, start_ns, end_ns, args=None):
+        duration_ns = end_ns - start_ns
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = StageStats()
+            stats.add(duration_ns)
+        self.events.append((name, start_ns, duration_ns, threading.get_ident(), args))
+
+    # Function to open a span: `with tracer.span('voxelize', atoms=n): ...`
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args or None)
+
+    # Decorator that wraps every call of a function in a span
+    def traced(self, name):
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start_ns = time.perf_counter_ns()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, start_ns, time.perf_counter_ns())
+            return wrapper
+        return decorate
+
+    # Function to return one summary row per stage, times in milliseconds, slowest total first
+    def summary(self):
+        with self._lock:
+            items = sorted(self.stats.items(), key=lambda item: item[1].total_ns, reverse=True)
+            rows = []
+            for name, stats in items:
+                row = {'stage': name, 'count': stats.count, 'total_ms': stats.total_ns / 1e6,
+                       'mean_ms': stats.total_ns / stats.count / 1e6}
+                for q in QUANTILES:
+                    row[f'p{round(q * 100)}_ms'] = stats.quantile(q) / 1e6
+                row['max_ms'] = stats.max_ns / 1e6
+                rows.append(row)
+        return rows
+
+    def summary_table(self):
+        rows = self.summary()
+        if not rows:
+            return "No spans recorded"
+        columns = [key for key in rows[0] if key != 'stage']
+        width = max(len('stage'), *(len(row['stage']) for row in rows))
+        lines = [f"{'stage':<{width}} " + ' '.join(f'{column:>10}' for column in columns)]
+        for row in rows:
+            cells = [f"{row[column]:>10}" if column == 'count' else f"{row[column]:>10.3f}" for column in columns]
+            lines.append(f"{row['stage']:<{width}} " + ' '.join(cells))
+        return '\n'.join(lines)
+
+    # Function to build a Chrome trace-event document from the buffered spans
+    def chrome_trace(self):
+        pid = os.getpid()
+        trace_events = []
+        for name, start_ns, duration_ns, tid, args in list(self.events):
+            event = {'name': name, 'cat': 'bindai', 'ph': 'X', 'pid': pid, 'tid': tid,
+                     'ts': (start_ns - self.origin_ns) / 1e3, 'dur': duration_ns / 1e3}
+            if args:
+                event['args'] = args
+            trace_events.append(event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as handle:
+            json.dump(self.chrome_trace(), handle)
+        os.replace(tmp_path, path)
+        return path
+
+
+# Process-wide tracer used by the pipeline modules
+TRACER = Tracer()
+span = TRACER.span
+traced = TRACER.traced
+enable = TRACER.enable
+disable = TRACER.disable
+reset = TRACER.reset
+summary_table = TRACER.summary_table
+write_chrome_trace = TRACER.write_chrome_trace
+
+
+def _report_at_exit(path):
+    print(TRACER.summary_table(), file=sys.stderr)
+    if path:
+        TRACER.write_chrome_trace(path)
+        print(f"Wrote trace to {path}", file=sys.stderr)
+
+
+# Function to enable tracing for the whole process when BINDAI_TRACE is set
+def _configure_from_environment():
+    value = os.environ.get('BINDAI_TRACE', '')
+    if value in ('', '0'):
+        return
+    TRACER.enable()
+    atexit.register(_report_at_exit, value if value.endswith('.json') else None)
+
+
+_configure_from_environment()
+
+
+# Benchmark the per-call cost of a span with tracing disabled and enabled
+def benchmark_overhead(n_spans=200_000):
+    tracer = Tracer()
+    results = {}
+    for label, enabled in (('disabled', False), ('enabled', True)):
+        tracer.enabled = enabled
+        start = time.perf_counter()
+        for _ in range(n_spans):
+            with tracer.span('stage'):
+                pass
+        results[label] = (time.perf_counter() - start) / n_spans * 1e9
+        print(f"span {label:<9} {results[label]:8.0f} ns")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_overhead()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Sharded TFRecord storage and tf.data input pipeline for the protein+drug model.
+
+Each record holds one (voxel grid, fingerprint, label) triple. Voxel grids
+are stored sparse (flat indices of non-zero voxels, values only for
+non-binary grids) and fingerprints as packed bits. The pipeline decodes and
+densifies whole batches in parallel with shuffling and prefetch, so the
+training set is bounded by disk rather than RAM.
+"""
+
+import glob
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from .sparse_voxels import to_sparse
+
+GRID_SHAPE = (32, 32, 32, 1)
+N_BITS = 2048
+
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _float_feature(value):
+    return tf.train.Feature(float_list=tf.train.FloatList(value=[value]))
+
+
+def _int64_list_feature(values):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=values))
+
+
+def _float_list_feature(values):
+    return tf.train.Feature(float_list=tf.train.FloatList(value=values))
+
+
+# Function to serialize one (voxel grid, fingerprint, label) triple
+def serialize_example(voxel_grid, fingerprint, label, n_bits=N_BITS):
+    sparse = voxel_grid if isinstance(voxel_grid, dict) else to_sparse(voxel_grid)
+    fingerprint = np.asarray(fingerprint)
+    # Fingerprints may arrive unpacked (n_bits of 0/1) or already packed (n_bits / 8 bytes)
+    if fingerprint.dtype != np.uint8 or fingerprint.size * 8 != n_bits:
+        fingerprint = np.packbits(fingerprint.astype(bool))
+    if fingerprint.size * 8 != n_bits:
+        raise ValueError(f"Fingerprint of {fingerprint.size * 8} bits does not match n_bits={n_bits}")
+    features = {
+        # Int64List is varint-encoded, so small flat indices cost 2-3 bytes each
+        'voxel_indices': _int64_list_feature(sparse['indices'].tolist()),
+        # Binary occupancy grids leave this empty and decode as all ones
+        'voxel_values': _float_list_feature([] if sparse['values'] is None else sparse['values'].tolist()),
+        'fingerprint': _bytes_feature(fingerprint.tobytes()),
+        'label': _float_feature(float(label)),
+    }
+    return tf.train.Example(features=tf.train.Features(feature=features)).SerializeToString()
+
+
+# Function to write examples into TFRecord shards of shard_size records each
+def write_records(examples, output_dir, shard_size=1024, prefix='train', n_bits=N_BITS):
+    os.makedirs(output_dir, exist_ok=True)
+    paths, writer, count = [], None, 0
+    for voxel_grid, fingerprint, label in examples:
+        if writer is None or count == shard_size:
+            if writer is not None:
+                writer.close()
+            paths.append(os.path.join(output_dir, f'{prefix}-{len(paths):05d}.tfrecord'))
+            writer = tf.io.TFRecordWriter(paths[-1])
+            count = 0
+        writer.write(serialize_example(voxel_grid, fingerprint, label, n_bits=n_bits))
+        count += 1
+    if writer is not None:
+        writer.close()
+    return paths
+
+
+# Function to unpack a (batch, n_bits / 8) uint8 tensor of packed bits into float32 bits
+def _unpack_bits(packed):
+    shifts = tf.constant([7, 6, 5, 4, 3, 2, 1, 0], dtype=tf.uint8)
+    bits = tf.bitwise.bitwise_and(tf.bitwise.right_shift(packed[..., None], shifts), 1)
+    return tf.cast(tf.reshape(bits, (tf.shape(packed)[0], -1)), tf.float32)
+
+
+# Function to densify a batch of sparse voxel grids parsed as SparseTensors
+def _densify_voxels(indices, values, batch_size, grid_shape):
+    entry_row = indices.indices[:, 0]
+    # Rows without stored values are binary grids; their entries take the value 1
+    values_per_row = tf.math.bincount(tf.cast(values.indices[:, 0], tf.int32), minlength=batch_size,
+                                      maxlength=batch_size, dtype=tf.int64)
+    has_values = tf.gather(values_per_row > 0, entry_row)
+    value_position = tf.cumsum(tf.cast(has_values, tf.int64)) - 1
+    padded_values = tf.concat([values.values, [1.0]], axis=0)
+    entry_values = tf.where(has_values, tf.gather(padded_values, tf.maximum(value_position, 0)), 1.0)
+
+    n_voxels = int(np.prod(grid_shape))
+    flat = tf.scatter_nd(tf.stack([entry_row, indices.values], axis=1), entry_values,
+                         tf.stack([tf.cast(batch_size, tf.int64), n_voxels]))
+    return tf.reshape(flat, (-1,) + tuple(grid_shape))
+
+
+# Function to decode a batch of serialized records into ((voxels, fingerprints), labels)
+def _decode_batch(serialized, grid_shape, n_bits):
+    parsed = tf.io.parse_example(serialized, {
+        'voxel_indices': tf.io.VarLenFeature(tf.int64),
+        'voxel_values': tf.io.VarLenFeature(tf.float32),
+        'fingerprint': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([], tf.float32),
+    })
+    batch_size = tf.shape(serialized)[0]
+    voxels = _densify_voxels(parsed['voxel_indices'], parsed['voxel_values'], batch_size, grid_shape)
+    packed = tf.reshape(tf.io.decode_raw(parsed['fingerprint'], tf.uint8), (-1, n_bits // 8))
+    return (voxels, _unpack_bits(packed)), parsed['label']
+
+
+# Function to build a tf.data pipeline that feeds build_cnn_with_drug_input models
+# (file_pattern is a glob pattern or a list of TFRecord paths)
+def make_dataset(file_pattern, batch_size=64, shuffle_buffer=4096, grid_shape=GRID_SHAPE, n_bits=N_BITS,
+                 repeat=False, seed=None):
+    paths = sorted(glob.glob(file_pattern)) if isinstance(file_pattern, str) else sorted(file_pattern)
+    if not paths:
+        raise FileNotFoundError(f"No TFRecord files match {file_pattern}")
+    autotune = tf.data.AUTOTUNE
+
+    files = tf.data.Dataset.from_tensor_slices(paths)
+    if shuffle_buffer:
+        files = files.shuffle(len(paths), seed=seed)
+    # Read several shards at once so I/O overlaps with decoding
+    dataset = files.interleave(tf.data.TFRecordDataset, cycle_length=min(len(paths), 8),
+                               num_parallel_calls=autotune, deterministic=not shuffle_buffer)
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed)
+    if repeat:
+        dataset = dataset.repeat()
+    # Decoding whole batches is much cheaper than decoding record by record
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(lambda serialized: _decode_batch(serialized, grid_shape, n_bits),
+                          num_parallel_calls=autotune)
+    return dataset.prefetch(autotune)
+
+
+# Benchmark input throughput on its own against a training step, to show input never starves the model
+def benchmark_input_pipeline(file_pattern, model=None, batch_size=64, steps=50):
+    if model is None:
+        from .models import build_cnn_with_drug_input
+
+        model = build_cnn_with_drug_input(GRID_SHAPE, N_BITS)
+    dataset = make_dataset(file_pattern, batch_size=batch_size, repeat=True)
+    iterator = iter(dataset)
+    next(iterator)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        next(iterator)
+    input_rate = steps * batch_size / (time.perf_counter() - start)
+
+    (voxels, fingerprints), labels = next(iterator)
+    model.train_on_batch([voxels, fingerprints], labels)
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.train_on_batch([voxels, fingerprints], labels)
+    train_rate = steps * batch_size / (time.perf_counter() - start)
+
+    print(f"Input pipeline: {input_rate:10.0f} examples/s")
+    print(f"Training step : {train_rate:10.0f} examples/s")
+    print(f"Headroom      : {input_rate / train_rate:.1f}x")
+    return {'input_examples_per_sec': input_rate, 'train_examples_per_sec': train_rate}
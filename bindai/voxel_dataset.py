@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""PyTorch loader for sparse sequence voxel files (from cnn.py).
+
+Each protein is saved as one .pt file holding the flat indices of its
+non-zero voxels, their float16 values, the grid shape and a label. Batches
+are densified into a single zeroed float32 buffer by collate_sparse_voxels.
+This module needs PyTorch, which is not a BindAI dependency.
+"""
+
+import os
+
+import torch
+from torch.utils.data import Dataset
+
+from .sequences import CHARACTER_LUT, encode_sequences
+
+
+# Function to convert a sequence to a (1, 32, 32, 32) grid of normalized character codes
+def sequence_to_voxel(sequence, grid_size=(32, 32, 32)):
+    grid = encode_sequences([sequence], grid_size, lut=CHARACTER_LUT, wrap=False)[0]
+    return torch.from_numpy(grid).unsqueeze(0)
+
+
+# Function to save a protein sequence as sparse voxel data (non-zero indices + float16 values)
+def save_voxel_data(record_id, sequence, voxel_data_dir, label=1.0):
+    voxel_grid = sequence_to_voxel(sequence)
+    flat = voxel_grid.reshape(-1)
+    indices = torch.nonzero(flat).squeeze(1)
+    save_path = os.path.join(voxel_data_dir, f"{record_id}.pt")
+    torch.save({'indices': indices.to(torch.int32), 'values': flat[indices].half(),
+                'shape': tuple(voxel_grid.shape), 'label': torch.tensor(label)}, save_path)
+    return save_path
+
+
+class ProteinVoxelDataset(Dataset):
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.files = sorted(os.listdir(data_dir))
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, idx):
+        data = torch.load(os.path.join(self.data_dir, self.files[idx]))
+        return data['indices'], data['values'], data['shape'], data['label']
+
+
+# Function to collate sparse samples by densifying the whole batch into one zeroed float32 buffer
+def collate_sparse_voxels(batch):
+    shape = batch[0][2]
+    voxels = torch.zeros((len(batch),) + tuple(shape))
+    flat = voxels.view(len(batch), -1)
+    for i, (indices, values, _, _) in enumerate(batch):
+        flat[i, indices.long()] = values.float()
+    labels = torch.stack([label for _, _, _, label in batch])
+    return voxels, labels
@@ -19,9 +19,11 @@ from tensorflow.keras.layers import Input, concatenate
 from Bio.PDB import PDBList, PDBParser
 from rdkit import Chem
 from rdkit.Chem import AllChem
+from bindai.tracing import span, traced
 import os
 
 # Function to fetch protein structure data from PDB using NCBI API
+@traced('fetch_protein_data')
 def fetch_protein_data(pdb_id):
     pdb_dir = './pdb_files'
     if not os.path.exists(pdb_dir):
@@ -35,9 +37,10 @@ def fetch_protein_data(pdb_id):
     return structure
 
 # Function to convert protein structure into voxel grids
+@traced('voxelize')
 def voxelize_protein(structure, grid_size=32, grid_spacing=1.0):
     # Initialize empty grid
-    grid = np.zeros((grid_size, grid_size, grid_size))
+    grid = np.zeros((grid_size, grid_size, grid_size), dtype=np.float32)
 
     # Calculate center of mass to center the grid
     atom_coords = np.array([atom.get_coord() for atom in structure.get_atoms()])
@@ -54,25 +57,25 @@ def voxelize_protein(structure, grid_size=32, grid_spacing=1.0):
     # Convert to grid indices
     indices = ((scaled_coords + grid_size / 2)).astype(int)
 
-    # Populate grid
-    for idx in indices:
-        x, y, z = idx
-        if 0 <= x < grid_size and 0 <= y < grid_size and 0 <= z < grid_size:
-            grid[x, y, z] = 1.0  # Mark atom presence
+    # Populate grid with a single scatter over all in-bounds atoms
+    inside = np.all((indices >= 0) & (indices < grid_size), axis=1)
+    x, y, z = indices[inside].T
+    grid[x, y, z] = 1.0  # Mark atom presence
 
     return grid
 
 # Function to generate molecular fingerprints from SMILES
+@traced('fingerprint')
 def generate_fingerprint(smiles, n_bits=2048):
     mol = Chem.MolFromSmiles(smiles)
     if mol is not None:
         fp = AllChem.GetMorganFingerprintAsBitVect(mol, radius=2, nBits=n_bits)
-        arr = np.zeros((1,), dtype=int)
+        arr = np.zeros((n_bits,), dtype=np.float32)
         DataStructs.ConvertToNumpyArray(fp, arr)
         return arr
     else:
         print(f"Invalid SMILES string: {smiles}")
-        return np.zeros((n_bits,), dtype=int)
+        return np.zeros((n_bits,), dtype=np.float32)
 
 # Build the CNN model with drug input
 def build_cnn_with_drug_input(protein_input_shape, drug_input_shape):
@@ -163,7 +166,8 @@ new_protein_voxel = new_protein_voxel.reshape(1, 32, 32, 32, 1)
 new_drug_fp = generate_fingerprint(new_smiles).reshape(1, -1)
 
 # Predict binding probability
-prediction = cnn_drug_model.predict([new_protein_voxel, new_drug_fp])
+with span('predict'):
+    prediction = cnn_drug_model.predict([new_protein_voxel, new_drug_fp])
 print(f'Predicted binding site probability for new protein-drug pair: {prediction[0][0]}')
 # Save the trained model
 cnn_drug_model.save('deepdrug1st.keras')  # Save your trained model
@@ -180,39 +184,33 @@ from tensorflow.keras import layers, models
 from tensorflow.keras.layers import Input, concatenate
 from rdkit import Chem
 from rdkit.Chem import AllChem
+from bindai.tracing import span, traced
 from Bio.PDB import PDBList, PDBParser
 import os
 
 # Function to voxelize the protein structure
+@traced('voxelize')
 def voxelize_protein(pdb_file, voxel_size=1.0):
     parser = PDBParser()
     structure = parser.get_structure('protein', pdb_file)
 
     # Extract atom positions
-    atom_positions = []
-    for model in structure:
-        for chain in model:
-            for residue in chain:
-                for atom in residue:
-                    atom_positions.append(atom.coord)
+    atom_positions = np.array([atom.coord for atom in structure.get_atoms()], dtype=np.float32)
 
     # Create a 3D grid (voxel representation)
-    x_max = max(atom_positions, key=lambda x: x[0])[0]
-    y_max = max(atom_positions, key=lambda x: x[1])[1]
-    z_max = max(atom_positions, key=lambda x: x[2])[2]
+    x_max, y_max, z_max = atom_positions.max(axis=0)
 
     grid_size = (int(x_max / voxel_size) + 1, int(y_max / voxel_size) + 1, int(z_max / voxel_size) + 1)
-    voxel_grid = np.zeros(grid_size)
+    voxel_grid = np.zeros(grid_size, dtype=np.float32)
 
-    for pos in atom_positions:
-        x_idx = int(pos[0] / voxel_size)
-        y_idx = int(pos[1] / voxel_size)
-        z_idx = int(pos[2] / voxel_size)
-        voxel_grid[x_idx, y_idx, z_idx] = 1  # Mark the voxel as occupied
+    # Mark every occupied voxel in one scatter
+    idx = (atom_positions / voxel_size).astype(int)
+    voxel_grid[idx[:, 0], idx[:, 1], idx[:, 2]] = 1
 
     return voxel_grid
 
 # Function to generate molecular features from SMILES
+@traced('fingerprint')
 def generate_molecular_features(smiles):
     mol = Chem.MolFromSmiles(smiles)
     if mol is None:
@@ -222,6 +220,7 @@ def generate_molecular_features(smiles):
     return np.array(fingerprint)
 
 # Function to predict interaction
+@traced('predict')
 def predict_interaction(protein_voxel, drug_features, model):
     protein_input = np.expand_dims(protein_voxel, axis=0)  # Expand dims for batch size
     drug_input = np.expand_dims(drug_features, axis=0)  # Expand dims for batch size
@@ -261,9 +260,11 @@ from tensorflow.keras.layers import Input, concatenate
 from Bio.PDB import PDBList, PDBParser
 from rdkit import Chem
 from rdkit.Chem import AllChem
+from bindai.tracing import span, traced
 import os
 
 # Function to fetch protein structure data from PDB using NCBI API
+@traced('fetch_protein_data')
 def fetch_protein_data(pdb_id):
     pdb_dir = './pdb_files'
     if not os.path.exists(pdb_dir):
@@ -277,9 +278,10 @@ def fetch_protein_data(pdb_id):
     return structure
 
 # Function to convert protein structure into voxel grids
+@traced('voxelize')
 def voxelize_protein(structure, grid_size=32, grid_spacing=1.0):
     # Initialize empty grid
-    grid = np.zeros((grid_size, grid_size, grid_size))
+    grid = np.zeros((grid_size, grid_size, grid_size), dtype=np.float32)
 
     # Calculate center of mass to center the grid
     atom_coords = np.array([atom.get_coord() for atom in structure.get_atoms()])
@@ -296,25 +298,25 @@ def voxelize_protein(structure, grid_size=32, grid_spacing=1.0):
     # Convert to grid indices
     indices = ((scaled_coords + grid_size / 2)).astype(int)
 
-    # Populate grid
-    for idx in indices:
-        x, y, z = idx
-        if 0 <= x < grid_size and 0 <= y < grid_size and 0 <= z < grid_size:
-            grid[x, y, z] = 1.0  # Mark atom presence
+    # Populate grid with a single scatter over all in-bounds atoms
+    inside = np.all((indices >= 0) & (indices < grid_size), axis=1)
+    x, y, z = indices[inside].T
+    grid[x, y, z] = 1.0  # Mark atom presence
 
     return grid
 
 # Function to generate molecular fingerprints from SMILES
+@traced('fingerprint')
 def generate_fingerprint(smiles, n_bits=2048):
     mol = Chem.MolFromSmiles(smiles)
     if mol is not None:
         fp = AllChem.GetMorganFingerprintAsBitVect(mol, radius=2, nBits=n_bits)
-        arr = np.zeros((1,), dtype=int)
+        arr = np.zeros((n_bits,), dtype=np.float32)
         DataStructs.ConvertToNumpyArray(fp, arr)
         return arr
     else:
         print(f"Invalid SMILES string: {smiles}")
-        return np.zeros((n_bits,), dtype=int)
+        return np.zeros((n_bits,), dtype=np.float32)
 
 # Build the CNN model with drug input
 def build_cnn_with_drug_input(protein_input_shape, drug_input_shape):
@@ -405,7 +407,8 @@ new_protein_voxel = new_protein_voxel.reshape(1, 32, 32, 32, 1)
 new_drug_fp = generate_fingerprint(new_smiles).reshape(1, -1)
 
 # Predict binding probability
-prediction = cnn_drug_model.predict([new_protein_voxel, new_drug_fp])
+with span('predict'):
+    prediction = cnn_drug_model.predict([new_protein_voxel, new_drug_fp])
 print(f'Predicted binding site probability for new protein-drug pair: {prediction[0][0]}')
 # Save the trained model
 cnn_drug_model.save('deepdrug1st.keras')  # Save your trained model
@@ -424,9 +427,11 @@ from tensorflow.keras.layers import Input, concatenate
 from Bio.PDB import PDBList, PDBParser
 from rdkit import Chem
 from rdkit.Chem import AllChem
+from bindai.tracing import span, traced
 import os
 
 # Function to fetch protein structure data from PDB using NCBI API
+@traced('fetch_protein_data')
 def fetch_protein_data(pdb_id):
     pdb_dir = './pdb_files'
     if not os.path.exists(pdb_dir):
@@ -440,9 +445,10 @@ def fetch_protein_data(pdb_id):
     return structure
 
 # Function to convert protein structure into voxel grids
+@traced('voxelize')
 def voxelize_protein(structure, grid_size=32, grid_spacing=1.0):
     # Initialize empty grid
-    grid = np.zeros((grid_size, grid_size, grid_size))
+    grid = np.zeros((grid_size, grid_size, grid_size), dtype=np.float32)
 
     # Calculate center of mass to center the grid
     atom_coords = np.array([atom.get_coord() for atom in structure.get_atoms()])
@@ -459,25 +465,25 @@ def voxelize_protein(structure, grid_size=32, grid_spacing=1.0):
     # Convert to grid indices
     indices = ((scaled_coords + grid_size / 2)).astype(int)
 
-    # Populate grid
-    for idx in indices:
-        x, y, z = idx
-        if 0 <= x < grid_size and 0 <= y < grid_size and 0 <= z < grid_size:
-            grid[x, y, z] = 1.0  # Mark atom presence
+    # Populate grid with a single scatter over all in-bounds atoms
+    inside = np.all((indices >= 0) & (indices < grid_size), axis=1)
+    x, y, z = indices[inside].T
+    grid[x, y, z] = 1.0  # Mark atom presence
 
     return grid
 
 # Function to generate molecular fingerprints from SMILES
+@traced('fingerprint')
 def generate_fingerprint(smiles, n_bits=2048):
     mol = Chem.MolFromSmiles(smiles)
     if mol is not None:
         fp = AllChem.GetMorganFingerprintAsBitVect(mol, radius=2, nBits=n_bits)
-        arr = np.zeros((1,), dtype=int)
+        arr = np.zeros((n_bits,), dtype=np.float32)
         DataStructs.ConvertToNumpyArray(fp, arr)
         return arr
     else:
         print(f"Invalid SMILES string: {smiles}")
-        return np.zeros((n_bits,), dtype=int)
+        return np.zeros((n_bits,), dtype=np.float32)
 
 # Build the CNN model with drug input
 def build_cnn_with_drug_input(protein_input_shape, drug_input_shape):
@@ -566,7 +572,8 @@ new_protein_voxel = new_protein_voxel.reshape(1, 32, 32, 32, 1)
 new_drug_fp = generate_fingerprint(new_smiles).reshape(1, -1)
 
 # Predict binding probability
-prediction = cnn_drug_model.predict([new_protein_voxel, new_drug_fp])
+with span('predict'):
+    prediction = cnn_drug_model.predict([new_protein_voxel, new_drug_fp])
 print(f'Predicted binding site probability for new protein-drug pair: {prediction[0][0]}')
 # Save the trained model
 cnn_drug_model.save('deepdrug1st.keras')  # Save your trained model
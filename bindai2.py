@@ -12,8 +12,10 @@ import numpy as np
 import pandas as pd
 import tensorflow as tf
 from tensorflow.keras import layers, models
+from bindai.tracing import traced
 
 # 1. Function to fetch data from NCBI using API key
+@traced('fetch_protein_data')
 def fetch_ncbi_data(api_key, query):
     base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
     params = {
@@ -32,6 +34,7 @@ def parse_fasta(fasta_data):
     return sequence
 
 # 3. Feature extraction: Convert amino acid sequence to voxel grid
+@traced('voxelize')
 def sequence_to_voxel_grid(sequence):
     # Define a mapping of amino acids to indices (e.g., using one-hot encoding)
     amino_acids = 'ACDEFGHIKLMNPQRSTVWY'  # Standard amino acids
@@ -145,8 +148,10 @@ import requests
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras import layers, models
+from bindai.tracing import traced
 
 # 1. Function to fetch data from NCBI using API key
+@traced('fetch_protein_data')
 def fetch_ncbi_data(api_key, query):
     base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
     params = {
@@ -165,6 +170,7 @@ def parse_fasta(fasta_data):
     return sequence
 
 # 3.  function to convert protein sequence into input features for CNN and LSTM
+@traced('voxelize')
 def sequence_to_voxel_grid(sequence):
     
     amino_acid_mapping = {
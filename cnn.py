@@ -87,13 +87,16 @@ def sequence_to_voxel(sequence, grid_size=(32, 32, 32)):
         grid[x, y, z] = ord(amino_acid) % 255 / 255.0  # Normalize to [0,1]
     return torch.tensor(grid).float().unsqueeze(0)  # Add channel dimension
 
-# Function to save protein sequence as voxel data
+# Function to save protein sequence as sparse voxel data (non-zero indices + float16 values)
 def save_voxel_data(record, voxel_data_dir):
     sequence = str(record.seq)
     voxel_grid = sequence_to_voxel(sequence)
     label = torch.tensor(1.0)  # Placeholder label
+    flat = voxel_grid.reshape(-1)
+    indices = torch.nonzero(flat).squeeze(1)
     save_path = os.path.join(voxel_data_dir, f"{record.id}.pt")
-    torch.save({'voxel': voxel_grid, 'label': label}, save_path)
+    torch.save({'indices': indices.to(torch.int32), 'values': flat[indices].half(),
+                'shape': tuple(voxel_grid.shape), 'label': label}, save_path)
     print(f"Saved voxel data for {record.id} at {save_path}")
 
 # Fetch, process, and save voxel data
@@ -122,7 +125,18 @@ class ProteinVoxelDataset(Dataset):
 
     def __getitem__(self, idx):
         data = torch.load(os.path.join(self.data_dir, self.files[idx]))
-        return data['voxel'], data['label']
+        return data['indices'], data['values'], data['shape'], data['label']
+
+
+# Collate sparse samples by densifying the whole batch into one zeroed float32 buffer
+def collate_sparse_voxels(batch):
+    shape = batch[0][2]
+    voxels = torch.zeros((len(batch),) + tuple(shape))
+    flat = voxels.view(len(batch), -1)
+    for i, (indices, values, _, _) in enumerate(batch):
+        flat[i, indices.long()] = values.float()
+    labels = torch.stack([label for _, _, _, label in batch])
+    return voxels, labels
 
 # CNN model for protein voxel data
 class ProteinVoxelCNN(nn.Module):
@@ -170,7 +184,7 @@ num_epochs = 20
 # Dataset and DataLoader
 data_dir = "/content/protein_voxel_data"
 dataset = ProteinVoxelDataset(data_dir)
-dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True, collate_fn=collate_sparse_voxels)
 
 # Model, loss function, and optimizer
 model = ProteinVoxelCNN()
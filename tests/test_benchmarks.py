@@ -0,0 +1,24 @@
+import gzip
+import json
+
+import pytest
+
+from bindai.benchmarks import BASELINE, PDB_FIXTURES, compare_results
+from bindai.pdb_reader import read_atoms
+
+
+@pytest.mark.parametrize('size', list(PDB_FIXTURES))
+def test_fixtures_parse_fully_with_biopython(size):
+    from Bio.PDB import PDBParser
+
+    path = PDB_FIXTURES[size]
+    with gzip.open(path, 'rt') as handle:
+        structure = PDBParser(QUIET=True).get_structure(size, handle)
+    assert len(list(structure.get_atoms())) == len(read_atoms(path)['coords'])
+
+
+def test_stored_baseline_has_no_regressions_against_itself():
+    with open(BASELINE) as handle:
+        baseline = json.load(handle)
+    assert 'predict/medium' in baseline['results']
+    assert compare_results(baseline, baseline) == []
@@ -0,0 +1,79 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from bindai import compound_sources
+from bindai.compound_sources import fetch_smiles_from_pubchem
+from bindai.http_cache import ResponseCache
+
+KNOWN = {'1': 'CCO', '2': 'CCN', '3': 'c1ccccc1', '5': 'CC(=O)O'}
+
+
+class FakePubChem(BaseHTTPRequestHandler):
+    failures = {}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.failures.get(self.path, 0) > 0:
+            self.failures[self.path] -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        cids = self.path.split('/compound/cid/')[1].split('/')[0].split(',')
+        if not all(cid.isdigit() for cid in cids):
+            self.send_response(400)
+            self.end_headers()
+            return
+        found = [{'CID': int(cid), 'SMILES': KNOWN[cid]} for cid in cids if cid in KNOWN]
+        if not found:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps({'PropertyTable': {'Properties': found}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def pubchem(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakePubChem)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    monkeypatch.setattr(compound_sources, 'PUBCHEM_URL', url)
+    FakePubChem.failures, FakePubChem.requests = {}, []
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+def test_bad_cid_only_drops_itself(pubchem, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), cache_only=False)
+    smiles = fetch_smiles_from_pubchem(['1', '2', 'bad', '3', '4', '5'], cache=cache, batch_size=6)
+    assert smiles == KNOWN
+
+
+def test_fetch_retries_service_unavailable(pubchem, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), cache_only=False)
+    path = '/compound/cid/1/property/CanonicalSMILES/JSON'
+    FakePubChem.failures[path] = 2
+    body = cache.fetch(pubchem + path, backoff=0.01)
+    assert json.loads(body)['PropertyTable']['Properties'][0]['SMILES'] == 'CCO'
+    assert FakePubChem.requests == [path] * 3
+
+
+def test_unreachable_host_is_reported_not_raised(monkeypatch, tmp_path):
+    monkeypatch.setattr(compound_sources, 'PUBCHEM_URL', 'http://127.0.0.1:9')
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), cache_only=False)
+    delays = []
+    monkeypatch.setattr('bindai.http_cache.time.sleep', delays.append)
+    assert fetch_smiles_from_pubchem(['1'], cache=cache) == {}
+    # Three backoff waits of at least 0.5, 1 and 2 s before giving up; shorter waits are rate spacing
+    assert [int(2 * delay) for delay in delays if delay >= 0.5] == [1, 2, 4]
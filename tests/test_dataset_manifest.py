@@ -0,0 +1,63 @@
+import os
+
+from bindai.dataset_manifest import DatasetManifest
+
+GRID_SIZE = (8, 8, 8)
+
+
+class FakeFetch:
+    # Stands in for NCBI: one record per query, recording which queries were requested
+    def __init__(self):
+        self.sequences = {}
+        self.requested = []
+
+    def __call__(self, queries):
+        self.requested.append(sorted(queries))
+        return {query: [(f'ACC_{query}', '', self.sequences.get(query, f'MK{query}A'))] for query in queries}
+
+
+def test_incremental_rebuild(tmp_path):
+    fetch = FakeFetch()
+    dataset = DatasetManifest(str(tmp_path), grid_size=GRID_SIZE)
+    rows = [('BRCA1', 1.0), ('TP53', 0.0), ('brca1 ', 1.0), ('EGFR', 1.0), ('EGFR', 0.0)]
+
+    summary = dataset.build(rows, fetch=fetch)
+    # Case/whitespace duplicates collapse; EGFR's conflicting labels are skipped by default
+    assert (summary['unique'], summary['conflicts'], summary['fetched'], summary['encoded']) == (3, 1, 2, 2)
+    assert fetch.requested == [['BRCA1', 'TP53']]
+
+    # Reopening and rebuilding the same rows fetches and encodes nothing
+    dataset = DatasetManifest(str(tmp_path), grid_size=GRID_SIZE)
+    summary = dataset.build(rows, fetch=fetch)
+    assert (summary['fetched'], summary['encoded']) == (0, 0)
+    assert len(fetch.requested) == 1
+
+    # Only the new query is fetched and encoded; label changes need no fetch
+    rows = [('BRCA1', 0.0), ('TP53', 0.0), ('KRAS', 1.0)]
+    summary = dataset.build(rows, fetch=fetch)
+    assert (summary['new'], summary['fetched'], summary['encoded']) == (1, 1, 1)
+    assert fetch.requested[-1] == ['KRAS']
+    assert dataset.entries['BRCA1']['label'] == 0.0
+
+    # A refresh fetches everything but re-encodes only the sequence that changed
+    fetch.sequences['TP53'] = 'MEEPQSDPSV'
+    summary = dataset.build(rows, fetch=fetch, refresh=True)
+    assert (summary['fetched'], summary['changed'], summary['encoded']) == (3, 1, 1)
+    # The old TP53 sequence and grid are no longer referenced and are removed
+    assert summary['removed_objects'] == 2
+
+    # Dropping a row removes its entry and its objects
+    summary = dataset.build(rows[:2], fetch=fetch)
+    assert (summary['removed'], summary['fetched'], summary['removed_objects']) == (1, 0, 2)
+    queries, X, y = dataset.arrays()
+    assert sorted(queries) == ['BRCA1', 'TP53'] and X.shape == (2,) + GRID_SIZE + (1,)
+    assert len(os.listdir(tmp_path / 'objects')) == 4
+
+
+def test_missing_grid_is_re_encoded_without_fetching(tmp_path):
+    fetch = FakeFetch()
+    dataset = DatasetManifest(str(tmp_path), grid_size=GRID_SIZE)
+    dataset.build([('BRCA1', 1.0)], fetch=fetch)
+    os.remove(dataset._grid_path(dataset.entries['BRCA1']['sha256']))
+    summary = dataset.build([('BRCA1', 1.0)], fetch=fetch)
+    assert (summary['fetched'], summary['encoded']) == (0, 1)
@@ -0,0 +1,60 @@
+import gzip
+
+import pytest
+
+from bindai.fasta import iter_fasta, write_fasta
+
+FASTA_TEXT = """\
+comment line before the first record
+>sp|P1|ONE first protein
+MKTAYIAKQR
+QISFVKSHFS
+>sp|P2|TWO
+MSTNPKPQRK
+
+>sp|P3|THREE third\tprotein
+ACDEFGHIKL\r
+MNPQ RSTVWY
+>EMPTY
+>LAST
+GGGG"""
+
+
+def _biopython_records(path):
+    from Bio import SeqIO
+
+    with (gzip.open(path, 'rt') if str(path).endswith('.gz') else open(path)) as handle:
+        return [(record.id, str(record.seq).replace(' ', '').encode()) for record in SeqIO.parse(handle, 'fasta')]
+
+
+@pytest.mark.parametrize('suffix', ['.fasta', '.fasta.gz'])
+@pytest.mark.parametrize('chunk_size', [7, 64, 1 << 20])
+def test_matches_biopython(tmp_path, suffix, chunk_size):
+    path = tmp_path / f'test{suffix}'
+    data = FASTA_TEXT.replace('comment line before the first record\n', '').encode()
+    path.write_bytes(gzip.compress(data) if suffix.endswith('.gz') else data)
+    assert list(iter_fasta(str(path), chunk_size=chunk_size)) == _biopython_records(path)
+
+
+def test_text_before_first_header_is_skipped(tmp_path):
+    path = tmp_path / 'test.fasta'
+    path.write_text(FASTA_TEXT)
+    assert [record_id for record_id, _ in iter_fasta(str(path), chunk_size=5)] == \
+        ['sp|P1|ONE', 'sp|P2|TWO', 'sp|P3|THREE', 'EMPTY', 'LAST']
+
+
+def test_multi_member_gzip_round_trip(tmp_path):
+    records = [(f'SEQ{i}', b'ACDEFGHIKLMNPQRSTVWY' * (i + 1)) for i in range(50)]
+    first, second = tmp_path / 'a.fasta.gz', tmp_path / 'b.fasta.gz'
+    write_fasta(records[:20], str(first))
+    write_fasta(records[20:], str(second))
+    path = tmp_path / 'joined.fasta.gz'
+    path.write_bytes(first.read_bytes() + second.read_bytes())
+    assert list(iter_fasta(str(path), chunk_size=100)) == records
+    assert _biopython_records(path) == records
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.fasta'
+    path.write_bytes(b'')
+    assert list(iter_fasta(str(path))) == []
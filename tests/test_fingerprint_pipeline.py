@@ -0,0 +1,41 @@
+import numpy as np
+
+from bindai.fingerprint_pipeline import fingerprint_library, iter_smiles, read_shards
+from bindai.fingerprint_store import packed_fingerprint
+
+
+def _read_all(output_dir):
+    ids, smiles, packed = [], [], []
+    for shard_ids, shard_smiles, shard_packed in read_shards(output_dir):
+        ids += shard_ids
+        smiles += shard_smiles
+        packed.append(np.array(shard_packed))
+    return ids, smiles, np.concatenate(packed)
+
+
+def test_multi_column_smi_round_trip(tmp_path):
+    library = tmp_path / 'library.smi'
+    library.write_text("CCO\tethanol\textra\tcolumns\n"
+                       "c1ccccc1O phenol 94.11\n"
+                       "not_a_smiles\tbad\n"
+                       "CC(=O)O\n")
+    assert list(iter_smiles(str(library))) == [('ethanol', 'CCO'), ('phenol', 'c1ccccc1O'),
+                                               ('bad', 'not_a_smiles'), ('3', 'CC(=O)O')]
+
+    output_dir = str(tmp_path / 'shards')
+    stats = fingerprint_library(str(library), output_dir, workers=1, shard_size=2)
+    ids, smiles, packed = _read_all(output_dir)
+    assert stats['rejected'] == 1
+    assert ids == ['ethanol', 'phenol', '3']
+    assert smiles == ['CCO', 'c1ccccc1O', 'CC(=O)O']
+    np.testing.assert_array_equal(packed, np.stack([packed_fingerprint(s) for s in smiles]))
+
+
+def test_csv_ids_with_tabs_do_not_corrupt_smiles(tmp_path):
+    library = tmp_path / 'library.csv'
+    library.write_text('name,smiles\n"tab\tname",CCO\n"line\nbreak",CCN\n')
+    output_dir = str(tmp_path / 'shards')
+    fingerprint_library(str(library), output_dir, id_column='name', workers=1)
+    ids, smiles, _ = _read_all(output_dir)
+    assert ids == ['tab name', 'line break']
+    assert smiles == ['CCO', 'CCN']
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from rdkit import Chem, DataStructs
+from rdkit.Chem import AllChem
+
+from bindai.fingerprint_store import FingerprintStore, generate_fingerprint
+
+SMILES = ['CCO', 'c1ccccc1O', 'CC(=O)Oc1ccccc1C(=O)O', 'CN1C=NC2=C1C(=O)N(C(=O)N2C)C', 'OCC', 'C1CC1N']
+
+
+def _reference_bits(smiles, n_bits=2048, radius=2):
+    fingerprint = AllChem.GetMorganFingerprintAsBitVect(Chem.MolFromSmiles(smiles), radius, nBits=n_bits)
+    bits = np.zeros((n_bits,), dtype=np.float32)
+    DataStructs.ConvertToNumpyArray(fingerprint, bits)
+    return bits
+
+
+@pytest.mark.parametrize('smiles', SMILES)
+def test_generate_fingerprint_matches_rdkit_bit_vector(smiles):
+    np.testing.assert_array_equal(generate_fingerprint(smiles), _reference_bits(smiles))
+
+
+def test_store_rows_match_rdkit_and_survive_reopen(tmp_path):
+    path = str(tmp_path / 'store')
+    store = FingerprintStore(path, n_bits=1024, radius=3)
+    batch = store.get_batch(SMILES)
+    expected = np.stack([_reference_bits(smiles, 1024, 3) for smiles in SMILES])
+    np.testing.assert_array_equal(batch, expected)
+    # 'CCO' and 'OCC' share one canonical row
+    assert len(store) == len(SMILES) - 1
+
+    reopened = FingerprintStore(path, n_bits=1024, radius=3)
+    np.testing.assert_array_equal(reopened.get_batch(SMILES), expected)
+    assert len(reopened) == len(store)
+
+
+def test_reopen_with_other_parameters_fails(tmp_path):
+    path = str(tmp_path / 'store')
+    FingerprintStore(path, n_bits=1024).get_batch(SMILES)
+    with pytest.raises(ValueError):
+        FingerprintStore(path, n_bits=2048)
+    with pytest.raises(ValueError):
+        FingerprintStore(path, n_bits=1024, radius=3)
+
+
+def test_reopen_truncates_a_torn_append(tmp_path):
+    path = str(tmp_path / 'store')
+    store = FingerprintStore(path, n_bits=1024)
+    expected = store.get_batch(SMILES[:3])
+    # Crash between the two writes: rows in .fp without keys, plus half a key line
+    with open(store.bits_path, 'ab') as handle:
+        handle.write(b'\xff' * 200)
+    with open(store.keys_path, 'a') as handle:
+        handle.write('CCN')
+
+    reopened = FingerprintStore(path, n_bits=1024)
+    assert len(reopened) == 3
+    np.testing.assert_array_equal(reopened.get_batch(SMILES[:3]), expected)
+    np.testing.assert_array_equal(reopened.get('CCN'), _reference_bits('CCN', 1024))
+    assert len(FingerprintStore(path, n_bits=1024)) == 4
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+
+from bindai.http_cache import CacheMissError, ResponseCache
+from bindai.ncbi import NCBIFetcher, StubEutilsServer, TokenBucket
+
+
+@pytest.fixture
+def stub():
+    server = StubEutilsServer(latency=0.0, records_per_term=5, fail_every=4, sequence_length=30).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _fetcher(server, cache=False, **options):
+    options = dict({'rate': 1e6, 'backoff': 0.01, 'batch_size': 4}, **options)
+    return NCBIFetcher(base_url=server.url, cache=cache, **options)
+
+
+def test_fetch_terms_retries_and_deduplicates(stub):
+    fetcher = _fetcher(stub)
+    results = fetcher.run(fetcher.fetch_terms, ['TP53[Gene]', 'EGFR[Gene]', 'TP53[Gene]'], max_per_term=3)
+
+    assert list(results) == ['TP53[Gene]', 'EGFR[Gene]']
+    for term, records in results.items():
+        assert [accession for accession, _, _ in records] == stub.search_ids(term)[:3]
+        assert all(len(sequence) == 30 for _, _, sequence in records)
+    # Every fourth request fails with 503 and is retried
+    assert fetcher.stats['retries'] > 0
+
+
+def test_fetch_query_pages_up_to_max_records(stub):
+    stub.records_per_term = 25
+    fetcher = _fetcher(stub, batch_size=10)
+    records = fetcher.run(fetcher.fetch_query, 'KRAS[Gene]', max_records=17)
+    assert [accession for accession, _, _ in records] == stub.search_ids('KRAS[Gene]')[:17]
+    assert len(fetcher.run(fetcher.fetch_query, 'KRAS[Gene]')) == 25
+
+
+def test_token_bucket_spaces_requests():
+    bucket = TokenBucket(rate=50)
+
+    async def acquire_all():
+        start = time.perf_counter()
+        times = []
+        for _ in range(6):
+            await bucket.acquire()
+            times.append(time.perf_counter() - start)
+        return times
+
+    times = asyncio.run(acquire_all())
+    # The first token is free, then one every 1/rate seconds
+    assert times[-1] >= 5 / 50 * 0.95
+    assert min(b - a for a, b in zip(times, times[1:])) >= 1 / 50 * 0.9
+
+
+def test_second_run_is_served_from_cache(stub, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), cache_only=False)
+    terms = ['TP53[Gene]', 'EGFR[Gene]']
+    fetcher = _fetcher(stub, cache=cache)
+    first = fetcher.run(fetcher.fetch_terms, terms)
+
+    requests = stub.requests
+    rerun = _fetcher(stub, cache=cache)
+    assert rerun.run(rerun.fetch_terms, terms) == first
+    assert rerun.stats['requests'] == 0 and stub.requests == requests
+    cache.close()
+
+
+def test_cache_only_miss_raises(stub, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), cache_only=True)
+    fetcher = _fetcher(stub, cache=cache)
+    with pytest.raises(CacheMissError):
+        fetcher.run(fetcher.fetch_terms, ['TP53[Gene]'])
+    assert stub.requests == 0
+    cache.close()
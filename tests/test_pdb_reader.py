@@ -0,0 +1,77 @@
+import gzip
+import warnings
+
+import numpy as np
+import pytest
+
+from bindai.pdb_reader import read_atoms
+
+PDB_TEXT = """\
+HEADER    TEST
+ATOM      1  N   MET A   1      11.104   6.134  -6.504  1.00 10.00           N
+ATOM      2  CA  MET A   1      11.639   6.071  -5.147  1.00 12.50           C
+ATOM      3  C   MET A   1      12.000   4.600  -4.900  1.00  0.00           C
+ATOM      4  O   MET A   1      13.100   4.200  -5.300
+ATOM      5  CB  MET A   1      10.500   6.800  -4.300  1.00
+HETATM    6  O   HOH A 101      20.000  21.000  22.000  1.00 30.00           O
+END
+"""
+
+TWO_MODELS = """\
+MODEL        1
+ATOM      1  CA  GLY A   1       1.000   2.000   3.000  1.00  5.00           C
+ENDMDL
+MODEL        2
+ATOM      1  CA  GLY A   1       9.000   9.000   9.000  1.00  5.00           C
+ENDMDL
+END
+"""
+
+
+def _biopython_atoms(path):
+    from Bio.PDB import PDBParser
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path)) as handle:
+            structure = PDBParser(QUIET=True).get_structure('test', handle)
+    return list(next(iter(structure)).get_atoms())
+
+
+@pytest.mark.parametrize('suffix', ['.pdb', '.pdb.gz'])
+def test_matches_biopython(tmp_path, suffix):
+    path = tmp_path / f'test{suffix}'
+    if suffix.endswith('.gz'):
+        path.write_bytes(gzip.compress(PDB_TEXT.encode()))
+    else:
+        path.write_text(PDB_TEXT)
+    atoms = read_atoms(str(path))
+    reference = _biopython_atoms(str(path))
+
+    assert len(atoms['coords']) == len(reference)
+    np.testing.assert_allclose(atoms['coords'], [atom.coord for atom in reference], atol=1e-3)
+    assert list(atoms['name']) == [atom.get_name() for atom in reference]
+    assert list(atoms['resname']) == [atom.get_parent().get_resname() for atom in reference]
+    assert list(atoms['hetero']) == [atom.get_parent().id[0] != ' ' for atom in reference]
+
+
+def test_short_lines_read_blank_b_factor_as_zero(tmp_path):
+    path = tmp_path / 'short.pdb'
+    path.write_text(PDB_TEXT)
+    atoms = read_atoms(str(path))
+    np.testing.assert_array_equal(atoms['b_factor'][:5], [10.0, 12.5, 0.0, 0.0, 0.0])
+    # Element columns are missing on the short lines and fall back to the atom name
+    assert list(atoms['element']) == ['N', 'C', 'C', 'O', 'C', 'O']
+
+
+def test_crlf_and_first_model_only(tmp_path):
+    path = tmp_path / 'models.pdb'
+    path.write_bytes(TWO_MODELS.replace('\n', '\r\n').encode())
+    np.testing.assert_allclose(read_atoms(str(path))['coords'], [[1.0, 2.0, 3.0]])
+    assert len(read_atoms(str(path), first_model_only=False)['coords']) == 2
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.pdb'
+    path.write_bytes(b'')
+    assert len(read_atoms(str(path))['coords']) == 0
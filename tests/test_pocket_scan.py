@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from bindai.cli import main
+from bindai.models import build_cnn_with_drug_input
+from bindai.pocket_scan import PocketScanner
+from bindai.voxelizer import synthetic_atoms, voxelize_box
+
+
+def test_scan_matches_fused_model_on_every_crop():
+    tf.keras.utils.set_random_seed(0)
+    model = build_cnn_with_drug_input((20, 20, 20, 1), 64)
+    atoms = synthetic_atoms(400, seed=3)
+    fingerprint = (np.random.default_rng(0).random(64) < 0.2).astype(np.float32)
+
+    # Two windows per tile, so the score map is assembled from several tiles
+    scanner = PocketScanner(model, tile_windows=2)
+    score_map, origin, sites = scanner.scan(atoms, fingerprint, top_k=3)
+    assert min(score_map.shape) >= 2 and max(score_map.shape) > 2
+
+    indices = list(np.ndindex(score_map.shape))
+    crops = np.stack([voxelize_box(atoms, origin + np.array(index) * scanner.stride * scanner.spacing,
+                                   scanner.crop_size, spacing=scanner.spacing, typed=False) for index in indices])
+    fused = model.predict([crops, np.repeat(fingerprint[None], len(indices), axis=0)], verbose=0)[:, 0]
+    np.testing.assert_allclose([score_map[index] for index in indices], fused, atol=1e-5)
+
+    assert sites[0]['score'] == score_map.max()
+    for a in range(len(sites)):
+        for b in range(a + 1, len(sites)):
+            assert np.linalg.norm(sites[a]['center'] - sites[b]['center']) >= 8.0
+
+
+@pytest.mark.parametrize('top_k', [0, -1])
+def test_rejects_non_positive_top_k(top_k, capsys):
+    scanner = PocketScanner(build_cnn_with_drug_input((20, 20, 20, 1), 64))
+    with pytest.raises(ValueError):
+        scanner.top_sites(np.zeros((3, 3, 3), dtype=np.float32), np.zeros(3), top_k=top_k)
+    with pytest.raises(SystemExit):
+        main(['scan', '--pdb', '1abc', '--smiles', 'CCO', '--top-k', str(top_k)])
+    assert '--top-k must be at least 1' in capsys.readouterr().err
@@ -0,0 +1,30 @@
+import numpy as np
+
+from bindai.quantize import split_calibration_batches
+from bindai.training_records import write_records
+
+
+def _write(tmp_path, n, shard_size):
+    rng = np.random.default_rng(0)
+    examples = [((rng.random((32, 32, 32, 1)) < 0.01).astype(np.float32),
+                 (rng.random(2048) < 0.1).astype(np.uint8), float(i)) for i in range(n)]
+    write_records(examples, str(tmp_path), shard_size=shard_size)
+    return str(tmp_path / '*.tfrecord')
+
+
+def _fingerprint_rows(batches):
+    return {fingerprints[i].tobytes() for _, fingerprints in batches for i in range(len(fingerprints))}
+
+
+def test_calibration_and_drift_batches_are_disjoint(tmp_path):
+    # One shard: too few records for 2 x 4 batches, so the single pass is split in half rather than repeated
+    pattern = _write(tmp_path / 'one', 12, shard_size=12)
+    calibration, drift = split_calibration_batches(pattern, n_batches=4, batch_size=2)
+    assert len(calibration) == len(drift) == 3
+    assert not _fingerprint_rows(calibration) & _fingerprint_rows(drift)
+
+    # Several shards: separate shard sets
+    pattern = _write(tmp_path / 'many', 12, shard_size=3)
+    calibration, drift = split_calibration_batches(pattern, n_batches=8, batch_size=2)
+    assert sum(len(f) for _, f in calibration) == sum(len(f) for _, f in drift) == 6
+    assert not _fingerprint_rows(calibration) & _fingerprint_rows(drift)
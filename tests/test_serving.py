@@ -0,0 +1,53 @@
+import json
+import threading
+import urllib.request
+
+import pytest
+
+from bindai.models import build_cnn_with_drug_input
+from bindai.serving import ScoringHandler, ScoringServer, ScoringService, load_test
+
+PDB_TEXT = """\
+ATOM      1  N   MET A   1      11.104   6.134  -6.504  1.00 10.00           N
+ATOM      2  CA  MET A   1      11.639   6.071  -5.147  1.00 12.50           C
+ATOM      3  C   MET A   1      12.000   4.600  -4.900  1.00  0.00           C
+ATOM      4  O   MET A   1      13.100   4.200  -5.300  1.00  0.00           O
+END
+"""
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    pdb = tmp_path_factory.mktemp('serving') / 'test.pdb'
+    pdb.write_text(PDB_TEXT)
+    service = ScoringService(build_cnn_with_drug_input((20, 20, 20, 1), 64), max_delay_ms=1.0)
+    handler = type('TestScoringHandler', (ScoringHandler,), {'service': service})
+    http = ScoringServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=http.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{http.server_address[1]}', str(pdb)
+    http.shutdown()
+    http.server_close()
+
+
+def _post(url, payload):
+    request = urllib.request.Request(url + '/score', data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_list_request_reports_errors_per_item(server):
+    url, pdb = server
+    results = _post(url, [{'pdb': pdb, 'smiles': 'CCO'}, {'pdb': pdb, 'smiles': 'not-a-smiles'},
+                          {'pdb': pdb, 'smiles': 'c1ccccc1'}])
+    assert [result['score'] is None for result in results] == [False, True, False]
+    assert 'Invalid SMILES' in results[1]['error']
+
+
+def test_load_test_counts_errors(server):
+    url, pdb = server
+    report = load_test([(pdb, 'CCO'), (pdb, 'not-a-smiles')], url=url, n_requests=6, concurrency=2)
+    assert report['errors'] == 3
+    assert report['error_counts'] == {'HTTP 400': 3}
+    assert report['p50_ms'] is not None
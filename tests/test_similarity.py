@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from bindai.fingerprint_pipeline import fingerprint_library
+from bindai.similarity import SimilarityIndex, synthetic_fingerprints
+
+
+def _tanimoto(packed, query):
+    bits = np.unpackbits(packed, axis=1).astype(bool)
+    query = np.unpackbits(query).astype(bool)
+    intersection = (bits & query).sum(axis=1)
+    union = (bits | query).sum(axis=1)
+    return np.where(union > 0, intersection / np.maximum(union, 1), 0.0)
+
+
+@pytest.fixture(scope='module')
+def library():
+    packed = synthetic_fingerprints(3000, n_bits=256, mean_bits=20, sd_bits=8, seed=0)
+    # Near-duplicates of the first rows so thresholds above 0.5 have hits
+    queries = packed[:5].copy()
+    queries[:, 0] ^= 0b1000_0001
+    return packed, queries
+
+
+@pytest.mark.parametrize('serial', [True, False])
+def test_matches_brute_force(library, serial):
+    packed, queries = library
+    with SimilarityIndex.build(packed, workers=2, block_rows=256) as index:
+        for query in queries:
+            expected = _tanimoto(packed, query)
+            top = index.top_k(query, k=10, serial=serial)
+            np.testing.assert_allclose([score for _, score in top], np.sort(expected)[::-1][:10], rtol=1e-6)
+            for row, score in top:
+                assert expected[row] == pytest.approx(score)
+
+            hits = index.threshold_query(query, 0.5, serial=serial)
+            assert sorted(row for row, _ in hits) == sorted(np.flatnonzero(expected >= 0.5 - 1e-6).tolist())
+
+
+def test_on_disk_index_from_shards_matches_in_memory(tmp_path):
+    smiles = ['CCO', 'CCN', 'c1ccccc1', 'c1ccccc1O', 'CC(=O)O', 'CCCCCC', 'c1ccncc1', 'CC(C)O']
+    library = tmp_path / 'library.smi'
+    library.write_text(''.join(f'{s} L{i}\n' for i, s in enumerate(smiles)))
+    fingerprint_library(str(library), str(tmp_path / 'shards'), workers=1, chunk_size=3, shard_size=3)
+
+    with SimilarityIndex.from_shards(str(tmp_path / 'shards')) as in_memory, \
+            SimilarityIndex.from_shards(str(tmp_path / 'shards'), path=str(tmp_path / 'index'),
+                                        chunk_rows=2) as on_disk:
+        assert isinstance(on_disk.words, np.memmap)
+        np.testing.assert_array_equal(np.asarray(on_disk.words), in_memory.words)
+        query = np.asarray(in_memory.words[0]).view(np.uint8)
+        assert on_disk.top_k(query, k=3) == in_memory.top_k(query, k=3)
+        assert {label for label, _ in on_disk.top_k(query, k=8)} == {f'L{i}' for i in range(8)}
+
+
+@pytest.mark.parametrize('k', [0, -2])
+def test_top_k_rejects_non_positive_k(library, k):
+    packed, queries = library
+    with SimilarityIndex.build(packed, workers=1) as index:
+        with pytest.raises(ValueError):
+            index.top_k(queries[0], k=k)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from bindai.sparse_voxels import SparseVoxelStore, densify_batch, to_sparse, write_sparse_store
+
+
+def _grids(n, shape=(8, 8, 8, 2), seed=0):
+    rng = np.random.default_rng(seed)
+    grids = (rng.random((n,) + shape) < 0.05).astype(np.float32)
+    grids[0] *= rng.random(shape).astype(np.float32)
+    return grids
+
+
+def test_round_trip_through_store(tmp_path):
+    grids = _grids(5)
+    store = SparseVoxelStore(write_sparse_store(str(tmp_path / 'grids'), grids))
+    assert len(store) == 5
+    np.testing.assert_allclose(store.batch([4, 0, 2]), grids[[4, 0, 2]], atol=1e-3)
+
+
+def test_reused_out_buffer_is_cleared():
+    grids = _grids(4)
+    out = densify_batch([to_sparse(grid) for grid in grids])
+    densify_batch([to_sparse(grids[3])], out=out)
+    np.testing.assert_allclose(out[0], grids[3])
+
+
+def test_empty_batch():
+    assert densify_batch([], shape=(8, 8, 8, 2)).shape == (0, 8, 8, 8, 2)
+    out = np.ones((2, 8, 8, 8, 2), dtype=np.float32)
+    assert densify_batch([], out=out) is out
+    with pytest.raises(ValueError):
+        densify_batch([])
+
+
+def test_rejects_non_contiguous_out():
+    out = np.zeros((8, 8, 8, 4), dtype=np.float32)[..., :2]
+    with pytest.raises(ValueError):
+        densify_batch([to_sparse(_grids(1)[0])], out=out)
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pytest
+
+from bindai.benchmarks import SMILES_FIXTURE
+from bindai.streaming_screen import TopKHits, screen_library
+
+
+def test_keeps_best_k_across_batches():
+    rng = np.random.default_rng(0)
+    scores = rng.random(1000).astype(np.float32)
+    hits = TopKHits(['t'], k=5)
+    for start in range(0, 1000, 64):
+        ids = [f'L{i}' for i in range(start, min(start + 64, 1000))]
+        hits.push('t', scores[start:start + 64], ids, ids)
+    best = np.argsort(scores)[::-1][:5]
+    assert [ligand_id for _, ligand_id, _ in hits.ranked()['t']] == [f'L{i}' for i in best]
+    assert TopKHits.from_dict(hits.to_dict()).ranked() == hits.ranked()
+
+
+@pytest.mark.parametrize('k', [0, -1])
+def test_rejects_non_positive_k(k):
+    with pytest.raises(ValueError):
+        TopKHits(['t'], k=k)
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def _library(tmp_path, kind):
+    with open(SMILES_FIXTURE) as handle:
+        smiles = [line.split()[0] for line in handle if line.strip()]
+    # An unparseable row still counts towards the checkpointed position
+    smiles.insert(7, 'not-a-smiles')
+    path = tmp_path / 'library.smi'
+    path.write_text(''.join(f'{s} L{i:03d}\n' for i, s in enumerate(smiles)))
+    if kind == 'smi':
+        return str(path)
+    from bindai.fingerprint_pipeline import fingerprint_library
+
+    fingerprint_library(str(path), str(tmp_path / 'shards'), workers=1, chunk_size=8, shard_size=16)
+    return str(tmp_path / 'shards')
+
+
+@pytest.mark.parametrize('kind', ['shards', 'smi'])
+def test_resume_from_checkpoint_matches_uninterrupted_run(tmp_path, kind):
+    import tensorflow as tf
+
+    from bindai.models import build_cnn_with_drug_input
+    from bindai.screening import TwoTowerScreen
+
+    tf.keras.utils.set_random_seed(0)
+    screen = TwoTowerScreen(build_cnn_with_drug_input((20, 20, 20, 1), 2048), batch_size=8)
+    rng = np.random.default_rng(0)
+    targets = {name: (rng.random((20, 20, 20, 1)) < 0.05).astype(np.float32) for name in ('T1', 'T2')}
+    library = _library(tmp_path, kind)
+    options = {'top_k': 5, 'batch_size': 8, 'report_every': 0}
+
+    score_targets, calls = screen.score_targets, []
+
+    def counting_score_targets(*args):
+        calls.append(1)
+        # Fail on the fourth ligand batch; the checkpoint then holds the state after the third
+        if interrupt and len(calls) == 4:
+            raise _Interrupted()
+        return score_targets(*args)
+
+    screen.score_targets = counting_score_targets
+    interrupt = False
+    expected = screen_library(screen, targets, library, **options)
+    n_batches = len(calls)
+
+    checkpoint = str(tmp_path / 'screen.ckpt')
+    calls.clear()
+    interrupt = True
+    with pytest.raises(_Interrupted):
+        screen_library(screen, targets, library, checkpoint_path=checkpoint, checkpoint_every=1, **options)
+    assert os.path.exists(checkpoint)
+
+    calls.clear()
+    interrupt = False
+    resumed = screen_library(screen, targets, library, checkpoint_path=checkpoint, checkpoint_every=1, **options)
+    assert resumed == expected
+    # Only the batches after the checkpoint are scored again
+    assert len(calls) == n_batches - 3
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from bindai.pdb_reader import read_atoms, write_pdb
+from bindai.structure_cache import StructureCache
+from bindai.voxelizer import synthetic_atoms
+
+
+# Synthetic protein atoms with unique names within each 8-atom residue
+def _protein_atoms(n_atoms, seed):
+    atoms = synthetic_atoms(n_atoms, seed=seed)
+    atoms['hetero'][:] = False
+    atoms['name'] = np.array([f"{element}{i % 8}" for i, element in enumerate(atoms['element'])])
+    return atoms
+
+
+@pytest.fixture
+def pdb_file(tmp_path):
+    return write_pdb(_protein_atoms(200, seed=1), str(tmp_path / 'test.pdb'))
+
+
+def test_atoms_and_structure_come_from_the_parsed_table(tmp_path, pdb_file, monkeypatch):
+    cache = StructureCache(str(tmp_path / 'cache'), offline=True)
+    cache.add_file('1abc', pdb_file)
+    atoms = cache.atoms('1abc')
+    np.testing.assert_allclose(atoms['coords'], read_atoms(pdb_file)['coords'])
+
+    # Later reads use the .npz: neither the raw file nor Bio.PDB's parser is touched
+    monkeypatch.setattr('bindai.structure_cache.read_atoms', lambda path: pytest.fail("re-parsed"))
+    monkeypatch.setattr('Bio.PDB.PDBParser.get_structure', lambda *args: pytest.fail("PDBParser used"))
+    structure = cache.structure('1abc')
+    coords = np.array([atom.coord for atom in structure.get_atoms()])
+    np.testing.assert_allclose(coords, atoms['coords'])
+
+
+def test_hits_do_not_rewrite_the_index(tmp_path, pdb_file):
+    cache = StructureCache(str(tmp_path / 'cache'), offline=True)
+    cache.add_file('1abc', pdb_file)
+    before = os.stat(cache.index_path).st_mtime_ns
+    for _ in range(5):
+        cache.path('1abc')
+    assert os.stat(cache.index_path).st_mtime_ns == before
+
+
+def test_parsed_tables_count_towards_max_bytes(tmp_path, pdb_file):
+    cache = StructureCache(str(tmp_path / 'cache'), offline=True)
+    cache.add_file('1abc', pdb_file)
+    cache.atoms('1abc')
+    one_entry = cache.size_bytes()
+
+    small = StructureCache(str(tmp_path / 'small'), max_bytes=int(one_entry * 1.5), offline=True)
+    other = str(tmp_path / 'other.pdb')
+    write_pdb(_protein_atoms(200, seed=2), other)
+    small.add_file('1abc', pdb_file)
+    small.atoms('1abc')
+    small.add_file('2xyz', other)
+    small.atoms('2xyz')
+    assert small.size_bytes() <= small.max_bytes
+    assert '1ABC' not in small and '2XYZ' in small
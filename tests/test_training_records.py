@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from bindai.fingerprint_store import packed_fingerprint, unpack_fingerprints
+from bindai.training_records import make_dataset, serialize_example, write_records
+
+GRID_SHAPE = (8, 8, 8, 2)
+N_BITS = 64
+
+
+def _examples(n, seed=0):
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        grid = (rng.random(GRID_SHAPE) < 0.05).astype(np.float32)
+        if i % 2:
+            # Non-binary grids keep their values (stored as float16)
+            grid *= rng.integers(1, 8, GRID_SHAPE).astype(np.float32) / 4
+        fingerprint = (rng.random(N_BITS) < 0.2).astype(np.uint8)
+        yield grid, fingerprint, float(i)
+
+
+def test_round_trip(tmp_path):
+    examples = list(_examples(10))
+    paths = write_records(examples, str(tmp_path), shard_size=4, n_bits=N_BITS)
+    assert len(paths) == 3
+
+    dataset = make_dataset(str(tmp_path / '*.tfrecord'), batch_size=3, shuffle_buffer=0,
+                           grid_shape=GRID_SHAPE, n_bits=N_BITS)
+    voxels, fingerprints, labels = [], [], []
+    for (voxel_batch, fingerprint_batch), label_batch in dataset:
+        voxels.append(voxel_batch.numpy())
+        fingerprints.append(fingerprint_batch.numpy())
+        labels.append(label_batch.numpy())
+    labels = np.concatenate(labels)
+
+    order = np.argsort(labels)
+    np.testing.assert_array_equal(labels[order], np.arange(10))
+    np.testing.assert_allclose(np.concatenate(voxels)[order], [grid for grid, _, _ in examples])
+    np.testing.assert_array_equal(np.concatenate(fingerprints)[order], [fp for _, fp, _ in examples])
+
+
+@pytest.mark.parametrize('n_bits', [1024, 4096])
+def test_packed_fingerprints_at_other_sizes(tmp_path, n_bits):
+    smiles = ['c1ccccc1O', 'CCO', 'CC(=O)Nc1ccc(O)cc1']
+    packed = [packed_fingerprint(s, n_bits=n_bits) for s in smiles]
+    grid = np.zeros(GRID_SHAPE, dtype=np.float32)
+    grid[1, 2, 3, 0] = 1
+    write_records([(grid, fp, float(i)) for i, fp in enumerate(packed)], str(tmp_path), n_bits=n_bits)
+
+    dataset = make_dataset(str(tmp_path / '*.tfrecord'), batch_size=3, shuffle_buffer=0,
+                           grid_shape=GRID_SHAPE, n_bits=n_bits)
+    (_, fingerprints), labels = next(iter(dataset))
+    order = np.argsort(labels.numpy())
+    np.testing.assert_array_equal(fingerprints.numpy()[order], unpack_fingerprints(np.stack(packed), n_bits))
+
+
+def test_rejects_fingerprint_of_wrong_size():
+    with pytest.raises(ValueError):
+        serialize_example(np.zeros(GRID_SHAPE, dtype=np.float32), np.zeros(512, dtype=np.uint8), 1.0, n_bits=1024)